@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Command Line.
+
+This module merges profiles without the GUI, ex: in CI jobs or scripts.
+
+Usage:
+    python ProfileMergerCLI.py merge <profile_a> <profile_b> -o <output> [--rules RULES]
+        [--strategy CATEGORY=STRATEGY ...] [--components PATH [--flag-dangling]]
+        [--replay LOG [--require-resolved]] [--merge-a-to-b] [--patch]
+    python ProfileMergerCLI.py prune <profile> --components PATH [-o OUTPUT]
+    python ProfileMergerCLI.py diff <profile_a> <profile_b> [--format jsonl|csv] [-o OUTPUT]
+    python ProfileMergerCLI.py diff --pairs <pairs_file> [--format jsonl|csv] [-o OUTPUT]
+    python ProfileMergerCLI.py transcode <source> -o <output> --to VERSION [--from VERSION]
+        [--jobs N]
+    python ProfileMergerCLI.py field-permissions <source_dir> <profile|directory> ...
+        [--readable] [--editable] [--jobs N]
+    python ProfileMergerCLI.py ip-ranges <profile> ... [--contains ADDRESS ...]
+
+The rules are applied first, then the entries that reference components missing from a
+package.xml or a source tree are left out (see component_index.py) and then the recorded
+resolutions are replayed (see rerere.py), so a decision made by hand wins over a bulk change.
+With --flag-dangling those entries are only listed. With --require-resolved the merge fails
+(exit code 2) if a conflict wasn't resolved by a rule or a recorded decision.
+
+Prune leaves out the entries of a single profile that reference missing components, without an
+output it only lists them and fails (exit code 2) if there are any.
+
+The diff is written as the records come (see profile_diff.DIFF_FIELDS), to stdout by default.
+A pairs file has a pair of profiles per line separated by a tab, '-' reads it from stdin; the
+records of each pair also have its 'a' and 'b' paths.
+
+Field-permissions adds the fieldPermissions entries of the fields of a source tree that the
+profiles are missing, without access unless --readable or --editable is given. The profiles are
+patched in place, see field_permissions.py.
+
+Ip-ranges prints the login IP ranges of profiles coalesced, with the ranges each one absorbed,
+and checks if addresses are allowed. With --strategy loginIpRanges=coalesce the merge writes the
+coalesced ranges and prints what they absorbed.
+
+Transcode converts a profile, or every profile of a directory, from an API version (by default
+models.DEFAULT_API_VERSION) to another one, see transcoder.py.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import argparse
+import os
+import sys
+import time
+from xml.etree import ElementTree
+
+import component_index as components
+import field_permissions
+import ip_ranges
+import merge_rules
+import models
+import profile_diff
+import profile_parser
+import merge_strategies
+import rerere
+import transcoder
+from session import MergeSession, FROM_A, FROM_B
+
+
+def merge(args) -> int:
+    """Merges two profiles, resolves the merged entries with a rules file and saves the result.
+    """
+    merge_session = MergeSession(args.merge_a_to_b)
+    for category_strategy in args.strategy:
+        category, _sep, strategy_name = category_strategy.partition('=')
+        merge_session.set_strategy(category, strategy_name)
+    merge_session.load_file(FROM_A, args.profile_a)
+    merge_session.load_file(FROM_B, args.profile_b)
+    merge_session.rebuild_merged()
+    print(f'Merged {len(merge_session.merged)} entries')
+    if merge_session.strategies.get('loginIpRanges') == merge_strategies.STRATEGY_COALESCE:
+        print_absorbed_ranges(
+            merge_session.a.properties.values(), merge_session.b.properties.values()
+        )
+
+    rule_set = None
+    if args.rules:
+        rule_set = merge_rules.load_rules(args.rules)
+        start_time = time.perf_counter()
+        changed_ids, counts = merge_session.apply_rules(rule_set)
+        elapsed = time.perf_counter() - start_time
+        matched = ', '.join(f'{action}: {count}' for action, count in counts.items())
+        print(f'Rules: {len(changed_ids)} entries changed ({matched}) in {elapsed:.3f}s')
+
+    if args.components:
+        component_index = components.load_components(args.components)
+        if args.flag_dangling:
+            merge_session.load_all()
+            dangling = component_index.dangling(merge_session.merged)
+            print_dangling(dangling)
+            print(f'{len(dangling)} entries reference missing components')
+        else:
+            changed_ids, dangling = merge_session.prune_dangling(component_index)
+            print(f'Pruned {len(changed_ids)} entries that reference missing components')
+
+    if args.replay:
+        decision_log = rerere.DecisionLog(args.replay)
+        changed_ids, replayed = merge_session.apply_decisions(decision_log)
+        print(f'Replayed {replayed} recorded decisions, {len(changed_ids)} entries changed')
+
+        if args.require_resolved:
+            merge_session.load_all()
+            unresolved = [
+                (category, model_id, toggle_name)
+                for category, model_id, toggle_name in decision_log.unresolved(
+                    merge_session.merged, merge_session.a.properties, merge_session.b.properties
+                )
+                if rule_set is None or rule_set.match(category, model_id) is None
+            ]
+            if unresolved:
+                for category, model_id, toggle_name in unresolved:
+                    print(f'Unresolved: {category} {model_id} {toggle_name}', file=sys.stderr)
+                print(f'{len(unresolved)} conflicts need a resolution', file=sys.stderr)
+                return 2
+
+    if args.patch:
+        added, removed, changed = merge_session.save_patch(args.output)
+        print(
+            f'Profile B patched: {len(added)} added, {len(removed)} removed, '
+            f'{len(changed)} changed'
+        )
+    else:
+        merge_session.save(args.output)
+    print(f'Saved {args.output}')
+    return 0
+
+
+def prune(args) -> int:
+    """Leaves out the entries of a profile that reference missing components, without an output
+    they are only listed.
+    """
+    component_index = components.load_components(args.components)
+    merge_session = MergeSession()
+    merge_session.load_file(FROM_A, args.profile)
+    merge_session.rebuild_merged()
+
+    if not args.output:
+        merge_session.load_all()
+        dangling = component_index.dangling(merge_session.merged)
+        print_dangling(dangling)
+        print(f'{len(dangling)} entries reference missing components')
+        return 2 if dangling else 0
+
+    changed_ids, dangling = merge_session.prune_dangling(component_index)
+    merge_session.save(args.output)
+    print(f'Pruned {len(changed_ids)} entries, saved {args.output}')
+    return 0
+
+
+def print_dangling(dangling: list):
+    for model, metadata_type, member in dangling:
+        print(
+            f'Dangling: {model.model_name} {model.model_id} ({metadata_type} {member})',
+            file=sys.stderr
+        )
+
+
+def print_absorbed_ranges(*properties) -> list:
+    """Prints the login IP ranges that absorbed others when coalesced.
+
+    Args:
+        *properties (iterable): Entries of the profiles.
+
+    Returns:
+        list: ip_ranges.IpRange of the coalesced ranges.
+    """
+    coalesced, invalid = ip_ranges.coalesce(
+        model for entries in properties for model in entries
+        if type(model) is models.ProfileLoginIpRanges
+    )
+    for ip_range in coalesced:
+        if len(ip_range.sources) > 1:
+            absorbed = ', '.join(model.model_id for model in ip_range.sources)
+            print(f'{ip_range.start_address} - {ip_range.end_address} absorbed: {absorbed}')
+    for model in invalid:
+        print(f'Invalid login IP range: {model.model_id}', file=sys.stderr)
+    return coalesced
+
+
+def check_ip_ranges(args) -> int:
+    """Prints the coalesced login IP ranges of profiles and checks addresses against them.
+    """
+    properties = [profile_parser.parse_profile(profile)[1].values() for profile in args.profiles]
+    coalesced = print_absorbed_ranges(*properties)
+    print(f'{len(coalesced)} login IP ranges')
+
+    range_set = ip_ranges.RangeSet(
+        model for entries in properties for model in entries
+        if type(model) is models.ProfileLoginIpRanges
+    )
+    allowed = True
+    for address in args.contains:
+        ip_range = range_set.find(address)
+        if ip_range is None:
+            allowed = False
+            print(f'{address}: not allowed')
+        else:
+            print(f'{address}: allowed by {ip_range.start_address} - {ip_range.end_address}')
+    return 0 if allowed else 2
+
+
+def read_pairs(pairs_file):
+    """Yields the (profile_a, profile_b) pairs of the lines of a pairs file.
+    """
+    for line in pairs_file:
+        line = line.rstrip('\r\n')
+        if not line.strip() or line.startswith('#'):
+            continue
+        parts = line.split('\t') if '\t' in line else line.split()
+        if len(parts) != 2:
+            raise ValueError(f'Expected two profiles separated by a tab: "{line}"')
+        yield parts[0], parts[1]
+
+
+def diff(args) -> int:
+    """Streams the diff records of one or many pairs of profiles.
+    """
+    output = sys.stdout
+    if args.output:
+        output = open(args.output, 'w', encoding='utf-8', newline='')
+
+    try:
+        writer = profile_diff.DiffWriter(output, args.format, pairs=bool(args.pairs))
+        if args.pairs:
+            pairs_file = sys.stdin if args.pairs == '-' else open(args.pairs, 'r', encoding='utf-8')
+            with pairs_file:
+                for profile_a, profile_b in read_pairs(pairs_file):
+                    for record in profile_diff.stream_diff(profile_a, profile_b):
+                        writer.write({'a': profile_a, 'b': profile_b, **record})
+        else:
+            writer.write_all(profile_diff.stream_diff(args.profile_a, args.profile_b))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f'{writer.written} differences', file=sys.stderr)
+    return 0
+
+
+def transcode(args) -> int:
+    """Converts a profile or a directory of profiles to another API version.
+    """
+    if os.path.isdir(args.source):
+        results = transcoder.transcode_directory(
+            args.source, args.output, args.to_version, args.from_version, args.jobs
+        )
+    else:
+        results = [(args.source, transcoder.transcode_profile(
+            args.source, args.output, args.to_version, args.from_version
+        ))]
+
+    for source_filepath, dropped in results:
+        summary = ', '.join(f'{category}: {count}' for category, count in sorted(dropped.items()))
+        print(f'{source_filepath}' + (f' (dropped {summary})' if summary else ''))
+    print(f'Converted {len(results)} profiles from API {args.from_version} to {args.to_version}')
+    return 0
+
+
+def add_field_permissions(args) -> int:
+    """Adds the missing fieldPermissions entries of the fields of a source tree to profiles.
+    """
+    profile_filepaths = []
+    for path in args.profiles:
+        if os.path.isdir(path):
+            profile_filepaths.extend(
+                os.path.join(path, relative_path)
+                for relative_path in transcoder.find_profiles(path)
+            )
+        else:
+            profile_filepaths.append(path)
+
+    start_time = time.perf_counter()
+    fields, skipped = field_permissions.scan_fields(args.source_dir, args.jobs)
+    elapsed = time.perf_counter() - start_time
+    print(f'Found {len(fields)} fields ({skipped} skipped) in {elapsed:.3f}s')
+
+    results = field_permissions.add_to_profiles(
+        profile_filepaths, fields, args.readable, args.editable, args.jobs
+    )
+    for profile_filepath, added in results:
+        print(f'{profile_filepath}: {len(added)} fields added')
+    return 0
+
+
+def api_version(text: str) -> int:
+    """Reads an API version argument, ex: '45' or '45.0'.
+    """
+    return int(float(text))
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description='SF Profile Merger - Command Line')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    cmd_merge = commands.add_parser('merge', help='Merge two profiles into a new file')
+    cmd_merge.add_argument('profile_a')
+    cmd_merge.add_argument('profile_b')
+    cmd_merge.add_argument('-o', '--output', required=True)
+    cmd_merge.add_argument('--rules', default=None, help='Rules file, see merge_rules.py')
+    cmd_merge.add_argument(
+        '--strategy', action='append', default=[], metavar='CATEGORY=STRATEGY',
+        help=f'Merge strategy of a category: {", ".join(merge_strategies.strategies_by_name)}'
+    )
+    cmd_merge.add_argument(
+        '--components', default=None,
+        help='package.xml or source directory, entries of missing components are left out'
+    )
+    cmd_merge.add_argument(
+        '--flag-dangling', action='store_true',
+        help='Only list the entries of missing components, needs --components'
+    )
+    cmd_merge.add_argument(
+        '--replay', default=None, help='Log of recorded resolutions to replay, see rerere.py'
+    )
+    cmd_merge.add_argument(
+        '--require-resolved', action='store_true',
+        help='Fail if a conflict has no rule or recorded resolution, needs --replay'
+    )
+    cmd_merge.add_argument(
+        '--merge-a-to-b', action='store_true', help='Values from A take preference'
+    )
+    cmd_merge.add_argument(
+        '--patch', action='store_true', help='Patch the file of B with the changed entries'
+    )
+
+    cmd_prune = commands.add_parser(
+        'prune', help='Leave out the entries of a profile that reference missing components'
+    )
+    cmd_prune.add_argument('profile')
+    cmd_prune.add_argument(
+        '--components', required=True, help='package.xml or source directory of the branch'
+    )
+    cmd_prune.add_argument('-o', '--output', default=None, help='Without it, only list them')
+
+    cmd_diff = commands.add_parser('diff', help='Write the differences between profiles')
+    cmd_diff.add_argument('profile_a', nargs='?')
+    cmd_diff.add_argument('profile_b', nargs='?')
+    cmd_diff.add_argument('--pairs', default=None, help="File with a pair per line, '-' for stdin")
+    cmd_diff.add_argument('--format', choices=profile_diff.DiffWriter.FORMATS, default='jsonl')
+    cmd_diff.add_argument('-o', '--output', default=None)
+
+    cmd_transcode = commands.add_parser(
+        'transcode', help='Convert profiles to another API version'
+    )
+    cmd_transcode.add_argument('source', help='Profile file or directory of profiles')
+    cmd_transcode.add_argument(
+        '-o', '--output', required=True, help='Output file, or directory for a directory'
+    )
+    cmd_transcode.add_argument('--to', dest='to_version', type=api_version, required=True)
+    cmd_transcode.add_argument(
+        '--from', dest='from_version', type=api_version, default=models.DEFAULT_API_VERSION
+    )
+    cmd_transcode.add_argument(
+        '--jobs', type=int, default=None, help='Processes for a directory, one per CPU by default'
+    )
+
+    cmd_fields = commands.add_parser(
+        'field-permissions', help='Add the fieldPermissions of new fields to profiles'
+    )
+    cmd_fields.add_argument('source_dir', help='Source tree with objects/*/fields/')
+    cmd_fields.add_argument('profiles', nargs='+', help='Profile files or directories')
+    cmd_fields.add_argument('--readable', action='store_true', help='New fields are readable')
+    cmd_fields.add_argument(
+        '--editable', action='store_true', help='New fields are editable (and readable)'
+    )
+    cmd_fields.add_argument(
+        '--jobs', type=int, default=None, help='Processes to use, one per CPU by default'
+    )
+
+    cmd_ip_ranges = commands.add_parser(
+        'ip-ranges', help='Coalesce the login IP ranges of profiles and check addresses'
+    )
+    cmd_ip_ranges.add_argument('profiles', nargs='+')
+    cmd_ip_ranges.add_argument(
+        '--contains', action='append', default=[], metavar='ADDRESS',
+        help='Check if an address is allowed, fails (exit code 2) if one is not'
+    )
+
+    args = arg_parser.parse_args(argv)
+    if args.command == 'diff' and not args.pairs and not (args.profile_a and args.profile_b):
+        arg_parser.error('diff needs two profiles or --pairs')
+    if args.command == 'merge' and args.require_resolved and not args.replay:
+        arg_parser.error('--require-resolved needs --replay')
+    if args.command == 'merge' and args.flag_dangling and not args.components:
+        arg_parser.error('--flag-dangling needs --components')
+
+    try:
+        if args.command == 'merge':
+            return merge(args)
+        if args.command == 'prune':
+            return prune(args)
+        if args.command == 'diff':
+            return diff(args)
+        if args.command == 'transcode':
+            return transcode(args)
+        if args.command == 'field-permissions':
+            return add_field_permissions(args)
+        if args.command == 'ip-ranges':
+            return check_ip_ranges(args)
+    except (OSError, ValueError, ElementTree.ParseError) as error:
+        print(f'Error: {error}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,180 +9,298 @@ Copyright: Patricio Labin Correa - 2019
 """
 
 # std
+import collections
+import multiprocessing
+import os
+import pickle
 import sys
-import re
+import time
 from xml.etree import ElementTree
-from xml.dom import minidom
 # from pprint import pprint
 
 # qt
-from PySide2.QtCore import Qt, QThread, Signal
+from PySide2.QtCore import Qt, QObject, QThread, QTimer, Signal
 from PySide2.QtWidgets import QMainWindow, QApplication, QLineEdit, QFileDialog, QMessageBox
-from PySide2.QtWidgets import QTreeWidget, QTreeWidgetItem
-from PySide2.QtGui import QIcon, QPixmap
+from PySide2.QtWidgets import QTreeWidget, QTreeWidgetItem, QAction, QProgressBar
+from PySide2.QtWidgets import QAbstractItemView, QMenu
+from PySide2.QtGui import QIcon, QPixmap, QKeySequence
 import qdarkstyle
 
 # mine
-from ui import Ui_MainWindow, UiProfileItem
+from ui import Ui_MainWindow, UiProfileItem, UiGroupItem, ItemRegistry, ProfileItemDelegate
+import merge_rules
+import merge_strategies
 import models
+import profile_diff
+import profile_index
+import profile_parser
+import rerere
+import undo
 import utils
+from session import MergeSession, FROM_A, FROM_B, FROM_MERGED, source_stat
+from watcher import ProfileWatcher
+import workspace
 
+# Profiles bigger than this are parsed in a child process
+PROCESS_SCAN_MIN_BYTES = 4 * 1024 * 1024
 
-class GlobalEstate:
-    """Program Global Estate
+# Profiles bigger than this are indexed and their big categories are parsed on demand
+LAZY_LOAD_MIN_BYTES = 1024 * 1024
 
-    Attributes:
-        A_MERGED (bool): Is the A profile merged?
-        B_MERGED (bool): Is the B profile merged?
-        FROM_A (str): Is from A
-        FROM_B (str): Is from B
-        FROM_MERGED (str): Is from merged
-        MERGE_A_TO_B (bool): Values from A take preference while merging.
-    """
-    A_MERGED = False
-    B_MERGED = False
-
-    FROM_A = 'A'
-    FROM_B = 'B'
-    FROM_MERGED = 'AB'
-
-    MERGE_A_TO_B = False
-
-    categories_items_a = None
-    categories_items_b = None
-    categories_items_merged = None
-
-    class A:
-        NAMESPACE = None
-        PROPERTIES = {}
-
-    class B:
-        NAMESPACE = None
-        PROPERTIES = {}
-
-    class Merged:
-        NAMESPACE = None
-        PROPERTIES = {}
-
-    class Items:
-        a = []
-        b = []
-        merged = {}
+# Seconds of GUI thread time that each chunk of the tree population can take
+POPULATE_SLICE = 0.012
 
 
 class ProfileScanner(QThread):
-    """QThread to process profile, create the models and add the items to the interface.
+    """QThread to parse a profile file and create the models.
+
+    A scanner only holds its result, ScanScheduler hands it to the session.
 
     Attributes:
         profile_filepath (str): Path to the profile file
         from_profile (str): Internal profile name to fill
+        incremental (bool): Apply only the changed entries instead of merging again.
+        cancelled (bool): The scan was superseded and its result must be dropped.
+        namespace (str): Namespace of the parsed profile.
+        properties (dict): Parsed models keyed by model_id.
+        error (str): Parse error message, None if the scan succeeded.
+        process (Process): Child process parsing a big profile, if any.
+        index (ProfileIndex): Index of a big profile, its big categories are left unparsed.
+        stat (tuple): session.source_stat of the file taken before it was parsed.
 
     [QT] Signals:
-        addItems (bool): Signal to start adding items
+        scanProgress (str, int, int, dict): from_profile, bytes consumed, total bytes and the
+            entries parsed by category. Throttled by profile_parser.PROGRESS_INTERVAL.
+        scanFinished (ProfileScanner): Emitted with the scanner when the run ends.
     """
-    addItems = Signal(bool)
+    scanProgress = Signal(str, int, int, dict)
+    scanFinished = Signal(object)
 
-    def __init__(self, *args):
+    def __init__(self, profile_filepath: str, from_profile: str, incremental=False, *args):
         super().__init__(*args)
-        self.profile_filepath = ''
-        self.from_profile = ''
-
-    def reset_tables(self):
-        if (GlobalEstate.A_MERGED or GlobalEstate.B_MERGED):
-            properties_rescan = {}
-
-            if (len(GlobalEstate.A.PROPERTIES) > 0
-                    and self.from_profile == GlobalEstate.FROM_A):
-                GlobalEstate.A.PROPERTIES = {}
-                GlobalEstate.A_MERGED = False
-                properties_rescan = GlobalEstate.B.PROPERTIES
-            else:
-                GlobalEstate.B.PROPERTIES = {}
-                GlobalEstate.B_MERGED = False
-                properties_rescan = GlobalEstate.A.PROPERTIES
+        self.profile_filepath = profile_filepath
+        self.from_profile = from_profile
+        self.incremental = incremental
+        self.cancelled = False
+        self.namespace = None
+        self.properties = {}
+        self.error = None
+        self.process = None
+        self.index = None
+        self.stat = None
+        self.cancel_event = multiprocessing.Event()
+
+    def cancel(self):
+        """Asks the scan to stop, it's checked between the profile elements.
+        """
+        self.cancelled = True
+        self.cancel_event.set()
+
+    def is_cancelled(self) -> bool:
+        return self.cancelled
 
-            GlobalEstate.Merged.PROPERTIES = {}
-            for key, value in properties_rescan.items():
-                GlobalEstate.Merged.PROPERTIES[key] = value
+    def report_progress(self, bytes_read: int, total_bytes: int, counts: dict):
+        self.scanProgress.emit(self.from_profile, bytes_read, total_bytes, counts)
 
     def run(self):
         """
             Overloaded, is run by calling its start() function
         """
-        ##
-        # Reset tables
-        self.reset_tables()
-
-        # Loop through profile XML
-        tree = ElementTree.parse(self.profile_filepath)
-        tree_root = tree.getroot()
-
-        # This regex is for removing the namespace prefix of the tag
-        namespace_pattern = '^{.*}'
-        namespace_regex = re.compile(namespace_pattern)
-
-        tag = ''
-        # Create ProfileItems with the profile
-        for prof_field_element in tree_root:
-            namespace = namespace_regex.match(prof_field_element.tag).group()
-
-            namespace_value = namespace.replace('{', '')
-            namespace_value = namespace_value.replace('}', '')
-
-            if self.from_profile == GlobalEstate.FROM_A and not GlobalEstate.A.NAMESPACE:
-                GlobalEstate.A.NAMESPACE = namespace_value
-            if self.from_profile == GlobalEstate.FROM_B and not GlobalEstate.B.NAMESPACE:
-                GlobalEstate.B.NAMESPACE = namespace_value
-
-            field_type_name = prof_field_element.tag.replace(namespace, '')
-
-            # TODO: create exception and handle if not found
-            model_class = models.classes_by_modelName.get(field_type_name)
-
-            if model_class:
-                # Read metadata from xml
-                fields = {}
-                for field_child in prof_field_element:
-                    tag = field_child.tag.replace(namespace, '')
-                    fields[tag] = field_child.text
-
-                profile_field = None
-                if model_class is models.ProfileSingleValue:
-                    if field_type_name == 'custom':
-                        profile_field = model_class(
-                            field_type_name, prof_field_element.text, is_boolean=True
-                        )
-                    else:
-                        profile_field = model_class(field_type_name, prof_field_element.text)
-                else:
-                    # transfer to model
-                    profile_field = model_class()
-                    profile_field.fields = fields
+        try:
+            self.stat = source_stat(self.profile_filepath)
+            file_size = os.path.getsize(self.profile_filepath)
+            if not self.incremental and file_size >= LAZY_LOAD_MIN_BYTES:
+                self.scan_indexed(file_size)
+            elif file_size < PROCESS_SCAN_MIN_BYTES:
+                self.namespace, self.properties = profile_parser.parse_profile(
+                    self.profile_filepath, self.report_progress, self.is_cancelled
+                )
+            else:
+                self.scan_in_process()
+        except profile_parser.ScanCancelled:
+            self.cancelled = True
+        except (ElementTree.ParseError, OSError) as error:
+            self.error = str(error)
 
-                _id = profile_field.model_id
+        self.scanFinished.emit(self)
 
-                if self.from_profile == GlobalEstate.FROM_A:
-                    GlobalEstate.A.PROPERTIES[_id] = profile_field
-                if self.from_profile == GlobalEstate.FROM_B:
-                    GlobalEstate.B.PROPERTIES[_id] = profile_field
+    def scan_indexed(self, file_size: int):
+        """Indexes the profile and only parses its small categories, the rest are parsed when
+        they are needed (see MergeSession.load_categories).
+        """
+        self.index = profile_index.ProfileIndex(self.profile_filepath)
+        if self.cancelled:
+            raise profile_parser.ScanCancelled(self.profile_filepath)
+
+        def report_parsed(bytes_parsed: int, bytes_to_parse: int, counts: dict):
+            # The bar covers the file, the categories left unparsed are skipped over
+            bytes_read = bytes_parsed * file_size // (bytes_to_parse or 1)
+            self.report_progress(bytes_read, file_size, counts)
+
+        self.namespace = self.index.namespace
+        self.properties = self.index.parse_categories(
+            self.index.small_categories(), report_parsed, self.is_cancelled
+        )
+
+        counts = {category: self.index.count(category) for category in self.index.categories}
+        self.report_progress(file_size, file_size, counts)
+
+    def scan_in_process(self):
+        """Parses the profile in a child process, threads can't parse in parallel because of
+        the GIL, so two big profiles would take the sum of their times.
+        """
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=profile_parser.scan_process,
+            args=(self.profile_filepath, sender, self.cancel_event),
+            daemon=True
+        )
+        self.process.start()
+        sender.close()
 
-        # Fill merged properties dict
-        properties_dicts = None
-        if GlobalEstate.MERGE_A_TO_B:
-            properties_dicts = [GlobalEstate.B.PROPERTIES, GlobalEstate.A.PROPERTIES]
+        try:
+            message = receiver.recv()
+            while message[0] == 'progress':
+                self.report_progress(*message[1:])
+                message = receiver.recv()
+        except EOFError:
+            message = ('error', 'The scanner process ended unexpectedly')
+        finally:
+            receiver.close()
+            self.process.join()
+
+        if message[0] == 'done':
+            _status, self.namespace, properties = message
+            # Strings unpickled from the child are not shared with the other loaded profiles
+            self.properties = {
+                model.model_id: profile_parser.intern_model(model)
+                for model in properties.values()
+            }
+        elif message[0] == 'cancelled':
+            self.cancelled = True
         else:
-            properties_dicts = [GlobalEstate.A.PROPERTIES, GlobalEstate.B.PROPERTIES]
+            self.error = message[1]
 
-        for properties in properties_dicts:
-            for _id, profile_field in properties.items():
-                GlobalEstate.Merged.PROPERTIES[_id] = profile_field
 
-        # GlobalEstate.Merged.PROPERTIES[_id] = profile_field
+class ScanScheduler(QObject):
+    """Runs one ProfileScanner per input concurrently and merges the session once, when all the
+    scheduled inputs are ready.
 
-        GlobalEstate.A_MERGED = len(GlobalEstate.A.PROPERTIES) > 0
-        GlobalEstate.B_MERGED = len(GlobalEstate.B.PROPERTIES) > 0
+    Scheduling an input that is still scanning cancels the superseded scanner, its result is
+    dropped when it ends. Incremental scans (watch mode reloads) don't hold back the merge.
 
-        self.addItems.emit(True)
+    Args:
+        merge_session (MergeSession): Session that receives the parsed profiles.
+
+    Attributes:
+        workers (dict): Current ProfileScanner by from_profile.
+        retired (set): Superseded scanners that are still running.
+        merge_pending (bool): A full scan was handed to the session and it wasn't merged yet.
+
+    [QT] Signals:
+        scanProgress (str, int, int, dict): Progress of a current scanner.
+        merged (bool): The session was merged again, items can be added.
+        changesApplied (str, list, list, list): from_profile and the added, removed and changed
+            model_ids of an incremental scan.
+        scanFailed (str, str, bool): from_profile, the error message and if the scan was
+            incremental.
+    """
+    scanProgress = Signal(str, int, int, dict)
+    merged = Signal(bool)
+    changesApplied = Signal(str, list, list, list)
+    scanFailed = Signal(str, str, bool)
+
+    def __init__(self, merge_session: MergeSession, *args):
+        super().__init__(*args)
+        self.session = merge_session
+        self.workers = {}
+        self.retired = set()
+        self.merge_pending = False
+
+    @property
+    def busy(self) -> bool:
+        return len(self.workers) > 0
+
+    @property
+    def loading(self) -> bool:
+        """There are full scans running, the session is merged when the last one ends.
+        """
+        return any(not worker.incremental for worker in self.workers.values())
+
+    def schedule(self, from_profile: str, file_path: str, incremental=False):
+        """Starts scanning a profile file, superseding any scan of the same input.
+
+        Args:
+            from_profile (str): What profile is being loaded.
+            file_path (str): Path to the profile file.
+            incremental (bool): Only apply the entries that changed against the loaded input.
+        """
+        self.retire(from_profile)
+
+        worker = ProfileScanner(file_path, from_profile, incremental)
+        worker.scanProgress.connect(self.scan_progress)
+        worker.scanFinished.connect(self.scan_finished)
+        self.workers[from_profile] = worker
+        worker.start()
+
+    def retire(self, from_profile: str):
+        """Stops tracking the scan of an input, if any, its result is dropped when it ends.
+        """
+        worker = self.workers.pop(from_profile, None)
+        if worker:
+            worker.cancel()
+            self.retired.add(worker)
+
+    def cancel(self, from_profile: str):
+        """Cancels the scan of an input, if any. The inputs that were ready are merged if it was
+        the last full scan.
+        """
+        self.retire(from_profile)
+        self.merge_if_ready()
+
+    def cancel_all(self):
+        for from_profile in list(self.workers.keys()):
+            self.retire(from_profile)
+        self.merge_if_ready()
+
+    def merge_if_ready(self):
+        """Merges the session once the full scans handed to it have no other full scan left.
+        """
+        if self.merge_pending and not self.loading:
+            self.merge_pending = False
+            self.session.rebuild_merged()
+            self.merged.emit(True)
+
+    def scan_progress(self, from_profile: str, bytes_read: int, total_bytes: int, counts: dict):
+        # Progress of superseded scanners is not forwarded
+        if self.sender() is self.workers.get(from_profile):
+            self.scanProgress.emit(from_profile, bytes_read, total_bytes, counts)
+
+    def scan_finished(self, worker: ProfileScanner):
+        """Hands the result of a scanner to the session, runs in the thread of the scheduler.
+        """
+        worker.wait()
+        if worker in self.retired or self.workers.get(worker.from_profile) is not worker:
+            self.retired.discard(worker)
+            return
+        del self.workers[worker.from_profile]
+
+        if worker.error is not None:
+            self.scanFailed.emit(worker.from_profile, worker.error, worker.incremental)
+        elif worker.incremental:
+            added, removed, changed = self.session.apply_changes(
+                worker.from_profile, worker.properties, worker.stat
+            )
+            self.changesApplied.emit(worker.from_profile, added, removed, changed)
+        else:
+            self.session.set_input(
+                worker.from_profile, worker.profile_filepath, worker.namespace, worker.properties,
+                worker.index, worker.stat
+            )
+            self.merge_pending = True
+
+        # Merge only once, when the last scheduled input is ready
+        self.merge_if_ready()
 
 
 class ProfileMergerUI(QMainWindow):
@@ -190,8 +308,24 @@ class ProfileMergerUI(QMainWindow):
 
     Attributes:
         ui (MainWindow): class that has all the Qt ui components and the layout.
-        tree_target: target QTreeWidget to fill with items after an addItems signal from
-            Profile Scanner.
+        session (MergeSession): Merge shown in the window.
+        tree_target: target QTreeWidget to fill with items after a merged signal from
+            ScanScheduler.
+        categories_items_a (dict): Category items of the A QTree by model_name.
+        categories_items_b (dict): Category items of the B QTree by model_name.
+        categories_items_merged (dict): Category items of the merged QTree by model_name.
+        item_registry (ItemRegistry): UiProfileItems of the three QTrees by session, tree and
+            model_id.
+        populate_queue (deque): (model_name, deque of model_ids) entries waiting to be added
+            to the QTrees.
+        populate_source (tuple): (merged, A properties, B properties) being added.
+        populate_timer (QTimer): Zero interval timer that drives populate_chunk.
+        groups_items (dict): (model_name, group name) -> (A, B, merged) UiGroupItems of the
+            categories shown by object, ex: fieldPermissions.
+        lazy_categories (set): Categories shown without items, they are loaded when expanded.
+        decision_log (DecisionLog): Log where the resolutions are recorded and replayed from,
+            None if recording is off.
+        undo_stack (UndoStack): Undo/redo history of the changes made to the merged entries.
     """
     def __init__(self):
         super().__init__()
@@ -199,7 +333,19 @@ class ProfileMergerUI(QMainWindow):
         ##
         # Class Attributes
         self.ui = Ui_MainWindow()
+        self.session = MergeSession()
         self.tree_target = None
+        self.categories_items_a = {}
+        self.categories_items_b = {}
+        self.categories_items_merged = {}
+        self.item_registry = ItemRegistry()
+        self.populate_queue = collections.deque()
+        self.populate_source = None
+        self.populate_timer = QTimer(self)
+        self.groups_items = {}
+        self.lazy_categories = set()
+        self.decision_log = None
+        self.undo_stack = undo.UndoStack()
         self.main_stylesheet = None
         self.icon_a_to_b = QIcon()
         self.icon_b_to_a = QIcon()
@@ -229,11 +375,16 @@ class ProfileMergerUI(QMainWindow):
         self.change_merge_direction()
         ##
 
+        # Tree population
+        self.populate_timer.setInterval(0)
+        self.populate_timer.timeout.connect(self.populate_chunk)
+
         # Setup Tree Widgets
         all_tree_widgets = [self.ui.tree_a, self.ui.tree_b, self.ui.tree_merged]
         for tree in all_tree_widgets:
             tree.clear()
             tree.headerItem().setTextAlignment(0, Qt.AlignHCenter | Qt.AlignVCenter)
+            tree.setItemDelegate(ProfileItemDelegate(tree))
             tree.itemExpanded.connect(self.handle_expand)
             tree.itemCollapsed.connect(self.handle_expand)
             tree.verticalScrollBar().valueChanged.connect(self.sync_scroll)
@@ -241,62 +392,169 @@ class ProfileMergerUI(QMainWindow):
         self.ui.tree_a.itemClicked.connect(self.item_clicked)
         self.ui.tree_b.itemClicked.connect(self.item_clicked)
         self.ui.tree_merged.itemClicked.connect(self.merged_item_clicked)
+        self.ui.tree_merged.itemToggled.connect(self.merged_item_toggled)
+
+        # The merge strategy of a category is picked from the context menu of the merged QTree
+        self.ui.tree_merged.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.ui.tree_merged.customContextMenuRequested.connect(self.show_strategy_menu)
+
+        # Ranges of the A and B QTrees are applied together with apply_selected
+        self.ui.tree_a.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.ui.tree_b.setSelectionMode(QAbstractItemView.ExtendedSelection)
 
         # Connect Buttons
         self.ui.btn_a.clicked.connect(
             lambda: self.load_profile_file(
-                self.ui.le_a, GlobalEstate.FROM_A, self.ui.tree_a
+                self.ui.le_a, FROM_A, self.ui.tree_a
             )
         )
         self.ui.btn_b.clicked.connect(
             lambda: self.load_profile_file(
-                self.ui.le_b, GlobalEstate.FROM_B, self.ui.tree_b
+                self.ui.le_b, FROM_B, self.ui.tree_b
             )
         )
         self.ui.btn_start.clicked.connect(self.save_merged_profile)
         self.ui.btn_expandAll.clicked.connect(
-            lambda: ProfileMergerUI.expand_all_categories(True)
+            lambda: self.expand_all_categories(True)
         )
         self.ui.btn_collapseAll.clicked.connect(
-            lambda: ProfileMergerUI.expand_all_categories(False)
+            lambda: self.expand_all_categories(False)
         )
         self.ui.btn_merge_dir.clicked.connect(self.change_merge_direction)
 
         # Connect Actions
         self.ui.actionExpand_All.triggered.connect(
-            lambda: ProfileMergerUI.expand_all_categories(True)
+            lambda: self.expand_all_categories(True)
         )
         self.ui.actionCollapse_All.triggered.connect(
-            lambda: ProfileMergerUI.expand_all_categories(False)
+            lambda: self.expand_all_categories(False)
         )
         self.ui.actionMerge.triggered.connect(self.save_merged_profile)
         self.ui.actionOpenProfileA.triggered.connect(
             lambda: self.load_profile_file(
-                self.ui.le_a, GlobalEstate.FROM_A, self.ui.tree_a
+                self.ui.le_a, FROM_A, self.ui.tree_a
                 )
         )
         self.ui.actionOpenProfileB.triggered.connect(
             lambda: self.load_profile_file(
-                self.ui.le_b, GlobalEstate.FROM_B, self.ui.tree_b
+                self.ui.le_b, FROM_B, self.ui.tree_b
             )
         )
         self.ui.btn_applyA.clicked.connect(
-            lambda: self.apply_all_values(GlobalEstate.FROM_A)
+            lambda: self.apply_all_values(FROM_A)
         )
         self.ui.btn_applyB.clicked.connect(
-            lambda: self.apply_all_values(GlobalEstate.FROM_B)
+            lambda: self.apply_all_values(FROM_B)
         )
         self.ui.btn_close_a.clicked.connect(
-            lambda: self.close_profile(GlobalEstate.FROM_A)
+            lambda: self.close_profile(FROM_A)
         )
         self.ui.btn_close_b.clicked.connect(
-            lambda: self.close_profile(GlobalEstate.FROM_B)
+            lambda: self.close_profile(FROM_B)
         )
         ##
 
-        # Worker Instance
-        self.scanner_worker = ProfileScanner()
-        self.scanner_worker.addItems.connect(self.add_items)
+        # Workers
+        self.scan_scheduler = ScanScheduler(self.session, self)
+        self.scan_scheduler.merged.connect(self.profiles_merged)
+        self.scan_scheduler.changesApplied.connect(self.apply_profile_changes)
+        self.scan_scheduler.scanFailed.connect(self.scan_failed)
+        self.scan_scheduler.scanProgress.connect(self.show_scan_progress)
+
+        # Scan Progress
+        self.scans_progress = {}
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setMaximumWidth(240)
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setVisible(False)
+        self.ui.statusbar.addPermanentWidget(self.progress_bar)
+
+        self.action_cancel_scan = QAction('Cancel Loading', self)
+        self.action_cancel_scan.setShortcut(QKeySequence(Qt.Key_Escape))
+        self.action_cancel_scan.setStatusTip('Stop loading the profiles that are being scanned')
+        self.action_cancel_scan.triggered.connect(self.cancel_scans)
+        self.ui.menuFile.insertAction(self.ui.actionMerge, self.action_cancel_scan)
+
+        # Save Mode
+        self.action_save_patch = QAction('Save Changes Only', self)
+        self.action_save_patch.setCheckable(True)
+        self.action_save_patch.setStatusTip(
+            'Save by patching the file of profile B, untouched entries keep their bytes'
+        )
+        self.ui.menuFile.insertAction(self.ui.actionMerge, self.action_save_patch)
+
+        # Workspace
+        self.action_open_workspace = QAction('Open Session...', self)
+        self.action_open_workspace.setStatusTip('Continue a merge saved with Save Session')
+        self.action_open_workspace.triggered.connect(self.open_workspace)
+        self.ui.menuFile.insertAction(self.ui.actionMerge, self.action_open_workspace)
+
+        self.action_save_workspace = QAction('Save Session...', self)
+        self.action_save_workspace.setShortcut(QKeySequence(Qt.CTRL + Qt.SHIFT + Qt.Key_S))
+        self.action_save_workspace.setStatusTip(
+            'Save the loaded profiles and the merge with its changes to continue it later'
+        )
+        self.action_save_workspace.triggered.connect(self.save_workspace)
+        self.ui.menuFile.insertAction(self.ui.actionMerge, self.action_save_workspace)
+
+        # Diff Export
+        self.action_export_diff = QAction('Export Diff...', self)
+        self.action_export_diff.setStatusTip(
+            'Write the differences between A and B as JSON lines or CSV'
+        )
+        self.action_export_diff.triggered.connect(self.export_diff)
+        self.ui.menuFile.insertAction(self.ui.actionMerge, self.action_export_diff)
+
+        # Watch Mode
+        self.profile_watcher = ProfileWatcher(self)
+        self.profile_watcher.profileChanged.connect(self.reload_profile)
+
+        self.action_watch = QAction('Watch Profiles', self)
+        self.action_watch.setCheckable(True)
+        self.action_watch.setStatusTip('Re-merge the profiles when their files change on disk')
+        self.action_watch.toggled.connect(self.set_watch_mode)
+        self.ui.menuFile.insertAction(self.ui.actionMerge, self.action_watch)
+
+        # Undo/Redo
+        self.action_undo = QAction('Undo', self)
+        self.action_undo.setShortcut(QKeySequence.Undo)
+        self.action_undo.setStatusTip('Undo the last change to the merged profile')
+        self.action_undo.triggered.connect(self.undo_step)
+        self.ui.menuEdit.addAction(self.action_undo)
+
+        self.action_redo = QAction('Redo', self)
+        self.action_redo.setShortcut(QKeySequence.Redo)
+        self.action_redo.setStatusTip('Redo the last undone change to the merged profile')
+        self.action_redo.triggered.connect(self.redo_step)
+        self.ui.menuEdit.addAction(self.action_redo)
+        self.ui.menuEdit.addSeparator()
+        self.update_undo_actions()
+
+        # Bulk Apply
+        self.action_apply_selected = QAction('Apply Selected', self)
+        self.action_apply_selected.setShortcut(QKeySequence(Qt.CTRL + Qt.Key_Return))
+        self.action_apply_selected.setStatusTip(
+            'Apply the values selected in A and B (Ctrl/Shift + Click) to the merged profile'
+        )
+        self.action_apply_selected.triggered.connect(self.apply_selected)
+        self.ui.menuEdit.addAction(self.action_apply_selected)
+
+        # Rules
+        self.action_apply_rules = QAction('Apply Rules...', self)
+        self.action_apply_rules.setStatusTip(
+            'Resolve the merged entries with a rules file, see merge_rules.py'
+        )
+        self.action_apply_rules.triggered.connect(self.apply_rules_file)
+        self.ui.menuEdit.addAction(self.action_apply_rules)
+
+        # Recorded Resolutions
+        self.action_record_resolutions = QAction('Record Resolutions...', self)
+        self.action_record_resolutions.setCheckable(True)
+        self.action_record_resolutions.setStatusTip(
+            'Record the resolutions to a log and replay them when the same conflicts show up'
+        )
+        self.action_record_resolutions.toggled.connect(self.set_decision_log)
+        self.ui.menuEdit.addAction(self.action_record_resolutions)
 
         # TODO
         self.ui.btn_applyA.setEnabled(False)
@@ -305,7 +563,8 @@ class ProfileMergerUI(QMainWindow):
     ##
     # Instance Methods
     def save_merged_profile(self):
-        """Picks a path and saves the merged profile to it.
+        """Picks a path and saves the merged profile to it, if "Save Changes Only" is checked
+        the file of profile B (or A) is patched with the entries that changed.
         """
         file_path, _filter = QFileDialog.getSaveFileName(
             self,
@@ -316,96 +575,264 @@ class ProfileMergerUI(QMainWindow):
 
         # If a path was selected
         if file_path != '':
-            xml_root = ElementTree.Element(
-                'Profile', attrib={'xmlns': 'http://soap.sforce.com/2006/04/metadata'}
-            )
-
-            # Goes through the merged profile and fills the xml
-            for model_field in sorted(
-                GlobalEstate.Merged.PROPERTIES.values(), key=lambda x: x.model_name + x.model_id
-            ):
-                if not model_field.model_disabled:
-                    if type(model_field) is not models.ProfileSingleValue:
-                        c = ElementTree.SubElement(xml_root, model_field.model_name)
-                        if model_field.fields:
-                            for field, value in model_field.fields.items():
-                                if value is not None and value != '':
-                                    if type(value) is bool:
-                                        value = str(value).lower()
-                                    ElementTree.SubElement(c, field).text = value
-                    else:
-                        field = model_field.model_name
-                        value = model_field.value
-                        if value is not None and value != '':
-                            if type(value) is bool:
-                                value = str(value).lower()
-                            c = ElementTree.SubElement(xml_root, model_field.model_name)
-                            c.text = value
-
-            # Get the xml as a String and then prettyfies it
-            xml_str = ElementTree.tostring(xml_root, 'utf-8')
-            reparsed = minidom.parseString(xml_str)
-            xml_str = reparsed.toprettyxml(indent="    ", encoding='UTF-8').decode('utf-8').rstrip()
-
-            # Write to the selected path
-            with open(file_path, 'w', encoding='utf-8') as file_pointer:
-                file_pointer.write(xml_str)
+            result = 'Done.\t\t'
+            try:
+                if self.action_save_patch.isChecked():
+                    base_from = FROM_B if self.session.b.file_path else FROM_A
+                    try:
+                        added, removed, changed = self.session.save_patch(file_path, base_from)
+                        result = (
+                            f'Done, profile {base_from} patched: {len(added)} added, '
+                            f'{len(removed)} removed, {len(changed)} changed.'
+                        )
+                    except profile_index.StaleIndex:
+                        raise
+                    except ValueError as error:
+                        self.session.save(file_path)
+                        result = f'{error}\nThe whole profile was written instead.'
+                else:
+                    self.session.save(file_path)
+            except profile_index.StaleIndex as error:
+                # Unparsed categories of the old contents can't be written
+                self.reload_stale_inputs()
+                result = f'{error}\nIt is being reloaded, save again when it is done.'
 
             # Show result
             msgbox = QMessageBox()
             msgbox.setWindowTitle('Merge Results')
             msgbox.setIcon(QMessageBox.Information)
-            msgbox.setText('Done.\t\t')
+            msgbox.setText(result)
             msgbox.exec_()
 
+    def save_workspace(self):
+        """Picks a path and saves the merge session to it, see workspace.py.
+        """
+        if not self.session.merged:
+            self.ui.statusbar.showMessage('There is no merge to save', 5000)
+            return
+
+        file_path, _filter = QFileDialog.getSaveFileName(
+            self,
+            'Save the merge session',
+            '',
+            '*.sfpm'
+        )
+        if file_path == '':
+            return
+
+        workspace.save_workspace(self.session, file_path)
+        self.ui.statusbar.showMessage(f'Session saved to {file_path}', 5000)
+
+    def open_workspace(self):
+        """Picks a workspace file and restores its merge session, trees included.
+        """
+        file_path, _filter = QFileDialog.getOpenFileName(
+            self,
+            'Open a merge session',
+            '',
+            '*.sfpm'
+        )
+        if file_path == '':
+            return
+
+        self.scan_scheduler.cancel_all()
+        self.profile_watcher.unwatch_all()
+        try:
+            stale_inputs = workspace.load_workspace(self.session, file_path)
+        except (OSError, ValueError, pickle.UnpicklingError) as error:
+            msgbox = QMessageBox()
+            msgbox.setWindowTitle('Open Session')
+            msgbox.setIcon(QMessageBox.Warning)
+            msgbox.setText(f'The session could not be opened:\n{error}')
+            msgbox.exec_()
+            return
+
+        for profile_input, le_target, tree, btn_close in [
+            (self.session.a, self.ui.le_a, self.ui.tree_a, self.ui.btn_close_a),
+            (self.session.b, self.ui.le_b, self.ui.tree_b, self.ui.btn_close_b),
+        ]:
+            le_target.setText(profile_input.file_path)
+            btn_close.setEnabled(profile_input.loaded)
+            if profile_input.file_path:
+                file_name = profile_input.file_path.split('/')[-1].replace('.profile', '')
+                tree.setHeaderLabel(file_name)
+                self.tree_target = tree
+                if self.action_watch.isChecked():
+                    self.profile_watcher.watch(profile_input.from_profile, profile_input.file_path)
+            else:
+                tree.setHeaderLabel(f'Profile {profile_input.from_profile}')
+
+        if self.session.merge_a_to_b:
+            self.ui.btn_merge_dir.setIcon(self.icon_a_to_b)
+        else:
+            self.ui.btn_merge_dir.setIcon(self.icon_b_to_a)
+
+        self.undo_stack.clear()
+        self.update_undo_actions()
+        self.clear_trees()
+        self.add_items(True)
+
+        if stale_inputs:
+            msgbox = QMessageBox()
+            msgbox.setWindowTitle('Open Session')
+            msgbox.setIcon(QMessageBox.Information)
+            msgbox.setText(
+                f'Profile {" and ".join(stale_inputs)} changed since the session was saved, '
+                'the saved version is shown. Open the file again to merge the new version.'
+            )
+            msgbox.exec_()
+
+    def export_diff(self):
+        """Picks a path and writes the differences from profile A to profile B, as CSV if the
+        file name ends with .csv and as JSON lines otherwise.
+        """
+        if not (self.session.a.loaded and self.session.b.loaded):
+            self.ui.statusbar.showMessage('Load profiles A and B to export their diff', 5000)
+            return
+
+        file_path, _filter = QFileDialog.getSaveFileName(
+            self,
+            'Export the diff of A and B',
+            '',
+            '*.jsonl;;*.csv'
+        )
+        if file_path == '':
+            return
+
+        output_format = 'csv' if file_path.lower().endswith('.csv') else 'jsonl'
+        with self.session.lock:
+            try:
+                self.session.load_all()
+            except profile_index.StaleIndex as error:
+                self.reload_stale_inputs()
+                self.ui.statusbar.showMessage(f'{error}, it is being reloaded', 5000)
+                return
+            properties_a = self.session.a.properties
+            properties_b = self.session.b.properties
+        with open(file_path, 'w', encoding='utf-8', newline='') as file_pointer:
+            writer = profile_diff.DiffWriter(file_pointer, output_format)
+            writer.write_all(profile_diff.diff_records(properties_a, properties_b))
+
+        self.ui.statusbar.showMessage(f'{writer.written} differences exported', 5000)
+
     def handle_expand(self, item_clicked: QTreeWidgetItem, value_override=None):
-        """Syncs the expand and collapse of categories of the QTrees.
+        """Syncs the expand and collapse of categories and groups of the QTrees, groups create
+        their items the first time they are expanded.
 
         Args:
             item_clicked (QTreeWidgetItem): Item that was clicked in the QTree, comes from a Signal.
             value_override (bool): (Optional)
         """
         is_expanded = item_clicked.isExpanded()
-        tree_widget = item_clicked.treeWidget()
-        index = tree_widget.indexOfTopLevelItem(item_clicked)
-
-        self.ui.tree_a.topLevelItem(index).setExpanded(is_expanded)
-        self.ui.tree_b.topLevelItem(index).setExpanded(is_expanded)
-        self.ui.tree_merged.topLevelItem(index).setExpanded(is_expanded)
+        if is_expanded and type(item_clicked) is UiGroupItem:
+            self.expand_group(item_clicked)
+        elif (is_expanded and item_clicked.parent() is None
+                and item_clicked.text(0) in self.lazy_categories):
+            self.load_category(item_clicked.text(0))
+
+        path = ProfileMergerUI.item_path(item_clicked)
+        for tree in [self.ui.tree_a, self.ui.tree_b, self.ui.tree_merged]:
+            item = ProfileMergerUI.item_at_path(tree, path)
+            if item is not None:
+                item.setExpanded(is_expanded)
 
     def item_clicked(self, item_clicked: QTreeWidgetItem):
         """Handle left click for the A and B QTrees.
             - If it's an item, update the merged item with the clicked item value.
+            - If Ctrl or Shift are held, the item is only selected for apply_selected.
 
         Args:
             item_clicked (QTreeWidgetItem): Item that was clicked in the QTree, comes from a Signal.
         """
+        if QApplication.keyboardModifiers() & (Qt.ControlModifier | Qt.ShiftModifier):
+            return
+
         if type(item_clicked) is UiProfileItem:
-            parent_item = None
-            parent_row = None
-            child_row = None
-            if item_clicked.treeWidget() is self.ui.tree_a:
-                parent_item = item_clicked.parent()
-                parent_row = self.ui.tree_a.indexOfTopLevelItem(parent_item)
-                child_row = parent_item.indexOfChild(item_clicked)
-            elif item_clicked.treeWidget() is self.ui.tree_b:
-                parent_item = item_clicked.parent()
-                parent_row = self.ui.tree_b.indexOfTopLevelItem(parent_item)
-                child_row = parent_item.indexOfChild(item_clicked)
-            else:
+            merged_item = self.merged_item_at(item_clicked)
+            if merged_item is None:
                 return
-
-            parent_merged_item = self.ui.tree_merged.topLevelItem(parent_row)
-            merged_item = parent_merged_item.child(child_row)
-            merged_item.item_disabled = False
-            if hasattr(item_clicked, 'toggle_value'):
-                if item_clicked.toggle_value is not None:
-                    merged_item.toggle_value = item_clicked.toggle_value
-            else:
-                merged_item.item_disabled = True
+            operations = ProfileMergerUI.item_operations(merged_item, item_clicked.toggle_value)
+            merged_item.set_state(toggle_value=item_clicked.toggle_value)
+            self.record_changes('Apply Value', operations)
+            self.invalidate_groups()
 
         item_clicked.setSelected(False)
 
+    def apply_selected(self):
+        """Applies the selected items of the A and B QTrees to the merged state as one batch,
+        a selected category applies all its items. The merged QTree is updated once at the end.
+        """
+        selected_items = []
+        for tree in [self.ui.tree_a, self.ui.tree_b]:
+            for item in tree.selectedItems():
+                if item.parent() is None or type(item) is UiGroupItem:
+                    selected_items.extend(item.child(index) for index in range(item.childCount()))
+                else:
+                    selected_items.append(item)
+
+        applied = 0
+        operations = []
+        for item in selected_items:
+            if type(item) is not UiProfileItem:
+                continue
+            merged_item = self.merged_item_at(item)
+            if merged_item is not None:
+                operations.extend(ProfileMergerUI.item_operations(merged_item, item.toggle_value))
+                merged_item.set_state(toggle_value=item.toggle_value, refresh=False)
+                applied += 1
+        self.record_changes('Apply Selected', operations)
+
+        self.ui.tree_a.clearSelection()
+        self.ui.tree_b.clearSelection()
+        self.invalidate_groups()
+        self.ui.tree_merged.viewport().update()
+        self.ui.statusbar.showMessage(f'{applied} values applied', 5000)
+
+    def apply_rules_file(self):
+        """Picks a rules file and resolves the merged entries with it, the QTrees are rebuilt
+        if any entry changed.
+        """
+        file_path, _filter = QFileDialog.getOpenFileName(
+            self,
+            'Open a rules file',
+            '',
+            '*.rules *.txt;;*'
+        )
+        if file_path == '':
+            return
+
+        try:
+            rule_set = merge_rules.load_rules(file_path)
+        except (OSError, ValueError) as error:
+            msgbox = QMessageBox()
+            msgbox.setWindowTitle('Merge Rules')
+            msgbox.setIcon(QMessageBox.Warning)
+            msgbox.setText(f'The rules could not be read:\n{error}')
+            msgbox.exec_()
+            return
+
+        old_merged = self.session.merged
+        changed_ids, counts = self.session.apply_rules(rule_set)
+        if changed_ids:
+            self.push_merged_changes('Apply Rules', old_merged, changed_ids)
+            self.add_items(True)
+
+        matched = ', '.join(f'{action}: {count}' for action, count in counts.items())
+        self.ui.statusbar.showMessage(
+            f'Rules applied: {len(changed_ids)} entries changed ({matched})', 5000
+        )
+
+    def merged_item_at(self, item: QTreeWidgetItem):
+        """Returns the item of the merged QTree in the same position than an item of the A or B
+        QTrees, None if there is no such item.
+        """
+        merged_item = ProfileMergerUI.item_at_path(
+            self.ui.tree_merged, ProfileMergerUI.item_path(item)
+        )
+        if type(merged_item) is not UiProfileItem:
+            return None
+        return merged_item
+
     def merged_item_clicked(self, item_clicked: QTreeWidgetItem):
         """Handle left click for the merged QTree.
             - If it's an item, disable it.
@@ -418,23 +845,261 @@ class ProfileMergerUI(QMainWindow):
         if type(item_clicked) is UiProfileItem:
             disabled = item_clicked.item_disabled
             if hasattr(item_clicked, 'item_disabled'):
-                merged = GlobalEstate.Items.merged[item_clicked.id]
-                if type(merged) is list:
-                    for item in merged:
-                        item.item_disabled = not disabled
-                else:
-                    item_clicked.item_disabled = not disabled
+                merged = self.item_registry.items(self.session, FROM_MERGED, item_clicked.id)
+                for item in merged or [item_clicked]:
+                    item.item_disabled = not disabled
+                self.record_changes('Disable Entry', [
+                    undo.Operation(item_clicked.id, rerere.DISABLED_TOGGLE, disabled, not disabled)
+                ])
             item_clicked.setSelected(False)
+        # Is a group or a category shown by groups
+        elif type(item_clicked) is UiGroupItem or type(item_clicked.child(0)) is UiGroupItem:
+            groups = [item_clicked]
+            if type(item_clicked) is not UiGroupItem:
+                groups = [item_clicked.child(index) for index in range(item_clicked.childCount())]
+            model_ids = [model_id for group in groups for model_id in group.model_ids]
+            self.set_entries_disabled(model_ids)
         # Is a category
         else:
             value = False
+            operations = []
             for index in range(item_clicked.childCount()):
                 item = item_clicked.child(index)
                 if index == 0:
                     value = not item.item_disabled
-                item_clicked.child(index).item_disabled = value
+                if type(item) is UiProfileItem and item.id not in [
+                    operation.model_id for operation in operations[-1:]
+                ]:
+                    operations.append(
+                        undo.Operation(item.id, rerere.DISABLED_TOGGLE, item.item_disabled, value)
+                    )
+                item.item_disabled = value
+            self.record_changes('Disable Category', operations)
+
+        self.invalidate_groups()
+
+    def set_entries_disabled(self, model_ids: list):
+        """Toggles the disabled state of merged entries, items that weren't created yet are
+        covered too. The value is the opposite of the first entry.
+
+        Args:
+            model_ids (list): model_ids of the entries.
+        """
+        merged_dict = self.session.merged
+        models_list = [merged_dict[_id] for _id in model_ids if _id in merged_dict]
+        if not models_list:
+            return
+
+        disabled = not models_list[0].model_disabled
+        operations = [
+            undo.Operation(model.model_id, rerere.DISABLED_TOGGLE, model.model_disabled, disabled)
+            for model in models_list
+        ]
+        for model in models_list:
+            model.model_disabled = disabled
+        self.record_changes('Disable Group', operations)
+        self.ui.tree_merged.viewport().update()
+
+    def record_resolutions(self, resolutions: list):
+        """Adds resolutions made by hand to the decision log, if recording is on.
+
+        Args:
+            resolutions (list): (model_id, toggle_name, value) of each resolution, see rerere.
+        """
+        if self.decision_log is None or not resolutions:
+            return
+
+        merged_dict = self.session.merged
+        properties_a = self.session.a.properties
+        properties_b = self.session.b.properties
+        self.decision_log.record([
+            self.decision_log.decide(
+                model_id, toggle_name, value, merged_dict, properties_a, properties_b
+            )
+            for model_id, toggle_name, value in resolutions
+        ])
+
+    def record_changes(self, label: str, operations: list):
+        """Adds the changes made by hand to the undo history as one step and records them as
+        resolutions.
+
+        Args:
+            label (str): What was done, shown when it's undone.
+            operations (list): undo.Operation of each value that changed.
+        """
+        step = self.undo_stack.push(label, operations)
+        if step is None:
+            return
+        self.record_resolutions([
+            (operation.model_id, operation.toggle_name, operation.new_value)
+            for operation in step.operations
+        ])
+        self.update_undo_actions()
+
+    def push_merged_changes(self, label: str, old_merged: dict, model_ids=None):
+        """Adds a bulk change of the merged dict to the undo history as one step, only the
+        values that changed are kept.
+
+        Args:
+            label (str): What was done, shown when it's undone.
+            old_merged (dict): Merged dict before the change, bulk changes build a new one.
+            model_ids (iterable): (Optional) Entries that may have changed, all by default.
+        """
+        new_merged = self.session.merged
+        if model_ids is None:
+            model_ids = old_merged.keys() | new_merged.keys()
+        if self.undo_stack.push(label, undo.diff_operations(old_merged, new_merged, model_ids)):
+            self.update_undo_actions()
+
+    def merged_item_toggled(self, item: QTreeWidgetItem):
+        """Records a value toggled with the right button in the merged QTree, comes from a
+        Signal.
+        """
+        toggle_name = item.toggle_name
+        if toggle_name is None:
+            toggle_name = rerere.VALUE_TOGGLE
+        self.record_changes(
+            'Toggle Value',
+            [undo.Operation(item.id, toggle_name, not item.toggle_value, item.toggle_value)]
+        )
+        self.invalidate_groups()
+
+    def undo_step(self):
+        """Undoes the last change to the merged entries.
+        """
+        step = self.undo_stack.undo()
+        if step is not None:
+            self.apply_undo_step(step, True)
+            self.ui.statusbar.showMessage(f'Undo {step.label}', 5000)
+
+    def redo_step(self):
+        """Redoes the last undone change to the merged entries.
+        """
+        step = self.undo_stack.redo()
+        if step is not None:
+            self.apply_undo_step(step, False)
+            self.ui.statusbar.showMessage(f'Redo {step.label}', 5000)
+
+    def apply_undo_step(self, step: undo.UndoStep, undo_changes: bool):
+        """Sets the values of an undo step on the merged entries and updates their items, the
+        QTrees are rebuilt if entries were added or removed.
+        """
+        self.session.apply_operations(step.operations, undo=undo_changes)
+
+        model_ids = list(dict.fromkeys(operation.model_id for operation in step.operations))
+        rebuild = any(operation.toggle_name == undo.ENTRY_TOGGLE for operation in step.operations)
+        for model_id in model_ids:
+            if rebuild:
+                break
+            rebuild = not self.update_entry_items(model_id)
+        if rebuild:
+            self.add_items(True)
+        else:
+            self.invalidate_groups()
+            self.ui.tree_merged.viewport().update()
+        self.update_undo_actions()
+
+    def update_undo_actions(self):
+        """Enables the Undo and Redo actions and names the step they would change.
+        """
+        for action, text, steps in [
+            (self.action_undo, 'Undo', self.undo_stack.done),
+            (self.action_redo, 'Redo', self.undo_stack.undone),
+        ]:
+            action.setEnabled(len(steps) > 0)
+            action.setText(f'{text} {steps[-1].label}' if steps else text)
+
+    def set_decision_log(self, enabled: bool):
+        """Starts recording resolutions to a log picked by the user, the decisions already in it
+        are replayed on the current merge. Comes from the "Record Resolutions" action.
+        """
+        if not enabled:
+            self.decision_log = None
+            return
+
+        file_path, _filter = QFileDialog.getSaveFileName(
+            self,
+            'Pick a resolutions log',
+            '',
+            '*.jsonl',
+            options=QFileDialog.DontConfirmOverwrite
+        )
+        if file_path == '':
+            self.action_record_resolutions.setChecked(False)
+            return
+
+        try:
+            self.decision_log = rerere.DecisionLog(file_path)
+        except (OSError, ValueError, KeyError) as error:
+            self.action_record_resolutions.setChecked(False)
+            msgbox = QMessageBox()
+            msgbox.setWindowTitle('Recorded Resolutions')
+            msgbox.setIcon(QMessageBox.Warning)
+            msgbox.setText(f'The log could not be read:\n{error}')
+            msgbox.exec_()
+            return
 
+        if self.session.merged:
+            old_merged = self.session.merged
+            self.replay_decisions()
+            self.push_merged_changes('Replay Resolutions', old_merged)
+            self.add_items(True)
 
+    def replay_decisions(self):
+        """Replays the recorded resolutions that match the conflicts of the current merge.
+        """
+        if self.decision_log is None:
+            return
+        changed_ids, replayed = self.session.apply_decisions(self.decision_log)
+        self.ui.statusbar.showMessage(
+            f'{replayed} recorded resolutions replayed, {len(changed_ids)} entries changed', 5000
+        )
+
+    def profiles_merged(self, state: bool):
+        """Shows a new merge of the loaded profiles, comes from the ScanScheduler.
+        """
+        self.undo_stack.clear()
+        self.update_undo_actions()
+        self.replay_decisions()
+        self.add_items(state)
+
+    def show_strategy_menu(self, position):
+        """Shows the merge strategies for the category under the cursor in the merged QTree.
+
+        Args:
+            position (QPoint): Position in the viewport, comes from a Signal.
+        """
+        item = self.ui.tree_merged.itemAt(position)
+        # The right button toggles the value of the items, the menu is for categories and groups
+        if item is None or type(item) is UiProfileItem:
+            return
+        while item.parent() is not None:
+            item = item.parent()
+        category = item.text(0)
+        current = self.session.strategies.get(category, merge_strategies.DEFAULT_STRATEGY)
+
+        menu = QMenu(self)
+        menu.addSection(f'Merge {category} by')
+        for strategy_name in merge_strategies.strategies_by_name:
+            action = menu.addAction(strategy_name)
+            action.setCheckable(True)
+            action.setChecked(strategy_name == current)
+
+        chosen = menu.exec_(self.ui.tree_merged.viewport().mapToGlobal(position))
+        if chosen is not None and chosen.text() != current:
+            self.set_category_strategy(category, chosen.text())
+
+    def set_category_strategy(self, category: str, strategy_name: str):
+        """Merges the inputs again with a new strategy for a category, the recorded resolutions
+        are replayed on top.
+        """
+        old_merged = self.session.merged
+        self.session.set_strategy(category, strategy_name)
+        self.session.rebuild_merged()
+        self.replay_decisions()
+        self.push_merged_changes(f'{category} Strategy', old_merged)
+        self.add_items(True)
+        self.ui.statusbar.showMessage(f'{category} merged by {strategy_name}', 5000)
 
     def change_merge_direction(self, a_to_b=None):
         """Toggle or change the merge direction
@@ -442,27 +1107,24 @@ class ProfileMergerUI(QMainWindow):
             a_to_b (bool): (Optional) sets the merge direction.
         """
         if a_to_b is not None:
-            GlobalEstate.MERGE_A_TO_B = not GlobalEstate.MERGE_A_TO_B
+            self.session.set_merge_direction(not self.session.merge_a_to_b)
         else:
-            GlobalEstate.MERGE_A_TO_B = a_to_b
+            self.session.set_merge_direction(bool(a_to_b))
 
-        if GlobalEstate.MERGE_A_TO_B:
+        if self.session.merge_a_to_b:
             self.ui.btn_merge_dir.setIcon(self.icon_a_to_b)
-            self.apply_all_values(GlobalEstate.FROM_A)
+            self.apply_all_values(FROM_A)
 
         else:
             self.ui.btn_merge_dir.setIcon(self.icon_b_to_a)
-            self.apply_all_values(GlobalEstate.FROM_B)
+            self.apply_all_values(FROM_B)
 
 
     def apply_all_values(self, from_profile: str):
-        if from_profile == GlobalEstate.FROM_A:
-            fields_to_apply = GlobalEstate.A.PROPERTIES
-        else:
-            fields_to_apply = GlobalEstate.B.PROPERTIES
-
         # Update the merged properties dictionary with the values from the specified profile
-        GlobalEstate.Merged.PROPERTIES.update(fields_to_apply)
+        old_merged = self.session.merged
+        self.session.apply_all(from_profile)
+        self.push_merged_changes(f'Apply All {from_profile}', old_merged)
 
         # Update the merged tree widget with the new values
         self.add_items(True)
@@ -471,102 +1133,278 @@ class ProfileMergerUI(QMainWindow):
         
 
     def add_items(self, state: bool):
-        if self.tree_target:
-            merged_dict = GlobalEstate.Merged.PROPERTIES
+        """Rebuilds the three QTrees from the merged state.
 
-            self.ui.tree_merged.clear()
-            self.ui.tree_a.clear()
-            self.ui.tree_b.clear()
-
-            GlobalEstate.categories_items_merged = {}
-            GlobalEstate.categories_items_a = {}
-            GlobalEstate.categories_items_b = {}
-            for key, value in models.classes_by_modelName.items():
-                tree_item = QTreeWidgetItem()
-                tree_item.setText(0, key)
-                GlobalEstate.categories_items_a[key] = tree_item
+        The categories are added right away and their entries are queued, populate_chunk adds
+        them in time slices so the window stays responsive with big profiles.
+        """
+        if self.tree_target:
+            merged_dict = self.session.merged
 
-                tree_item = QTreeWidgetItem()
-                tree_item.setText(0, key)
-                GlobalEstate.categories_items_b[key] = tree_item
+            self.clear_trees()
 
-                tree_item = QTreeWidgetItem()
-                tree_item.setText(0, key)
-                GlobalEstate.categories_items_merged[key] = tree_item
+            self.categories_items_merged = {}
+            self.categories_items_a = {}
+            self.categories_items_b = {}
+            for tree_name in [FROM_A, FROM_B, FROM_MERGED]:
+                self.item_registry.reset(self.session, tree_name)
 
-            # Fill merged list
+            # Entries of each category, in the order of the QTrees
+            # Categories without a model (ProfileRawElement) go after the known ones
+            keys_by_category = {key: collections.deque() for key in models.classes_by_modelName}
             for key in sorted(merged_dict.keys()):
-                model_obj = merged_dict[key]
-                model_type = model_obj.model_name
-                model_name = model_obj.model_id
-
-                if len(model_obj.toggles.values()) > 0:
-                    item_group = []
-                    for toggle_name, toggle_value in model_obj.toggles.items():
-                        if toggle_value is not None:
-                            toggle_value = utils.str_to_bool(toggle_value)
-
-                            item = UiProfileItem(
-                                model_obj, GlobalEstate.categories_items_merged[model_type],
-                                toggle_name=toggle_name, toggle_value=toggle_value,
-                            )
-                            item_group.append(item)
-
-                            ProfileMergerUI.replicate_item(
-                                GlobalEstate.B.PROPERTIES,
-                                GlobalEstate.Items.b,
-                                GlobalEstate.categories_items_b[model_type],
-                                key,
-                                toggle_name
-                            )
-                            ProfileMergerUI.replicate_item(
-                                GlobalEstate.A.PROPERTIES,
-                                GlobalEstate.Items.a,
-                                GlobalEstate.categories_items_a[model_type],
-                                key,
-                                toggle_name
-                            )
-
-                    GlobalEstate.Items.merged[model_name] = item_group
-                else:
-                    item = UiProfileItem(
-                        model_obj,
-                        GlobalEstate.categories_items_merged[model_type]
-                    )
-                    if hasattr(model_obj, 'value'):
-                        item.toggle_value = model_obj.value
-                    GlobalEstate.Items.merged[model_name] = item
-                    self.ui.tree_merged.addTopLevelItem(item)
-
-                    ProfileMergerUI.replicate_item(
-                        GlobalEstate.B.PROPERTIES,
-                        GlobalEstate.Items.b,
-                        GlobalEstate.categories_items_b[model_type],
-                        key
-                    )
-                    ProfileMergerUI.replicate_item(
-                        GlobalEstate.A.PROPERTIES,
-                        GlobalEstate.Items.b,
-                        GlobalEstate.categories_items_a[model_type],
-                        key
-                    )
+                keys_by_category.setdefault(merged_dict[key].model_name, collections.deque())
+                keys_by_category[merged_dict[key].model_name].append(key)
+            for key in sorted(self.session.pending_categories - keys_by_category.keys()):
+                keys_by_category[key] = collections.deque()
 
             categories_by_treewidget = {
-                self.ui.tree_b: GlobalEstate.categories_items_b,
-                self.ui.tree_merged: GlobalEstate.categories_items_merged,
-                self.ui.tree_a: GlobalEstate.categories_items_a
+                self.ui.tree_b: self.categories_items_b,
+                self.ui.tree_merged: self.categories_items_merged,
+                self.ui.tree_a: self.categories_items_a
             }
+            pending_categories = self.session.pending_categories
+            for key, keys in keys_by_category.items():
+                if not keys and key not in pending_categories:
+                    continue
+                for tree_widget, categories in categories_by_treewidget.items():
+                    tree_item = QTreeWidgetItem()
+                    tree_item.setText(0, key)
+                    categories[key] = tree_item
+                    tree_widget.addTopLevelItem(tree_item)
+
+                if key in pending_categories:
+                    # Not parsed yet, loaded by handle_expand
+                    self.lazy_categories.add(key)
+                    for categories in categories_by_treewidget.values():
+                        categories[key].setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+                elif models.classes_by_modelName.get(key) is models.ProfileFieldLevelSecurity:
+                    self.add_group_items(key, keys)
+                else:
+                    self.populate_queue.append((key, keys))
 
-            for tree_widget, categories in categories_by_treewidget.items():
-                for item in categories.values():
-                    if item.childCount() > 0:
-                        tree_widget.addTopLevelItem(item)
+            self.populate_source = (
+                merged_dict, self.session.a.properties, self.session.b.properties
+            )
+            self.populate_timer.start()
+
+    def load_category(self, model_type: str):
+        """Parses a category that was left unparsed and adds its items to the QTrees.
+
+        Args:
+            model_type (str): Category (model_name).
+        """
+        try:
+            keys = self.session.load_categories([model_type])
+        except profile_index.StaleIndex as error:
+            self.reload_stale_inputs()
+            self.ui.statusbar.showMessage(f'{error}, it is being reloaded', 5000)
+            return
+        self.lazy_categories.discard(model_type)
+        self.populate_source = (
+            self.session.merged, self.session.a.properties, self.session.b.properties
+        )
+
+        for categories in [self.categories_items_a, self.categories_items_b,
+                           self.categories_items_merged]:
+            categories[model_type].setChildIndicatorPolicy(
+                QTreeWidgetItem.DontShowIndicatorWhenChildless
+            )
+
+        if models.classes_by_modelName.get(model_type) is models.ProfileFieldLevelSecurity:
+            self.add_group_items(model_type, keys)
+        else:
+            self.populate_queue.append((model_type, collections.deque(keys)))
+            self.populate_timer.start()
+
+    def add_group_items(self, model_type: str, keys):
+        """Adds a category by object groups, the items of a group are created when it's
+        expanded (see expand_group).
+
+        Args:
+            model_type (str): Category (model_name), ex: fieldPermissions.
+            keys (iterable): Sorted model_ids of the category.
+        """
+        merged_dict = self.session.merged
+        keys_by_object = {}
+        for key in keys:
+            keys_by_object.setdefault(merged_dict[key].object_name, []).append(key)
+
+        for object_name, object_keys in keys_by_object.items():
+            self.groups_items[(model_type, object_name)] = tuple(
+                UiGroupItem(object_name, object_keys, categories[model_type])
+                for categories in [self.categories_items_a, self.categories_items_b,
+                                   self.categories_items_merged]
+            )
+
+        for categories in [self.categories_items_a, self.categories_items_b,
+                           self.categories_items_merged]:
+            categories[model_type].setExpanded(True)
+
+    def expand_group(self, group_item: UiGroupItem):
+        """Creates the items of a group in the three QTrees and computes its summary, only the
+        first time it's expanded or after the summary was invalidated.
+
+        Args:
+            group_item (UiGroupItem): Group of any of the QTrees.
+        """
+        model_type = group_item.parent().text(0)
+        groups = self.groups_items.get((model_type, group_item.group_name))
+        if groups is None or self.populate_source is None:
+            return
+
+        if not groups[0].materialized:
+            for key in groups[0].model_ids:
+                self.add_entry_items(key, groups)
+            for group in groups:
+                group.materialized = True
+
+        if groups[0].summary is None:
+            self.update_group_summary(groups)
+
+    def update_group_summary(self, groups: tuple):
+        summary = profile_diff.group_summary(
+            groups[0].model_ids, self.session.merged,
+            self.session.a.properties, self.session.b.properties
+        )
+        for group in groups:
+            group.set_summary(summary)
+
+    def invalidate_groups(self):
+        """Drops the cached summaries after the merged values changed, the expanded groups are
+        computed again right away and the rest when they are expanded.
+        """
+        for groups in self.groups_items.values():
+            if groups[0].summary is None:
+                continue
+            if groups[2].isExpanded():
+                self.update_group_summary(groups)
+            else:
+                for group in groups:
+                    group.set_summary(None)
+
+    def populate_chunk(self):
+        """Adds queued entries to the QTrees until POPULATE_SLICE runs out, the categories
+        visible in the merged QTree go first. Called by populate_timer.
+        """
+        if not self.populate_queue:
+            self.populate_timer.stop()
+            return
 
-            ProfileMergerUI.expand_all_categories(True)
+        all_tree_widgets = [self.ui.tree_a, self.ui.tree_b, self.ui.tree_merged]
+        sorting = [tree.isSortingEnabled() for tree in all_tree_widgets]
+        for tree in all_tree_widgets:
+            tree.setUpdatesEnabled(False)
+            tree.setSortingEnabled(False)
+
+        # Bring forward the first queued category that is on screen
+        viewport_rect = self.ui.tree_merged.viewport().rect()
+        for index, (model_type, _keys) in enumerate(self.populate_queue):
+            category_item = self.categories_items_merged[model_type]
+            if self.ui.tree_merged.visualItemRect(category_item).intersects(viewport_rect):
+                if index > 0:
+                    self.populate_queue.rotate(-index)
+                break
+
+        # Categories are expanded when their first entries are added
+        started_categories = []
+        deadline = time.perf_counter() + POPULATE_SLICE
+        while self.populate_queue and time.perf_counter() < deadline:
+            model_type, keys = self.populate_queue[0]
+            if self.categories_items_merged[model_type].childCount() == 0:
+                started_categories.append(model_type)
+            while keys and time.perf_counter() < deadline:
+                self.add_entry_items(keys.popleft())
+            if not keys:
+                self.populate_queue.popleft()
+
+        for tree, sorting_enabled in zip(all_tree_widgets, sorting):
+            tree.setSortingEnabled(sorting_enabled)
+            tree.setUpdatesEnabled(True)
+
+        for model_type in started_categories:
+            for categories in [self.categories_items_a, self.categories_items_b,
+                               self.categories_items_merged]:
+                categories[model_type].setExpanded(True)
+
+        if not self.populate_queue:
+            self.populate_timer.stop()
+            print(f'SOURCE: {len(self.session.a.properties.keys())}')
+            print(f'TARGET: {len(self.session.b.properties.keys())}')
+            print(f'MERGED: {len(self.session.merged.keys())}')
+
+    def add_entry_items(self, key: str, parents=None):
+        """Adds the items of an entry of the merged state to the three QTrees.
 
-            print(f'SOURCE: {len(GlobalEstate.A.PROPERTIES.keys())}')
-            print(f'TARGET: {len(GlobalEstate.B.PROPERTIES.keys())}')
-            print(f'MERGED: {len(GlobalEstate.Merged.PROPERTIES.keys())}')
+        Args:
+            key (str): model_id of the entry.
+            parents (tuple): (Optional) (A, B, merged) items that hold the entry, by default its
+                categories.
+        """
+        merged_dict, properties_a, properties_b = self.populate_source
+        model_obj = merged_dict[key]
+        model_type = model_obj.model_name
+        if parents is None:
+            parents = (
+                self.categories_items_a[model_type],
+                self.categories_items_b[model_type],
+                self.categories_items_merged[model_type],
+            )
+        parent_a, parent_b, parent_merged = parents
+
+        if len(model_obj.toggles.values()) > 0:
+            for toggle_name, toggle_value in model_obj.toggles.items():
+                if toggle_value is not None:
+                    toggle_value = utils.str_to_bool(toggle_value)
+
+                    item = UiProfileItem(
+                        model_obj, parent_merged, disabled=model_obj.model_disabled,
+                        toggle_name=toggle_name, toggle_value=toggle_value,
+                    )
+                    self.register_item(FROM_MERGED, item)
+
+                    self.register_item(FROM_B, ProfileMergerUI.replicate_item(
+                        properties_b,
+                        parent_b,
+                        key,
+                        toggle_name
+                    ))
+                    self.register_item(FROM_A, ProfileMergerUI.replicate_item(
+                        properties_a,
+                        parent_a,
+                        key,
+                        toggle_name
+                    ))
+        else:
+            item = UiProfileItem(
+                model_obj,
+                parent_merged,
+                disabled=model_obj.model_disabled
+            )
+            if hasattr(model_obj, 'value'):
+                item.toggle_value = model_obj.value
+            self.register_item(FROM_MERGED, item)
+
+            self.register_item(FROM_B, ProfileMergerUI.replicate_item(
+                properties_b,
+                parent_b,
+                key
+            ))
+            self.register_item(FROM_A, ProfileMergerUI.replicate_item(
+                properties_a,
+                parent_a,
+                key
+            ))
+
+    def register_item(self, tree_name: str, item):
+        """Registers an item of the current session, spacer items are skipped.
+
+        Args:
+            tree_name (str): FROM_A, FROM_B or FROM_MERGED.
+            item (QTreeWidgetItem): Item added to the QTree.
+        """
+        if type(item) is UiProfileItem:
+            self.item_registry.add(self.session, tree_name, item)
 
     def sync_scroll(self, value):
         """Syncs the scrollbar of the QTreeWidgets.
@@ -598,59 +1436,238 @@ class ProfileMergerUI(QMainWindow):
             le_target.setText(file_path)
 
             self.tree_target = tree_target
-            self.scanner_worker.profile_filepath = file_path
-            self.scanner_worker.from_profile = from_profile
-            self.scanner_worker.start()
+            self.scans_progress[from_profile] = (0, os.path.getsize(file_path), {})
+            self.scan_scheduler.schedule(from_profile, file_path)
 
             file_name = file_path.split('/')[-1].replace('.profile', '')
 
             tree_target.setHeaderLabel(file_name)
 
-            if from_profile == GlobalEstate.FROM_A:
+            if from_profile == FROM_A:
                 self.ui.btn_close_a.setEnabled(True)
-            if from_profile == GlobalEstate.FROM_B:
+            if from_profile == FROM_B:
                 self.ui.btn_close_b.setEnabled(True)
 
+            if self.action_watch.isChecked():
+                self.profile_watcher.watch(from_profile, file_path)
+
     def close_profile(self, from_profile: str):
-        if from_profile == GlobalEstate.FROM_A:
+        self.profile_watcher.unwatch(from_profile)
+        self.scan_scheduler.cancel(from_profile)
+
+        if from_profile == FROM_A:
             self.tree_target = self.ui.tree_a
             self.ui.le_a.setText('')
-            GlobalEstate.A.PROPERTIES.clear()
-            GlobalEstate.A_MERGED = False
-            other_from = GlobalEstate.FROM_B
-            reset_other_path = self.ui.le_b.text()
             self.ui.btn_close_a.setEnabled(False)
         else:
             self.tree_target = self.ui.tree_b
             self.ui.le_b.setText('')
-            GlobalEstate.B.PROPERTIES.clear()
-            GlobalEstate.B_MERGED = False
-            other_from = GlobalEstate.FROM_A
-            reset_other_path = self.ui.le_a.text()
             self.ui.btn_close_b.setEnabled(False)
 
+        # The session merges again with the profile that is still open
+        self.session.close(from_profile)
+        self.undo_stack.clear()
+        self.update_undo_actions()
+
         self.clear_trees()
-        GlobalEstate.Merged.PROPERTIES.clear()
-        GlobalEstate.Items.merged.clear()
         self.tree_target.setHeaderLabel(f'Profile {from_profile}')
 
-        if reset_other_path:
-            self.scanner_worker.profile_filepath = reset_other_path
-            self.scanner_worker.from_profile = other_from
-            self.scanner_worker.start()
+        if self.session.merged:
+            self.add_items(True)
+
+    def expand_all_categories(self, expand: bool):
+        """ Expand or Collapses all the categories
+
+        Args:
+            expand (bool): Expand the categories or collpase them?
+        """
+        categories_lists = [
+            self.categories_items_a.values(),
+            self.categories_items_b.values(),
+            self.categories_items_merged.values(),
+        ]
+
+        for item_list in categories_lists:
+            for item in item_list:
+                item.setExpanded(expand)
 
     def clear_trees(self):
+        # Pending entries belong to the items being removed
+        self.populate_timer.stop()
+        self.populate_queue.clear()
+        self.populate_source = None
+        self.groups_items = {}
+        self.lazy_categories = set()
+
         all_tree_widgets = [self.ui.tree_a, self.ui.tree_b, self.ui.tree_merged]
         for tree in all_tree_widgets:
             tree.clear()
+
+    def set_watch_mode(self, enabled: bool):
+        """Starts or stops watching the loaded profile files.
+
+        Args:
+            enabled (bool): Watch the files?
+        """
+        if not enabled:
+            self.profile_watcher.unwatch_all()
+            return
+
+        self.profile_watcher.watch(FROM_A, self.ui.le_a.text())
+        self.profile_watcher.watch(FROM_B, self.ui.le_b.text())
+
+    def reload_profile(self, from_profile: str, file_path: str):
+        """Re-scans a profile that changed on disk, comes from a ProfileWatcher signal.
+        """
+        self.scan_scheduler.schedule(from_profile, file_path, incremental=True)
+
+    def reload_stale_inputs(self):
+        """Re-scans the inputs whose file changed since it was indexed, their unparsed
+        categories can't be parsed from the new contents.
+        """
+        for profile_input in [self.session.a, self.session.b]:
+            if profile_input.index is not None and profile_input.index.stale:
+                self.reload_profile(profile_input.from_profile, profile_input.file_path)
+
+    def apply_profile_changes(self, from_profile: str, added: list, removed: list, changed: list):
+        """Updates the trees after the changed entries of a reloaded profile were re-merged,
+        the items of changed entries are updated in place.
+
+        Args:
+            from_profile (str): What profile changed.
+            added (list): model_ids of the added entries.
+            removed (list): model_ids of the removed entries.
+            changed (list): model_ids of the changed entries.
+        """
+        if not (added or removed or changed):
+            return
+
+        # Rows only have to be rebuilt if entries were added or removed
+        if added or removed or not all(self.update_entry_items(_id) for _id in changed):
+            self.add_items(True)
+        else:
+            # Groups that are expanded later take the new models
+            self.populate_source = (
+                self.session.merged, self.session.a.properties, self.session.b.properties
+            )
+            self.invalidate_groups()
+
+        self.ui.statusbar.showMessage(
+            f'Profile {from_profile} reloaded: {len(added)} added, {len(removed)} removed, '
+            f'{len(changed)} changed', 5000
+        )
+
+    def show_scan_progress(
+        self, from_profile: str, bytes_read: int, total_bytes: int, counts: dict
+    ):
+        """Shows the progress of the running scans in the status bar.
+        """
+        self.scans_progress[from_profile] = (bytes_read, total_bytes, counts)
+        if bytes_read >= total_bytes:
+            self.hide_scan_progress(from_profile)
+            return
+
+        read = sum(progress[0] for progress in self.scans_progress.values())
+        total = sum(progress[1] for progress in self.scans_progress.values()) or 1
+        self.progress_bar.setValue(int(read * 1000 / total))
+        self.progress_bar.setVisible(True)
+
+        entries = ', '.join(
+            f'{category}: {count}'
+            for category, count in sorted(counts.items(), key=lambda x: -x[1])[:3]
+        )
+        self.ui.statusbar.showMessage(f'Loading Profile {from_profile}... {entries}')
+
+    def hide_scan_progress(self, from_profile: str):
+        self.scans_progress.pop(from_profile, None)
+        if not self.scans_progress:
+            self.progress_bar.setVisible(False)
+            self.ui.statusbar.clearMessage()
+
+    def cancel_scans(self):
+        """Abandons the running scans, the loaded profiles stay as they were.
+        """
+        if not self.scan_scheduler.busy:
+            return
+        self.scan_scheduler.cancel_all()
+
+        for from_profile in list(self.scans_progress.keys()):
+            self.hide_scan_progress(from_profile)
+        self.ui.le_a.setText(self.session.a.file_path)
+        self.ui.le_b.setText(self.session.b.file_path)
+        self.ui.btn_close_a.setEnabled(self.session.a.loaded)
+        self.ui.btn_close_b.setEnabled(self.session.b.loaded)
+        self.ui.statusbar.showMessage('Loading cancelled', 5000)
+
+    def scan_failed(self, from_profile: str, error: str, incremental: bool):
+        self.hide_scan_progress(from_profile)
+        if incremental:
+            # The file is probably still being written, the next change will reload it
+            self.ui.statusbar.showMessage(
+                f'Profile {from_profile} could not be reloaded: {error}', 5000
+            )
+            return
+
+        msgbox = QMessageBox()
+        msgbox.setWindowTitle(f'Profile {from_profile}')
+        msgbox.setIcon(QMessageBox.Warning)
+        msgbox.setText(f'The profile could not be read:\n{error}')
+        msgbox.exec_()
+
+    def update_entry_items(self, model_id: str) -> bool:
+        """Updates in place the items of the three trees for an entry whose values changed.
+
+        Args:
+            model_id (str): Id of the entry.
+
+        Returns:
+            bool: False if the rows of the entry don't match anymore and have to be rebuilt.
+        """
+        merged_model = self.session.merged.get(model_id)
+        merged_items = self.item_registry.items(self.session, FROM_MERGED, model_id)
+        if merged_model is None:
+            return False
+        if not merged_items:
+            # The entry is in a group that wasn't expanded yet
+            groups = None
+            if type(merged_model) is models.ProfileFieldLevelSecurity:
+                groups = self.groups_items.get(
+                    (merged_model.model_name, merged_model.object_name)
+                )
+            return groups is not None and not groups[0].materialized
+
+        toggle_names = [
+            name for name, value in merged_model.toggles.items() if value is not None
+        ]
+        if [item.toggle_name for item in merged_items if item.toggle_name] != toggle_names:
+            return False
+
+        sources = [
+            (self.ui.tree_a, self.session.a.properties.get(model_id)),
+            (self.ui.tree_b, self.session.b.properties.get(model_id)),
+        ]
+        for merged_item in merged_items:
+            path = ProfileMergerUI.item_path(merged_item)
+            if len(path) < 2:
+                return False
+
+            # Items of the A and B trees are in the same position than the merged item
+            for tree, model in sources:
+                item = ProfileMergerUI.item_at_path(tree, path)
+                if (type(item) is UiProfileItem) != (model is not None):
+                    return False
+                if model is not None:
+                    ProfileMergerUI.update_item(item, model)
+
+            ProfileMergerUI.update_item(merged_item, merged_model)
+        return True
     ##
 
     ##
     # Static Methods
     def replicate_item(
-        global_dict: dict, item_list: list, parent_item: QTreeWidgetItem, profile_field_id: str,
-        toggle_name=None
-    ):
+        global_dict: dict, parent_item: QTreeWidgetItem, profile_field_id: str, toggle_name=None
+    ) -> QTreeWidgetItem:
         """Replicates a UiProfileItem below a parent_item (category) for the A or B QTrees,
         if the item is not found on the current list it generates an empty item for spacing.
 
@@ -659,6 +1676,9 @@ class ProfileMergerUI(QMainWindow):
             parent_item (QTreeWidgetItem): Category item that will hold the replicated item
             profile_field_id (str): Id of the field
             toggle_name (str): Name of the toggable value if it's a toggle.
+
+        Returns:
+            QTreeWidgetItem: The UiProfileItem or the empty item.
         """
         if global_dict.get(profile_field_id):
             profile_field = global_dict[profile_field_id]
@@ -677,31 +1697,74 @@ class ProfileMergerUI(QMainWindow):
                 )
             else:
                 item = UiProfileItem(profile_field, parent_item)
-            item_list.append(item)
         else:
             item = QTreeWidgetItem(parent_item)
-            item.setText(0, '')
-        item = None  # remove ref
+        return item
 
-    def expand_all_categories(expand: bool):
-        """ Expand or Collapses all the categories
+    def item_operations(merged_item: UiProfileItem, toggle_value) -> list:
+        """Returns the operations of setting a value on a merged item, for record_changes.
 
         Args:
-            expand (bool): Expand the categories or collpase them?
+            merged_item (UiProfileItem): Item of the merged QTree, before it changes.
+            toggle_value: Value that will be set, None only enables the item.
         """
-        categories_lists = [
-            GlobalEstate.categories_items_a.values(),
-            GlobalEstate.categories_items_b.values(),
-            GlobalEstate.categories_items_merged.values(),
-        ]
+        operations = []
+        if toggle_value is not None:
+            toggle_name = merged_item.toggle_name
+            if toggle_name is None:
+                toggle_name = rerere.VALUE_TOGGLE
+            operations.append(
+                undo.Operation(merged_item.id, toggle_name, merged_item.toggle_value, toggle_value)
+            )
+        if merged_item.item_disabled:
+            operations.append(undo.Operation(merged_item.id, rerere.DISABLED_TOGGLE, True, False))
+        return operations
+
+    def item_path(item: QTreeWidgetItem) -> list:
+        """Returns the rows from the top level item to an item, ex: [category, group, item].
+        """
+        path = []
+        while item is not None:
+            parent_item = item.parent()
+            if parent_item is None:
+                path.append(item.treeWidget().indexOfTopLevelItem(item))
+            else:
+                path.append(parent_item.indexOfChild(item))
+            item = parent_item
+        path.reverse()
+        return path
+
+    def item_at_path(tree: QTreeWidget, path: list):
+        """Returns the item of a QTree at the rows of item_path, None if it doesn't exist.
+        """
+        item = tree.topLevelItem(path[0]) if path else None
+        for row in path[1:]:
+            if item is None:
+                return None
+            item = item.child(row)
+        return item
+
+    def update_item(item: UiProfileItem, model: models.ProfileFieldType):
+        """Points an item to a new model of the same entry and refreshes its value.
+
+        Args:
+            item (UiProfileItem): Item to update.
+            model (ProfileFieldType): New model for the item.
+        """
+        model.model_disabled = item.model_ref.model_disabled
+        item.model_ref = model
+        if item.toggle_name is not None:
+            item.toggle_value = model.toggles[item.toggle_name]
+        elif type(model) is models.ProfileSingleValue and item.toggle_value is not None:
+            item.toggle_value = model.value
+        else:
+            item.item_disabled = model.model_disabled
 
-        for item_list in categories_lists:
-            for item in item_list:
-                item.setExpanded(expand)
     ##
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = QApplication([])
 
     # Setup Style
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Interning memory benchmark.
+
+Measures with tracemalloc the memory taken by profiles loaded next to a first one, the shared
+strings of the later profiles only cost memory when they aren't interned.
+Run it from the repository root, on the parent commit of the interning change for the baseline:
+
+    python benchmarks/intern_memory.py
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profile_parser  # noqa: E402
+
+OBJECTS = 600
+FIELDS_PER_OBJECT = 60
+CLASSES = 2000
+
+
+def bool_text(value: bool) -> str:
+    return 'true' if value else 'false'
+
+
+def write_profile(file_path: str, seed: int):
+    """Writes a synthetic profile of ~39k entries, the seed changes the toggles but not the
+    names, like two profiles of the same org.
+    """
+    with open(file_path, 'w', encoding='utf-8') as file_pointer:
+        write = file_pointer.write
+        write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        write('<Profile xmlns="http://soap.sforce.com/2006/04/metadata">\n')
+        for i in range(OBJECTS):
+            write(
+                '    <objectPermissions>\n'
+                '        <allowCreate>true</allowCreate>\n'
+                f'        <allowDelete>{bool_text((i + seed) % 3 == 0)}</allowDelete>\n'
+                '        <allowEdit>true</allowEdit>\n'
+                '        <allowRead>true</allowRead>\n'
+                '        <modifyAllRecords>false</modifyAllRecords>\n'
+                f'        <object>Obj{i}__c</object>\n'
+                '        <viewAllRecords>false</viewAllRecords>\n'
+                '    </objectPermissions>\n'
+            )
+        for i in range(OBJECTS):
+            for j in range(FIELDS_PER_OBJECT):
+                write(
+                    '    <fieldPermissions>\n'
+                    f'        <editable>{bool_text((i + j + seed) % 2 == 0)}</editable>\n'
+                    f'        <field>Obj{i}__c.Field{j}__c</field>\n'
+                    '        <readable>true</readable>\n'
+                    '    </fieldPermissions>\n'
+                )
+        for i in range(OBJECTS):
+            write(
+                '    <layoutAssignments>\n'
+                f'        <layout>Obj{i}__c-Obj{i}__c Layout</layout>\n'
+                '    </layoutAssignments>\n'
+            )
+        for i in range(CLASSES):
+            write(
+                '    <classAccesses>\n'
+                f'        <apexClass>Class{i}</apexClass>\n'
+                f'        <enabled>{bool_text((i + seed) % 2 == 0)}</enabled>\n'
+                '    </classAccesses>\n'
+            )
+        write('    <userLicense>Salesforce</userLicense>\n')
+        write('</Profile>\n')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument(
+        '--extra', type=int, default=2, help='Profiles loaded after the first one (default: 2)'
+    )
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_paths = []
+        for seed in range(args.extra + 1):
+            file_path = os.path.join(temp_dir, f'profile_{seed}.profile')
+            write_profile(file_path, seed)
+            file_paths.append(file_path)
+
+        loaded = [profile_parser.parse_profile(file_paths[0])]
+        gc.collect()
+        tracemalloc.start()
+        before, _peak = tracemalloc.get_traced_memory()
+        for file_path in file_paths[1:]:
+            loaded.append(profile_parser.parse_profile(file_path))
+        gc.collect()
+        after, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size = os.path.getsize(file_paths[0])
+
+    print(f'{len(loaded[0][1])} entries per profile, {size / 2 ** 20:.1f} MB')
+    print(f'{args.extra} extra profiles: {(after - before) / 2 ** 20:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Component Index.
+
+This module finds the profile entries that reference components missing from the target branch,
+ex: the access to an Apex class that was deleted, which makes the deploy fail.
+
+The components are read from a package.xml manifest or from a source tree, in source format
+(force-app/main/default/classes/Foo.cls-meta.xml) or metadata format (src/classes/Foo.cls,
+src/objects/Account.object), into a set of names per metadata type. The entries are then checked
+in one pass with a lookup per reference.
+
+Only the metadata types that the index lists are checked, a manifest without ApexClass members
+or with the '*' wildcard says nothing about the classes. Standard components aren't in the
+source trees and are never dangling, ex: standard objects and fields, standard-Account tabs or
+standard__Sales apps. Names are compared without case, like Salesforce does.
+
+Attributes:
+    CATEGORY_REFERENCES (dict): model_name -> (metadata type, attribute) of the components an
+        entry references.
+    METADATA_DIRECTORIES (dict): Directory of a source tree -> metadata type of its files.
+    OBJECT_CHILDREN (dict): Directory in an object or element of a .object file -> metadata type,
+        the names of these components are 'Object.Name'.
+    WILDCARD (str): Member of a manifest that stands for every component of a type.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import copy
+import os
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+import profile_parser
+
+CATEGORY_REFERENCES = {
+    'applicationVisibilities': (('CustomApplication', 'application'),),
+    'categoryGroupVisibilities': (('DataCategoryGroup', 'dataCategoryGroup'),),
+    'classAccesses': (('ApexClass', 'apexClass'),),
+    'customMetadataTypeAccesses': (('CustomObject', 'name'),),
+    'customPermissions': (('CustomPermission', 'name'),),
+    'customSettingAccesses': (('CustomObject', 'name'),),
+    'externalDataSourceAccesses': (('ExternalDataSource', 'externalDataSource'),),
+    'fieldLevelSecurities': (('CustomField', 'field'),),
+    'fieldPermissions': (('CustomField', 'field'),),
+    'flowAccesses': (('Flow', 'flow'),),
+    'layoutAssignments': (('Layout', 'layout'), ('RecordType', 'recordType')),
+    'objectPermissions': (('CustomObject', 'object'),),
+    'pageAccesses': (('ApexPage', 'apexPage'),),
+    'recordTypeVisibilities': (('RecordType', 'recordType'),),
+    'tabVisibilities': (('CustomTab', 'tab'),),
+}
+
+METADATA_DIRECTORIES = {
+    'applications': 'CustomApplication',
+    'classes': 'ApexClass',
+    'customPermissions': 'CustomPermission',
+    'datacategorygroups': 'DataCategoryGroup',
+    'dataSources': 'ExternalDataSource',
+    'flows': 'Flow',
+    'layouts': 'Layout',
+    'pages': 'ApexPage',
+    'tabs': 'CustomTab',
+}
+
+OBJECT_CHILDREN = {
+    'fields': 'CustomField',
+    'recordTypes': 'RecordType',
+}
+
+WILDCARD = '*'
+
+
+class ComponentIndex:
+    """Names of the components of a branch by metadata type.
+
+    Attributes:
+        members (dict): Metadata type -> set of the lower case names of its components.
+        wildcards (set): Metadata types listed with WILDCARD, they aren't checked.
+    """
+    def __init__(self):
+        self.members = {}
+        self.wildcards = set()
+
+    def __len__(self):
+        return sum(len(names) for names in self.members.values())
+
+    def add(self, metadata_type: str, member: str):
+        if member == WILDCARD:
+            self.wildcards.add(metadata_type)
+            return
+        names = self.members.get(metadata_type)
+        if names is None:
+            names = self.members[metadata_type] = set()
+        names.add(member.lower())
+
+    def checks(self, metadata_type: str) -> bool:
+        """Returns if the index knows every component of a type.
+        """
+        return metadata_type in self.members and metadata_type not in self.wildcards
+
+    def missing_reference(self, model) -> tuple:
+        """Returns the first component referenced by an entry that the index doesn't have.
+
+        Args:
+            model (ProfileFieldType): Profile entry.
+
+        Returns:
+            tuple: (metadata type, name) or None if its references exist or aren't checked.
+        """
+        for metadata_type, attribute in CATEGORY_REFERENCES.get(model.model_name, ()):
+            member = getattr(model, attribute, None)
+            if not member:
+                continue
+            for reference_type, reference in ComponentIndex.custom_references(
+                metadata_type, member
+            ):
+                if (self.checks(reference_type)
+                        and reference.lower() not in self.members[reference_type]):
+                    return reference_type, reference
+        return None
+
+    def dangling(self, properties: dict) -> list:
+        """Returns the entries that reference missing components, in one pass.
+
+        Returns:
+            list: (model, metadata type, name) of each dangling entry.
+        """
+        dangling = []
+        for model in properties.values():
+            if model.model_name not in CATEGORY_REFERENCES:
+                continue
+            reference = self.missing_reference(model)
+            if reference is not None:
+                dangling.append((model, *reference))
+        return dangling
+
+    def prune(self, properties: dict) -> tuple:
+        """Disables the entries that reference missing components, the given dict isn't modified.
+
+        Returns:
+            tuple: (new properties dict, model_ids of the entries that changed, dangling entries
+                as returned by dangling)
+        """
+        new_properties = dict(properties)
+        changed_ids = []
+        dangling = self.dangling(properties)
+        for model, _metadata_type, _member in dangling:
+            if model.model_disabled:
+                continue
+            new_model = copy.copy(model)
+            new_model.model_disabled = True
+            new_properties[model.model_id] = new_model
+            changed_ids.append(model.model_id)
+        return new_properties, changed_ids, dangling
+
+    ##
+    # Loading
+    def read_manifest(self, manifest_filepath: str):
+        """Adds the members of a package.xml manifest, streaming its types.
+        """
+        tree_root = None
+        namespace = ''
+        with open(manifest_filepath, 'rb') as file_pointer:
+            for event, element in ElementTree.iterparse(file_pointer, events=('start', 'end')):
+                if event == 'start':
+                    if tree_root is None:
+                        tree_root = element
+                        namespace = profile_parser.get_namespace(tree_root)
+                    continue
+                if element.tag.replace(namespace, '') != 'types':
+                    continue
+
+                metadata_type = element.findtext(f'{namespace}name', '').strip()
+                for member in element.iterfind(f'{namespace}members'):
+                    self.add(metadata_type, (member.text or '').strip())
+                tree_root.clear()
+
+    def read_source_tree(self, source_dir: str):
+        """Adds the components of a source tree, by the names of its files.
+        """
+        for dir_path, dir_names, file_names in os.walk(source_dir):
+            dir_names[:] = [
+                name for name in dir_names
+                if not name.startswith('.') and name != 'node_modules'
+            ]
+            dir_name = os.path.basename(dir_path)
+            parent_path = os.path.dirname(dir_path)
+
+            metadata_type = METADATA_DIRECTORIES.get(dir_name)
+            if metadata_type is not None:
+                for file_name in file_names:
+                    self.add(metadata_type, ComponentIndex.member_name(file_name))
+
+            elif dir_name == 'objects':
+                for name in dir_names:
+                    self.add('CustomObject', unquote(name))
+                for file_name in file_names:
+                    if file_name.endswith('.object'):
+                        self.read_object_file(os.path.join(dir_path, file_name))
+
+            elif (dir_name in OBJECT_CHILDREN
+                    and os.path.basename(os.path.dirname(parent_path)) == 'objects'):
+                object_name = unquote(os.path.basename(parent_path))
+                for file_name in file_names:
+                    self.add(
+                        OBJECT_CHILDREN[dir_name],
+                        f'{object_name}.{ComponentIndex.member_name(file_name)}'
+                    )
+
+    def read_object_file(self, object_filepath: str):
+        """Adds an object of the metadata format and the fields and record types in its file.
+        """
+        object_name = ComponentIndex.member_name(os.path.basename(object_filepath))
+        self.add('CustomObject', object_name)
+
+        depth = 0
+        namespace = ''
+        with open(object_filepath, 'rb') as file_pointer:
+            for event, element in ElementTree.iterparse(file_pointer, events=('start', 'end')):
+                if event == 'start':
+                    if depth == 0:
+                        namespace = profile_parser.get_namespace(element)
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth != 1:
+                    continue
+
+                metadata_type = OBJECT_CHILDREN.get(element.tag.replace(namespace, ''))
+                if metadata_type is not None:
+                    full_name = element.findtext(f'{namespace}fullName', '').strip()
+                    if full_name:
+                        self.add(metadata_type, f'{object_name}.{full_name}')
+                element.clear()
+    ##
+
+    ##
+    # Static Methods
+    def member_name(file_name: str) -> str:
+        """Returns the component name of a file of a source tree, ex: 'Foo' for Foo.cls-meta.xml.
+        """
+        if file_name.endswith('-meta.xml'):
+            file_name = file_name[:-len('-meta.xml')]
+        name, _dot, extension = file_name.rpartition('.')
+        return unquote(name or extension)
+
+    def custom_references(metadata_type: str, member: str) -> list:
+        """Returns the custom components that a reference needs, ex: a custom field of a custom
+        object needs both. Standard components aren't returned.
+
+        Returns:
+            list: (metadata type, name)
+        """
+        if metadata_type in ('CustomField', 'RecordType'):
+            object_name, _dot, child_name = member.partition('.')
+            references = []
+            if '__' in object_name:
+                references.append(('CustomObject', object_name))
+            if metadata_type == 'RecordType' or child_name.endswith('__c'):
+                references.append((metadata_type, member))
+            return references
+        if metadata_type == 'CustomObject':
+            return [(metadata_type, member)] if '__' in member else []
+        if metadata_type == 'CustomTab' and member.startswith('standard-'):
+            return []
+        if metadata_type == 'CustomApplication' and member.startswith('standard__'):
+            return []
+        return [(metadata_type, member)]
+    ##
+
+    def __str__(self):
+        return f'<ComponentIndex: {len(self)} components, {len(self.members)} types>'
+
+
+def load_components(path: str) -> ComponentIndex:
+    """Builds the index of a package.xml manifest or of a source tree directory.
+
+    Raises:
+        ValueError: If the path is neither a directory nor an XML file.
+    """
+    component_index = ComponentIndex()
+    if os.path.isdir(path):
+        component_index.read_source_tree(path)
+    elif path.endswith('.xml'):
+        component_index.read_manifest(path)
+    else:
+        raise ValueError(f'{path} is not a package.xml manifest or a source directory')
+    return component_index
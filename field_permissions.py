@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Field Permissions Generator.
+
+This module adds the fieldPermissions entries of new fields to a batch of profiles, so they
+don't have to be added by hand to every profile when fields land.
+
+The fields are read from the objects/<Object>/fields/<Field>.field-meta.xml files of a source
+tree. The subtrees of the source tree are walked in parallel and then its objects are scanned in
+parallel, a process lists the fields of an object and sniffs its files with regular expressions
+instead of parsing them. Fields that can't have field permissions are skipped: required and
+master-detail fields and the fields of custom metadata types and platform events.
+
+The missing entries get default toggles (no access unless asked for) and are patched into each
+profile among the entries of its category, the rest of the file is copied as it is. Formula,
+roll-up summary and auto number fields are never editable.
+
+Attributes:
+    required_regex (Pattern): Regex for a required field.
+    type_regex (Pattern): Regex for the type of a field, the group is the type.
+    formula_regex (Pattern): Regex for a formula field.
+    FIELD_SUFFIX (str): Ending of the field file names.
+    SKIPPED_TYPES (tuple): Types of the fields that can't have field permissions.
+    READ_ONLY_TYPES (tuple): Types of the fields that can't be editable.
+    NO_FIELD_PERMISSIONS (tuple): Endings of the objects whose fields can't have field
+        permissions.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import collections
+import multiprocessing
+import os
+import re
+from urllib.parse import unquote
+
+import models
+import profile_index
+import profile_writer
+
+required_regex = re.compile(rb'<required>\s*true\s*</required>')
+type_regex = re.compile(rb'<type>\s*([^<\s]+)\s*</type>')
+formula_regex = re.compile(rb'<formula>')
+
+FIELD_SUFFIX = '.field-meta.xml'
+SKIPPED_TYPES = ('MasterDetail',)
+READ_ONLY_TYPES = ('AutoNumber', 'Summary')
+NO_FIELD_PERMISSIONS = ('__mdt', '__e')
+
+
+def sniff_field(data: bytes) -> tuple:
+    """Reads what matters of a field file without parsing it.
+
+    Returns:
+        tuple: (skipped, read_only)
+    """
+    if required_regex.search(data):
+        return True, False
+    match = type_regex.search(data)
+    field_type = match.group(1).decode('utf-8') if match else ''
+    if field_type in SKIPPED_TYPES:
+        return True, False
+    return False, field_type in READ_ONLY_TYPES or formula_regex.search(data) is not None
+
+
+def scan_object(object_dir: str) -> tuple:
+    """Lists and sniffs the fields of an object directory, runs in a pool process.
+
+    Returns:
+        tuple: ({'Object.Field': read_only} of the fields that can have field permissions,
+            number of skipped fields)
+    """
+    object_name = unquote(os.path.basename(object_dir))
+    fields = {}
+    skipped = 0
+    try:
+        entries = list(os.scandir(os.path.join(object_dir, 'fields')))
+    except FileNotFoundError:
+        return fields, skipped
+
+    for entry in entries:
+        if not entry.name.endswith(FIELD_SUFFIX):
+            continue
+        with open(entry.path, 'rb') as file_pointer:
+            is_skipped, read_only = sniff_field(file_pointer.read())
+        if is_skipped:
+            skipped += 1
+        else:
+            field_name = unquote(entry.name[:-len(FIELD_SUFFIX)])
+            fields[f'{object_name}.{field_name}'] = read_only
+    return fields, skipped
+
+
+def find_object_dirs(source_dir: str) -> list:
+    """Returns the object directories of the objects directories in a source tree, the objects
+    themselves are left for scan_object.
+    """
+    object_dirs = []
+    for dir_path, dir_names, _file_names in os.walk(source_dir):
+        dir_names[:] = [
+            name for name in dir_names if not name.startswith('.') and name != 'node_modules'
+        ]
+        if os.path.basename(dir_path) != 'objects':
+            continue
+        object_dirs.extend(
+            os.path.join(dir_path, name) for name in dir_names
+            if not name.endswith(NO_FIELD_PERMISSIONS)
+        )
+        dir_names[:] = []
+    return sorted(object_dirs)
+
+
+def split_source_tree(source_dir: str, count: int) -> list:
+    """Splits a source tree into subtrees that find_object_dirs can walk in parallel, the
+    directories are opened breadth first until there are count subtrees. An objects directory is
+    never opened, its children are the objects.
+    """
+    pending = collections.deque([source_dir])
+    subtrees = []
+    while pending and len(pending) + len(subtrees) < count:
+        dir_path = pending.popleft()
+        if os.path.basename(dir_path) == 'objects':
+            subtrees.append(dir_path)
+            continue
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            continue
+        pending.extend(
+            entry.path for entry in entries
+            if entry.is_dir() and not entry.name.startswith('.') and entry.name != 'node_modules'
+        )
+    subtrees.extend(pending)
+    return subtrees
+
+
+def scan_fields(source_dir: str, jobs=None) -> tuple:
+    """Builds the index of the fields of a source tree. The subtrees are walked in parallel and
+    then the objects they have are scanned in parallel.
+
+    Args:
+        source_dir (str): Source tree, ex: force-app/main/default.
+        jobs (int): (Optional) Processes to use, one per CPU by default.
+
+    Returns:
+        tuple: ({'Object.Field': read_only}, number of skipped fields)
+    """
+    jobs = jobs or os.cpu_count() or 1
+    subtrees = split_source_tree(source_dir, jobs) if jobs > 1 else [source_dir]
+    fields = {}
+    skipped = 0
+
+    # A tree that doesn't split is walked here, the pool is only started if it has objects
+    object_dirs = None
+    if len(subtrees) <= 1:
+        object_dirs = find_object_dirs(source_dir)
+        jobs = min(jobs, len(object_dirs))
+        if jobs <= 1:
+            for object_fields, object_skipped in map(scan_object, object_dirs):
+                fields.update(object_fields)
+                skipped += object_skipped
+            return fields, skipped
+
+    with multiprocessing.Pool(jobs) as pool:
+        if object_dirs is None:
+            object_dirs = []
+            for subtree_object_dirs in pool.imap_unordered(find_object_dirs, subtrees):
+                object_dirs.extend(subtree_object_dirs)
+            object_dirs.sort()
+
+        for object_fields, object_skipped in pool.imap_unordered(
+            scan_object, object_dirs, chunksize=8
+        ):
+            fields.update(object_fields)
+            skipped += object_skipped
+    return fields, skipped
+
+
+def add_field_permissions(
+    profile_filepath: str, fields: dict, readable=False, editable=False
+) -> list:
+    """Adds the fieldPermissions entries that a profile is missing, only that category is parsed
+    and the file is patched in place.
+
+    Args:
+        profile_filepath (str): Profile to update.
+        fields (dict): {'Object.Field': read_only} as returned by scan_fields.
+        readable (bool): (default=False) Readable value of the new entries.
+        editable (bool): (default=False) Editable value of the new entries, it implies readable.
+
+    Returns:
+        list: Fields added, sorted.
+    """
+    base_index = profile_index.ProfileIndex(profile_filepath)
+    category = models.ProfileFieldLevelSecurity().model_name
+    base_properties = base_index.parse_categories([category])
+
+    properties = dict(base_properties)
+    added = []
+    for field_name, read_only in fields.items():
+        if field_name in base_properties:
+            continue
+        field_editable = editable and not read_only
+        properties[field_name] = models.ProfileFieldLevelSecurity(
+            editable=field_editable, field=field_name, readable=readable or editable
+        )
+        added.append(field_name)
+
+    if added:
+        profile_writer.patch_profile(properties, base_properties, base_index, profile_filepath)
+    return sorted(added)
+
+
+_worker_fields = None
+
+
+def set_worker_fields(fields: dict):
+    """Initializer of the pool processes, the field index is sent once per process.
+    """
+    global _worker_fields
+    _worker_fields = fields
+
+
+def profile_task(task: tuple) -> tuple:
+    """Runs add_field_permissions in a pool process.
+
+    Args:
+        task (tuple): (profile_filepath, readable, editable)
+
+    Returns:
+        tuple: (profile_filepath, fields added)
+    """
+    profile_filepath, readable, editable = task
+    return profile_filepath, add_field_permissions(
+        profile_filepath, _worker_fields, readable, editable
+    )
+
+
+def add_to_profiles(
+    profile_filepaths: list, fields: dict, readable=False, editable=False, jobs=None
+) -> list:
+    """Adds the missing fieldPermissions entries to a batch of profiles, in parallel.
+
+    Returns:
+        list: (profile_filepath, fields added) of each profile.
+    """
+    tasks = [(profile_filepath, readable, editable) for profile_filepath in profile_filepaths]
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+    if jobs <= 1:
+        return [
+            (profile_filepath, add_field_permissions(profile_filepath, fields, readable, editable))
+            for profile_filepath in profile_filepaths
+        ]
+    with multiprocessing.Pool(jobs, initializer=set_worker_fields, initargs=(fields,)) as pool:
+        return pool.map(profile_task, tasks, chunksize=1)
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Profile History.
+
+This module has a local history store for parsed profiles.
+
+Every recorded version is stored as a delta against the previous one, keyed by the category
+(model_name) and the model_id of each entry. A full base snapshot (the pickled models, like a
+workspace) is written every `compact_every` versions, or sooner once the deltas since the last
+base changed more than a quarter of the entries. Rebuilding any version loads one base and a
+short chain of deltas, which costs a fraction of re-parsing the old XML.
+
+The manifest is a log, recording a version appends its record instead of rewriting it.
+
+Store layout:
+    <store_path>/manifest.log        Pickled records of the versions and their entry changes.
+    <store_path>/v000001.pickle      Base snapshot or delta of each version.
+
+Usage:
+    python history.py record <store_path> <profile_file> [--label LABEL]
+    python history.py list <store_path>
+    python history.py show <store_path> <version> [--category CATEGORY]
+    python history.py log <store_path> <category> <model_id>
+
+Attributes:
+    DEFAULT_COMPACT_EVERY (int): Number of versions between base snapshots.
+    BASE_CHANGE_RATIO (float): Share of the entries changed by the deltas since the last base
+        that makes the next version a base.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import argparse
+import gc
+import os
+import pickle
+import time
+
+import models
+import profile_parser
+
+DEFAULT_COMPACT_EVERY = 10
+BASE_CHANGE_RATIO = 0.25
+
+OP_ADD = 'add'
+OP_REMOVE = 'remove'
+OP_CHANGE = 'change'
+
+
+class ProfileVersion:
+    """Metadata of a recorded version.
+
+    Attributes:
+        version (int): Version number, starts at 1.
+        label (str): Free text label, ex: a release name.
+        timestamp (float): When the version was recorded.
+        is_base (bool): The version file is a full snapshot instead of a delta.
+    """
+    def __init__(self, version: int, label: str, timestamp: float, is_base: bool):
+        self.version = version
+        self.label = label
+        self.timestamp = timestamp
+        self.is_base = is_base
+
+    def __str__(self):
+        kind = 'base' if self.is_base else 'delta'
+        recorded = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.timestamp))
+        return f'<ProfileVersion: {self.version} {kind} {recorded} {self.label}>'
+
+
+class ProfileHistory:
+    """Local history store of a profile.
+
+    Args:
+        store_path (str): Directory that holds the history, it's created if missing.
+        compact_every (int): (default=DEFAULT_COMPACT_EVERY) Versions between base snapshots.
+
+    Attributes:
+        versions (List[ProfileVersion]): Recorded versions, ordered.
+        entry_index (dict): (category, model_id) -> list of (version, op, changes), where
+            changes is a dict of field -> (old value, new value).
+
+    Raises:
+        ValueError: If the store was written with the old manifest format.
+    """
+    def __init__(self, store_path: str, compact_every=DEFAULT_COMPACT_EVERY):
+        self.store_path = store_path
+        self.compact_every = max(1, compact_every)
+        self.versions = []
+        self.entry_index = {}
+        self.__head_states = None
+        self.__changes_since_base = 0
+        self.__manifest_size = 0
+
+        if os.path.exists(os.path.join(self.store_path, 'manifest.pickle')):
+            raise ValueError(
+                f'{self.store_path} was written by an older version of history.py, '
+                'record the profile in a new store'
+            )
+        os.makedirs(self.store_path, exist_ok=True)
+        self.__load_manifest()
+
+    ##
+    # Storage
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.store_path, 'manifest.log')
+
+    def version_path(self, version: int) -> str:
+        return os.path.join(self.store_path, f'v{version:06d}.pickle')
+
+    def __load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'rb') as file_pointer:
+            while True:
+                try:
+                    record = pickle.load(file_pointer)
+                except (EOFError, pickle.UnpicklingError):
+                    # End of the log or a record cut by a crash, it's overwritten by the next one
+                    break
+                self.__apply_record(record)
+                self.__manifest_size = file_pointer.tell()
+
+    def __apply_record(self, record: tuple):
+        if record[0] == 'base':
+            self.versions[record[1] - 1].is_base = True
+            self.__changes_since_base = 0
+            return
+
+        _kind, version_fields, index_entries = record
+        version = ProfileVersion(*version_fields)
+        self.versions.append(version)
+        if version.is_base:
+            self.__changes_since_base = 0
+        else:
+            self.__changes_since_base += len(index_entries)
+        for key, op, changes in index_entries:
+            self.entry_index.setdefault(key, []).append((version.version, op, changes))
+
+    def __append_manifest(self, record: tuple):
+        with open(self.manifest_path, 'ab') as file_pointer:
+            file_pointer.truncate(self.__manifest_size)
+            pickle.dump(record, file_pointer, protocol=pickle.HIGHEST_PROTOCOL)
+            file_pointer.flush()
+            os.fsync(file_pointer.fileno())
+            self.__manifest_size = file_pointer.tell()
+        self.__apply_record(record)
+
+    @staticmethod
+    def __dump(obj, path: str):
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as file_pointer:
+            pickle.dump(obj, file_pointer, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    def __load_version_file(self, version: int):
+        with open(self.version_path(version), 'rb') as file_pointer:
+            # Unpickling creates many objects at once, collecting in between only slows it down
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                return pickle.load(file_pointer)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+
+    def __chain(self, version: int) -> tuple:
+        """Returns the base properties of a version and the deltas that follow it.
+        """
+        if version < 1 or version > len(self.versions):
+            raise KeyError(f'Version {version} not found in {self.store_path}')
+
+        base_version = version
+        while not self.versions[base_version - 1].is_base:
+            base_version -= 1
+        deltas = [
+            self.__load_version_file(delta_version)
+            for delta_version in range(base_version + 1, version + 1)
+        ]
+        return self.__load_version_file(base_version), deltas
+    ##
+
+    ##
+    # States
+    @staticmethod
+    def states_from_properties(properties: dict) -> dict:
+        """Returns the plain states of a properties dict keyed by (category, model_id).
+
+        Args:
+            properties (dict): Profile properties, as returned by profile_parser.parse_profile.
+        """
+        return {
+            (model.model_name, model.model_id): models.model_state(model)
+            for model in properties.values()
+        }
+
+    @staticmethod
+    def diff_states(old_states: dict, new_states: dict) -> list:
+        """Returns the per-entry delta between two states dicts.
+
+        Returns:
+            list: of (op, key, value) where value is the full state for OP_ADD, None for
+                OP_REMOVE and a dict of field -> (old, new) for OP_CHANGE.
+        """
+        delta = []
+        for key, state in new_states.items():
+            old_state = old_states.get(key)
+            if old_state is None:
+                delta.append((OP_ADD, key, state))
+            elif old_state != state:
+                changes = {
+                    field: (old_state.get(field), value)
+                    for field, value in state.items()
+                    if old_state.get(field) != value
+                }
+                delta.append((OP_CHANGE, key, changes))
+        for key in old_states.keys() - new_states.keys():
+            delta.append((OP_REMOVE, key, None))
+        return delta
+
+    @staticmethod
+    def apply_delta(states: dict, delta: list):
+        """Applies a delta returned by diff_states to a states dict, in place.
+        """
+        for op, key, value in delta:
+            if op == OP_ADD:
+                states[key] = value
+            elif op == OP_REMOVE:
+                states.pop(key, None)
+            else:
+                state = dict(states[key])
+                for field, (_old, new) in value.items():
+                    state[field] = new
+                states[key] = state
+
+    def states(self, version: int) -> dict:
+        """Rebuilds the states of a version from its base snapshot and the following deltas.
+
+        Args:
+            version (int): Version number.
+
+        Raises:
+            KeyError: If the version wasn't recorded.
+        """
+        if version == len(self.versions) and self.__head_states is not None:
+            return dict(self.__head_states)
+
+        base_properties, deltas = self.__chain(version)
+        states = ProfileHistory.states_from_properties(base_properties)
+        for delta in deltas:
+            ProfileHistory.apply_delta(states, delta)
+        return states
+    ##
+
+    ##
+    # Public API
+    def record(self, properties: dict, label='') -> int:
+        """Records a parsed profile as a new version.
+
+        Args:
+            properties (dict): Profile properties, as returned by profile_parser.parse_profile.
+            label (str): Free text label for the version.
+
+        Returns:
+            int: The new version number.
+        """
+        new_states = ProfileHistory.states_from_properties(properties)
+        old_states = self.states(len(self.versions)) if self.versions else {}
+        delta = ProfileHistory.diff_states(old_states, new_states)
+
+        version = len(self.versions) + 1
+        last_base = max((v.version for v in self.versions if v.is_base), default=0)
+        is_base = (
+            last_base == 0 or version - last_base >= self.compact_every
+            or self.__changes_since_base + len(delta) > len(new_states) * BASE_CHANGE_RATIO
+        )
+
+        ProfileHistory.__dump(
+            dict(properties) if is_base else delta, self.version_path(version)
+        )
+        self.__append_manifest((
+            'version', (version, label, time.time(), is_base),
+            [(key, op, {} if op != OP_CHANGE else value) for op, key, value in delta]
+        ))
+        self.__head_states = new_states
+        return version
+
+    def record_file(self, profile_filepath: str, label='') -> int:
+        """Parses a profile file and records it as a new version.
+        """
+        _namespace, properties = profile_parser.parse_profile(profile_filepath)
+        return self.record(properties, label or os.path.basename(profile_filepath))
+
+    def compact(self):
+        """Writes a base snapshot for the latest version so it rebuilds without deltas.
+        """
+        if not self.versions or self.versions[-1].is_base:
+            return
+        head = self.versions[-1]
+        ProfileHistory.__dump(self.reconstruct(head.version), self.version_path(head.version))
+        self.__append_manifest(('base', head.version))
+
+    def reconstruct(self, version: int, api_version=models.DEFAULT_API_VERSION) -> dict:
+        """Rebuilds the profile properties of a version, keyed by model_id like
+        profile_parser.parse_profile. Only the entries changed since the base are built again.
+
+        Args:
+            version (int): Version number, negative numbers count from the latest (-1).
+            api_version (int): (default=DEFAULT_API_VERSION) Salesforce API Version
+
+        Raises:
+            KeyError: If the version wasn't recorded.
+        """
+        if version < 0:
+            version = len(self.versions) + 1 + version
+
+        properties, deltas = self.__chain(version)
+        for delta in deltas:
+            for op, (model_name, model_id), value in delta:
+                if op == OP_REMOVE:
+                    properties.pop(model_id, None)
+                    continue
+                if op == OP_CHANGE:
+                    state = models.model_state(properties[model_id])
+                    for field, (_old, new) in value.items():
+                        state[field] = new
+                    value = state
+                properties[model_id] = profile_parser.intern_model(
+                    models.model_from_state(model_name, value, api_version)
+                )
+
+        # The strings of the base are shared already, the pickle stores them once
+        for model_id, model in properties.items():
+            if model.api_version != api_version:
+                properties[model_id] = models.model_from_state(
+                    model.model_name, models.model_state(model), api_version
+                )
+        return properties
+
+    def entry_history(self, model_name: str, model_id: str) -> list:
+        """Returns the recorded changes of an entry as a list of (version, op, changes).
+        """
+        return list(self.entry_index.get((model_name, model_id), []))
+
+    def toggle_history(self, model_name: str, model_id: str, toggle_name: str) -> list:
+        """Returns when a toggle of an entry flipped, as a list of (version, old, new).
+        """
+        flips = []
+        for version, op, changes in self.entry_index.get((model_name, model_id), []):
+            if toggle_name in changes:
+                flips.append((version, *changes[toggle_name]))
+        return flips
+    ##
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='SF Profile Merger - Profile History')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    cmd_record = commands.add_parser('record', help='Record a profile file as a new version')
+    cmd_record.add_argument('store_path')
+    cmd_record.add_argument('profile_file')
+    cmd_record.add_argument('--label', default='')
+    cmd_record.add_argument('--compact-every', type=int, default=DEFAULT_COMPACT_EVERY)
+
+    cmd_list = commands.add_parser('list', help='List the recorded versions')
+    cmd_list.add_argument('store_path')
+
+    cmd_show = commands.add_parser('show', help='Print the entries of a version')
+    cmd_show.add_argument('store_path')
+    cmd_show.add_argument('version', type=int)
+    cmd_show.add_argument('--category', default=None)
+
+    cmd_log = commands.add_parser('log', help='Print the history of an entry')
+    cmd_log.add_argument('store_path')
+    cmd_log.add_argument('category')
+    cmd_log.add_argument('model_id')
+
+    args = arg_parser.parse_args(argv)
+
+    try:
+        if args.command == 'record':
+            history = ProfileHistory(args.store_path, args.compact_every)
+            print(history.record_file(args.profile_file, args.label))
+        elif args.command == 'list':
+            for version in ProfileHistory(args.store_path).versions:
+                print(version)
+        elif args.command == 'show':
+            properties = ProfileHistory(args.store_path).reconstruct(args.version)
+            for model in sorted(properties.values(), key=lambda x: x.model_name + x.model_id):
+                if args.category is None or model.model_name == args.category:
+                    print(f'{model} {models.model_state(model)}')
+        elif args.command == 'log':
+            entry_history = ProfileHistory(args.store_path).entry_history(
+                args.category, args.model_id
+            )
+            if not entry_history:
+                raise KeyError(f'{args.category} {args.model_id} not found in {args.store_path}')
+            for version, op, changes in entry_history:
+                print(f'{version}\t{op}\t{changes}')
+    except KeyError as error:
+        arg_parser.error(error.args[0])
+    except ValueError as error:
+        arg_parser.error(str(error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - IP Ranges.
+
+This module coalesces the login IP ranges of profiles. The entries of loginIpRanges are keyed by
+their description and addresses, so a merge keeps every range of both profiles even when they
+overlap or follow each other.
+
+The addresses are read as integers and the ranges are sorted and swept once (O(n log n)), a range
+that overlaps or is next to the previous one extends it. Each coalesced range keeps the source
+ranges it absorbed. IPv4 and IPv6 ranges are coalesced apart, ranges with an address that can't
+be read are kept as they are.
+
+The coalesced ranges are disjoint and sorted, so checking if an address is allowed is a binary
+search (see RangeSet).
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import bisect
+import copy
+import ipaddress
+
+import models
+
+
+class IpRange:
+    """Coalesced range of addresses.
+
+    Attributes:
+        version (int): IP version, 4 or 6.
+        start (int): First address.
+        end (int): Last address.
+        sources (list): ProfileLoginIpRanges absorbed by the range, in address order.
+    """
+    __slots__ = ['version', 'start', 'end', 'sources']
+
+    def __init__(self, version: int, start: int, end: int, sources: list):
+        self.version = version
+        self.start = start
+        self.end = end
+        self.sources = sources
+
+    @property
+    def start_address(self) -> str:
+        return int_to_address(self.version, self.start)
+
+    @property
+    def end_address(self) -> str:
+        return int_to_address(self.version, self.end)
+
+    def to_model(self) -> models.ProfileLoginIpRanges:
+        """Returns the entry of the range. A range with one source returns a copy of it, else the
+        description of the first source with a description is used.
+        """
+        if len(self.sources) == 1:
+            return copy.copy(self.sources[0])
+        description = next(
+            (model.description for model in self.sources if model.description), ''
+        )
+        return models.ProfileLoginIpRanges(
+            description=description, startAddress=self.start_address,
+            endAddress=self.end_address
+        )
+
+    def __str__(self):
+        return f'<IpRange: {self.start_address} - {self.end_address} {len(self.sources)} sources>'
+
+
+def int_to_address(version: int, value: int) -> str:
+    if version == 4:
+        return str(ipaddress.IPv4Address(value))
+    return str(ipaddress.IPv6Address(value))
+
+
+def address_range(model: models.ProfileLoginIpRanges) -> tuple:
+    """Returns (version, start, end) of an entry, its addresses as integers.
+
+    Raises:
+        ValueError: If an address can't be read, the addresses are of different versions or
+            the range is reversed.
+    """
+    start = ipaddress.ip_address((model.startAddress or '').strip())
+    end = ipaddress.ip_address((model.endAddress or '').strip())
+    if start.version != end.version:
+        raise ValueError(f'{model.model_id} mixes IPv{start.version} and IPv{end.version}')
+    if int(start) > int(end):
+        raise ValueError(f'{model.model_id} ends before it starts')
+    return start.version, int(start), int(end)
+
+
+def coalesce(ip_ranges) -> tuple:
+    """Merges the ranges that overlap or are next to each other.
+
+    Args:
+        ip_ranges (iterable): ProfileLoginIpRanges entries.
+
+    Returns:
+        tuple: (list of IpRange sorted by version and address, list of the entries that couldn't
+            be read)
+    """
+    keyed = []
+    invalid = []
+    for model in ip_ranges:
+        try:
+            keyed.append((address_range(model), model))
+        except ValueError:
+            invalid.append(model)
+    keyed.sort(key=lambda x: x[0])
+
+    coalesced = []
+    current = None
+    for (version, start, end), model in keyed:
+        if current is not None and current.version == version and start <= current.end + 1:
+            current.end = max(current.end, end)
+            current.sources.append(model)
+            continue
+        current = IpRange(version, start, end, [model])
+        coalesced.append(current)
+    return coalesced, invalid
+
+
+def coalesce_entries(entries: dict) -> dict:
+    """Coalesces the loginIpRanges entries of a merged category, the entries of other categories
+    are returned as they are.
+
+    Args:
+        entries (dict): Entries of a category keyed by model_id.
+
+    Returns:
+        dict: New entries keyed by model_id, the ranges that absorbed others are new models.
+    """
+    if any(type(model) is not models.ProfileLoginIpRanges for model in entries.values()):
+        return entries
+
+    coalesced, invalid = coalesce(entries.values())
+    merged = {}
+    for ip_range in coalesced:
+        model = ip_range.to_model()
+        merged[model.model_id] = model
+    for model in invalid:
+        merged[model.model_id] = model
+    return merged
+
+
+class RangeSet:
+    """Coalesced ranges indexed for membership checks.
+
+    Args:
+        ip_ranges (iterable): ProfileLoginIpRanges entries.
+
+    Attributes:
+        ranges (list): IpRange list, as returned by coalesce.
+    """
+    def __init__(self, ip_ranges):
+        self.ranges, _invalid = coalesce(ip_ranges)
+        self.__ranges = {}
+        self.__starts = {}
+        for ip_range in self.ranges:
+            self.__ranges.setdefault(ip_range.version, []).append(ip_range)
+            self.__starts.setdefault(ip_range.version, []).append(ip_range.start)
+
+    def find(self, address: str):
+        """Returns the range of an address, None if no range has it.
+
+        Raises:
+            ValueError: If the address can't be read.
+        """
+        ip_address = ipaddress.ip_address(address.strip())
+        value = int(ip_address)
+        starts = self.__starts.get(ip_address.version, [])
+        position = bisect.bisect_right(starts, value) - 1
+        if position < 0:
+            return None
+        ip_range = self.__ranges[ip_address.version][position]
+        return ip_range if value <= ip_range.end else None
+
+    def __contains__(self, address: str) -> bool:
+        return self.find(address) is not None
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __str__(self):
+        return f'<RangeSet: {len(self.ranges)} ranges>'
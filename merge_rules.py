@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Merge Rules.
+
+This module resolves merged entries in bulk from a rules file, instead of clicking each toggle.
+
+Every line of a rules file has a category (model_name, '*' for any), a pattern for the model_id
+and an action, the first rule that matches an entry wins. Patterns are globs ('*', '?', '[...]')
+or regexes between slashes matched from the start of the model_id. Quote the patterns that have
+spaces, and the regexes with single quotes so their backslashes are kept:
+
+    # category          pattern                 action
+    fieldPermissions    Account.*               prefer B
+    userPermissions     ViewAllData             force false
+    objectPermissions   Case                    force allowDelete=false,modifyAllRecords=false
+    classAccesses       TestDataFactory         keep
+    classAccesses       Test*                   drop
+    layoutAssignments   "Account-Account Layout*" prefer A
+    *                   '/.*\.\w+__c$/'          prefer A
+
+Actions:
+    prefer A|B      Take the values of that profile, if it has the entry.
+    force VALUE     Set every toggle of the entry, or only some with name=value pairs.
+    drop            Leave the entry out of the merged profile.
+    keep            Leave the entry as it is, an exception for the rules below it.
+
+The rules are compiled once per category into a matcher: literal patterns and patterns that only
+end with '*' go into a prefix trie, the rest are compiled regexes that are only tried when they
+come before the best match of the trie. The merged entries are resolved in one pass.
+
+Attributes:
+    ACTION_PREFER (str): Take the values of a profile.
+    ACTION_FORCE (str): Set toggle values.
+    ACTION_DROP (str): Disable the entry.
+    ACTION_KEEP (str): Don't touch the entry.
+    ANY_CATEGORY (str): Category of the rules that apply to every category.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import copy
+import fnmatch
+import re
+import shlex
+
+import models
+import utils
+
+ACTION_PREFER = 'prefer'
+ACTION_FORCE = 'force'
+ACTION_DROP = 'drop'
+ACTION_KEEP = 'keep'
+
+ANY_CATEGORY = '*'
+
+glob_chars_regex = re.compile(r'[*?\[]')
+
+
+class MergeRule:
+    """A line of a rules file.
+
+    Args:
+        index (int): Position of the rule, the lowest matching index wins.
+        category (str): model_name the rule applies to, ANY_CATEGORY for all.
+        pattern (str): Glob, or regex between slashes, for the model_id.
+        action (str): ACTION_PREFER, ACTION_FORCE, ACTION_DROP or ACTION_KEEP.
+        argument (str): 'A' or 'B' for ACTION_PREFER, the values for ACTION_FORCE.
+
+    Attributes:
+        values (dict): Toggle name -> value for ACTION_FORCE, the None key sets every toggle.
+        line (int): Line of the rules file, for messages.
+    """
+    def __init__(self, index: int, category: str, pattern: str, action: str, argument='', line=0):
+        self.index = index
+        self.category = category
+        self.pattern = pattern
+        self.action = action
+        self.argument = argument
+        self.values = {}
+        self.line = line
+
+        if action == ACTION_PREFER:
+            self.argument = argument.upper()
+            if self.argument not in ['A', 'B']:
+                raise ValueError(f'Line {line}: prefer needs A or B, got "{argument}"')
+        elif action == ACTION_FORCE:
+            self.values = MergeRule.parse_values(argument, line)
+        elif action not in [ACTION_DROP, ACTION_KEEP]:
+            raise ValueError(f'Line {line}: unknown action "{action}"')
+
+    @property
+    def is_regex(self) -> bool:
+        return len(self.pattern) > 1 and self.pattern.startswith('/') and self.pattern.endswith('/')
+
+    @property
+    def trie_key(self):
+        """(prefix, is_prefix) if the pattern fits the prefix trie, None if it needs a regex.
+        """
+        if self.is_regex:
+            return None
+        if not glob_chars_regex.search(self.pattern):
+            return self.pattern, False
+        if self.pattern.endswith('*') and not glob_chars_regex.search(self.pattern[:-1]):
+            return self.pattern[:-1], True
+        return None
+
+    def compile(self):
+        """Returns the compiled regex of the pattern.
+        """
+        if self.is_regex:
+            return re.compile(self.pattern[1:-1])
+        return re.compile(fnmatch.translate(self.pattern))
+
+    ##
+    # Static Methods
+    def parse_values(argument: str, line=0) -> dict:
+        """Parses the argument of a force action, 'true' or 'name=true,other=false'.
+        """
+        values = {}
+        for pair in argument.split(','):
+            name, _sep, value = pair.rpartition('=')
+            if value.strip().lower() not in ['true', 'false']:
+                raise ValueError(f'Line {line}: force needs true or false, got "{pair}"')
+            values[name.strip() or None] = utils.str_to_bool(value)
+        return values
+    ##
+
+    def __str__(self):
+        return f'<MergeRule: {self.category} {self.pattern} {self.action} {self.argument}>'
+
+
+class PrefixTrie:
+    """Trie of literal and prefix patterns that returns the lowest rule index matching a text.
+
+    Attributes:
+        exact (dict): Literal pattern -> rule index.
+        root (dict): Nodes by character, the '' key holds the index of a prefix that ends there.
+    """
+    def __init__(self):
+        self.exact = {}
+        self.root = {}
+
+    def insert(self, prefix: str, index: int, is_prefix: bool):
+        if not is_prefix:
+            self.exact.setdefault(prefix, index)
+            return
+
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node.setdefault('', index)
+
+    def match(self, text: str, best=None):
+        """Returns the lowest index of the patterns that match text, or best if it's lower.
+        """
+        index = self.exact.get(text)
+        if index is not None and (best is None or index < best):
+            best = index
+
+        node = self.root
+        for char in text:
+            index = node.get('')
+            if index is not None and (best is None or index < best):
+                best = index
+            node = node.get(char)
+            if node is None:
+                return best
+
+        index = node.get('')
+        if index is not None and (best is None or index < best):
+            best = index
+        return best
+
+
+class CategoryMatcher:
+    """Compiled rules of a category, the ANY_CATEGORY rules included.
+
+    Args:
+        rules (list): MergeRules that apply to the category, sorted by index.
+    """
+    def __init__(self, rules: list):
+        self.rules = {rule.index: rule for rule in rules}
+        self.trie = PrefixTrie()
+        self.regexes = []
+
+        for rule in rules:
+            trie_key = rule.trie_key
+            if trie_key is None:
+                self.regexes.append((rule.index, rule.compile()))
+            else:
+                self.trie.insert(trie_key[0], rule.index, trie_key[1])
+
+    def match(self, model_id: str):
+        """Returns the first MergeRule that matches a model_id, None if there isn't one.
+        """
+        best = self.trie.match(model_id)
+        for index, regex in self.regexes:
+            if best is not None and index > best:
+                break
+            if regex.match(model_id):
+                best = index
+                break
+        return self.rules[best] if best is not None else None
+
+
+class RuleSet:
+    """Rules of a rules file, compiled on demand by category.
+
+    Args:
+        rules (list): MergeRules in file order.
+
+    Attributes:
+        rules (list): MergeRules in file order.
+        rules_by_category (dict): model_name -> MergeRules, ANY_CATEGORY included.
+    """
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.rules_by_category = {}
+        for rule in rules:
+            self.rules_by_category.setdefault(rule.category, []).append(rule)
+        self.__matchers = {}
+
+    def matcher(self, category: str):
+        """Returns the CategoryMatcher of a category, None if no rule applies to it.
+        """
+        if category not in self.__matchers:
+            rules = sorted(
+                self.rules_by_category.get(category, [])
+                + self.rules_by_category.get(ANY_CATEGORY, []),
+                key=lambda rule: rule.index
+            )
+            self.__matchers[category] = CategoryMatcher(rules) if rules else None
+        return self.__matchers[category]
+
+    def match(self, category: str, model_id: str):
+        """Returns the first MergeRule that matches an entry, None if there isn't one.
+        """
+        matcher = self.matcher(category)
+        return matcher.match(model_id) if matcher is not None else None
+
+    def resolve(self, merged: dict, properties_a: dict, properties_b: dict) -> tuple:
+        """Applies the rules to the merged entries in one pass, the given dicts aren't modified.
+
+        Args:
+            merged (dict): Merged properties.
+            properties_a (dict): Properties of the profile A.
+            properties_b (dict): Properties of the profile B.
+
+        Returns:
+            tuple: (new merged dict, model_ids of the entries that changed, counts by action)
+        """
+        sources = {'A': properties_a, 'B': properties_b}
+        new_merged = dict(merged)
+        changed_ids = []
+        counts = {ACTION_PREFER: 0, ACTION_FORCE: 0, ACTION_DROP: 0, ACTION_KEEP: 0}
+
+        matchers = {}
+        for model_id, model in merged.items():
+            category = model.model_name
+            if category not in matchers:
+                matchers[category] = self.matcher(category)
+            matcher = matchers[category]
+            if matcher is None:
+                continue
+            rule = matcher.match(model_id)
+            if rule is None:
+                continue
+
+            counts[rule.action] += 1
+            new_model = RuleSet.apply_rule(rule, model, sources)
+            if new_model is not model:
+                new_merged[model_id] = new_model
+                changed_ids.append(model_id)
+
+        return new_merged, changed_ids, counts
+
+    ##
+    # Static Methods
+    def apply_rule(rule: MergeRule, model: models.ProfileFieldType, sources: dict):
+        """Returns the entry resolved by a rule, a new copy if it changes or the same model.
+        """
+        if rule.action == ACTION_KEEP:
+            return model
+
+        if rule.action == ACTION_DROP:
+            if model.model_disabled:
+                return model
+            new_model = copy.copy(model)
+            new_model.model_disabled = True
+            return new_model
+
+        if rule.action == ACTION_PREFER:
+            source_model = sources[rule.argument].get(model.model_id)
+            if source_model is None:
+                return model
+            if models.model_state(source_model) == models.model_state(model):
+                return model
+            new_model = copy.copy(source_model)
+            new_model.model_disabled = model.model_disabled
+            return new_model
+
+        # ACTION_FORCE
+        if type(model) is models.ProfileSingleValue:
+            value = rule.values.get(None, rule.values.get('value'))
+            if type(model.value) is not bool or value is None or model.value == value:
+                return model
+            new_model = copy.copy(model)
+            new_model.value = value
+            return new_model
+
+        toggles = model.toggles
+        updates = {
+            toggle_name: rule.values.get(toggle_name, rule.values.get(None))
+            for toggle_name, toggle_value in toggles.items()
+            if toggle_value is not None
+        }
+        updates = {
+            toggle_name: value for toggle_name, value in updates.items()
+            if value is not None and utils.str_to_bool(toggles[toggle_name]) != value
+        }
+        if not updates:
+            return model
+        new_model = copy.copy(model)
+        for toggle_name, value in updates.items():
+            setattr(new_model, toggle_name, value)
+        return new_model
+    ##
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __str__(self):
+        return f'<RuleSet: {len(self.rules)} rules>'
+
+
+def parse_rules(text: str) -> RuleSet:
+    """Parses the text of a rules file.
+
+    Raises:
+        ValueError: If a line is not a valid rule.
+    """
+    rules = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        try:
+            parts = shlex.split(line, comments=True)
+        except ValueError as error:
+            raise ValueError(f'Line {line_number}: {error}')
+        if not parts:
+            continue
+        if len(parts) < 3:
+            raise ValueError(f'Line {line_number}: expected "category pattern action"')
+
+        category, pattern, action = parts[:3]
+        rules.append(MergeRule(
+            len(rules), category, pattern, action.lower(), ' '.join(parts[3:]), line_number
+        ))
+    return RuleSet(rules)
+
+
+def load_rules(rules_filepath: str) -> RuleSet:
+    """Reads and parses a rules file.
+    """
+    with open(rules_filepath, 'r', encoding='utf-8') as file_pointer:
+        return parse_rules(file_pointer.read())
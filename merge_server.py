@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Merge Server.
+
+This module runs a local HTTP service that merges, diffs and queries profiles, so CI jobs and
+git merge drivers don't pay the start up and the parsing of the same profiles on every call.
+
+Parsed profiles are kept in a LRU cache keyed by the hash of the file contents, a profile that
+didn't change is never parsed again, even if it's read from another path. The XML of full merges
+is cached too, by the hashes of both inputs, the merge direction and the strategies. Requests are
+handled concurrently, the cached models are shared read-only (merges work on copies).
+
+Usage:
+    python merge_server.py [--host 127.0.0.1] [--port 8765] [--cache-size 32]
+        [--output-root DIR]
+
+Requests (JSON bodies, JSON responses):
+    POST /merge     {"a": path, "b": path, "output": path, "merge_a_to_b": false, "patch": false,
+                     "strategies": {category: strategy}}
+                    Without "output" the merged XML is returned in the response. The output must
+                    be inside the output root, the directory the server runs in by default.
+    POST /diff      {"a": path, "b": path}
+    POST /query     {"path": path, "category": name, "model_id": id} (category and model_id are
+                    optional filters)
+    GET  /status    Cache statistics.
+
+POST requests must be sent with "Content-Type: application/json" and without an Origin header,
+so web pages can't make the browser send them (a cross-site form can't set that content type and
+browsers always add the Origin of a cross-site fetch). Malformed requests get a 400 response.
+
+Attributes:
+    DEFAULT_HOST (str): Interface the server binds to, only local by default.
+    DEFAULT_PORT (int): Port the server listens on.
+    DEFAULT_CACHE_SIZE (int): Parsed profiles kept in the cache.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.etree import ElementTree
+
+import models
+import profile_diff
+import profile_parser
+import profile_writer
+from session import MergeSession, FROM_A, FROM_B, source_stat
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 32
+
+
+class ParseCache:
+    """LRU cache of parsed profiles keyed by the hash of their contents.
+
+    Args:
+        max_entries (int): (default=DEFAULT_CACHE_SIZE) Profiles kept before evicting the
+            least recently used.
+
+    Attributes:
+        hits (int): Lookups served from the cache.
+        misses (int): Lookups that had to parse.
+    """
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.__entries = collections.OrderedDict()
+        self.__parsing = {}
+        self.__lock = threading.Lock()
+
+    def get(self, profile_filepath: str) -> tuple:
+        """Returns the parsed profile of a file, parsing it only if its contents aren't cached.
+        Concurrent requests for the same contents wait for a single parse.
+
+        Returns:
+            tuple: (content hash, namespace, properties) the properties must not be modified.
+        """
+        with open(profile_filepath, 'rb') as file_pointer:
+            data = file_pointer.read()
+        key = hashlib.sha1(data).hexdigest()
+
+        while True:
+            with self.__lock:
+                entry = self.__entries.get(key)
+                if entry is not None:
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return (key, *entry)
+
+                parsing = self.__parsing.get(key)
+                if parsing is None:
+                    parsing = self.__parsing[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another request is parsing the same contents
+            parsing.wait()
+
+        try:
+            entry = profile_parser.parse_profile_bytes(data)
+            with self.__lock:
+                self.__entries[key] = entry
+                while len(self.__entries) > self.max_entries:
+                    self.__entries.popitem(last=False)
+        finally:
+            with self.__lock:
+                del self.__parsing[key]
+            parsing.set()
+        return (key, *entry)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'entries': len(self.__entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+class MergeRequestHandler(BaseHTTPRequestHandler):
+    """Handles the requests of a MergeServer, one thread per request.
+    """
+    def do_GET(self):
+        if self.path == '/status':
+            self.send_json(200, self.server.cache.stats())
+        else:
+            self.send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        handlers = {
+            '/merge': self.server.merge,
+            '/diff': self.server.diff,
+            '/query': self.server.query,
+        }
+        handler = handlers.get(self.path)
+        if handler is None:
+            self.send_json(404, {'error': f'Unknown path {self.path}'})
+            return
+        if self.headers.get('Origin') is not None:
+            self.send_json(403, {'error': 'Requests from web pages are not allowed'})
+            return
+        if self.headers.get_content_type() != 'application/json':
+            self.send_json(415, {'error': 'The body must be sent as application/json'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if type(request) is not dict:
+                raise ValueError('The body must be a JSON object')
+            self.send_json(200, handler(request))
+        except (KeyError, ValueError, OSError, ElementTree.ParseError) as error:
+            self.send_json(400, {'error': f'{type(error).__name__}: {error}'})
+
+    def send_json(self, status: int, response: dict):
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class MergeServer(ThreadingHTTPServer):
+    """Local merge service with a warm parse cache.
+
+    Args:
+        address (tuple): (host, port) to listen on.
+        cache_size (int): (default=DEFAULT_CACHE_SIZE) Parsed profiles kept in the cache.
+        verbose (bool): (default=False) Log every request.
+        output_root (str): (Optional) Directory the merges can be written to, the current
+            directory by default.
+
+    Attributes:
+        cache (ParseCache): Parsed profiles by content hash.
+        output_root (str): Real path of the directory the merges can be written to.
+        results (OrderedDict): XML of full merges by (merge_a_to_b, strategies, hash A, hash B),
+            LRU.
+    """
+    daemon_threads = True
+
+    def __init__(
+        self, address: tuple, cache_size=DEFAULT_CACHE_SIZE, verbose=False, output_root=None
+    ):
+        super().__init__(address, MergeRequestHandler)
+        self.cache = ParseCache(cache_size)
+        self.results = collections.OrderedDict()
+        self.results_lock = threading.Lock()
+        self.verbose = verbose
+        self.output_root = os.path.realpath(output_root or os.getcwd())
+
+    ##
+    # Requests
+    def session(self, request: dict) -> tuple:
+        """Builds a merge session of the "a" and "b" paths of a request, either can be missing.
+
+        Returns:
+            tuple: (MergeSession, key of the merge result)
+        """
+        merge_session = MergeSession(
+            MergeServer.request_field(request, 'merge_a_to_b', bool, False)
+        )
+        strategies = MergeServer.request_field(request, 'strategies', dict, {})
+        for category, strategy_name in strategies.items():
+            if type(strategy_name) is not str:
+                raise ValueError(f'The strategy of {category} must be a string')
+            merge_session.set_strategy(category, strategy_name)
+        result_key = [merge_session.merge_a_to_b, tuple(sorted(merge_session.strategies.items()))]
+        for from_profile, key in [(FROM_A, 'a'), (FROM_B, 'b')]:
+            content_key = None
+            file_path = MergeServer.request_field(request, key, str)
+            if file_path:
+                stat = source_stat(file_path)
+                content_key, namespace, properties = self.cache.get(file_path)
+                merge_session.set_input(
+                    from_profile, file_path, namespace, properties, stat=stat
+                )
+            result_key.append(content_key)
+        return merge_session, tuple(result_key)
+
+    def output_path(self, request: dict):
+        """Returns the real path of the "output" of a request, None if it has none.
+
+        Raises:
+            ValueError: If the path is outside of the output root.
+        """
+        output = MergeServer.request_field(request, 'output', str)
+        if not output:
+            return None
+        output_path = os.path.realpath(os.path.join(self.output_root, output))
+        if os.path.commonpath([self.output_root, output_path]) != self.output_root:
+            raise ValueError(f'{output} is outside of {self.output_root}')
+        return output_path
+
+    def merge(self, request: dict) -> dict:
+        output = self.output_path(request)
+        merge_session, result_key = self.session(request)
+
+        if output and MergeServer.request_field(request, 'patch', bool, False):
+            merge_session.rebuild_merged()
+            added, removed, changed = merge_session.save_patch(output)
+            return {
+                'entries': len(merge_session.merged),
+                'added': added, 'removed': removed, 'changed': changed,
+            }
+
+        with self.results_lock:
+            result = self.results.get(result_key)
+            if result is not None:
+                self.results.move_to_end(result_key)
+
+        if result is None:
+            merge_session.rebuild_merged()
+            result = (
+                len(merge_session.merged),
+                profile_writer.profile_to_xml(merge_session.merged, merge_session.namespace)
+            )
+            with self.results_lock:
+                self.results[result_key] = result
+                while len(self.results) > self.cache.max_entries:
+                    self.results.popitem(last=False)
+
+        entries, xml_str = result
+        if not output:
+            return {'entries': entries, 'xml': xml_str}
+        with open(output, 'w', encoding='utf-8') as file_pointer:
+            file_pointer.write(xml_str)
+        return {'entries': entries}
+
+    def diff(self, request: dict) -> dict:
+        _key_a, _namespace_a, properties_a = self.cache.get(
+            MergeServer.request_field(request, 'a', str, required=True)
+        )
+        _key_b, _namespace_b, properties_b = self.cache.get(
+            MergeServer.request_field(request, 'b', str, required=True)
+        )
+        added, removed, changed = profile_diff.diff_properties(properties_a, properties_b)
+        return {'added': added, 'removed': removed, 'changed': changed}
+
+    def query(self, request: dict) -> dict:
+        _key, _namespace, properties = self.cache.get(
+            MergeServer.request_field(request, 'path', str, required=True)
+        )
+        category = MergeServer.request_field(request, 'category', str)
+        model_id = MergeServer.request_field(request, 'model_id', str)
+
+        if model_id is not None:
+            candidates = [properties[model_id]] if model_id in properties else []
+        else:
+            candidates = properties.values()
+
+        entries = [
+            {
+                'category': model.model_name,
+                'model_id': model.model_id,
+                'state': models.model_state(model),
+            }
+            for model in candidates
+            if category is None or model.model_name == category
+        ]
+        return {'entries': entries}
+    ##
+
+    ##
+    # Static Methods
+    def request_field(request: dict, name: str, field_type: type, default=None, required=False):
+        """Returns a field of a request body, checking its type.
+
+        Raises:
+            KeyError: If a required field is missing.
+            ValueError: If the field has another type.
+        """
+        if name not in request or request[name] is None:
+            if required:
+                raise KeyError(name)
+            return default
+        value = request[name]
+        if type(value) is not field_type:
+            raise ValueError(f'"{name}" must be a {field_type.__name__}')
+        return value
+    ##
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='SF Profile Merger - Merge Server')
+    arg_parser.add_argument('--host', default=DEFAULT_HOST)
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE)
+    arg_parser.add_argument('--verbose', action='store_true')
+    arg_parser.add_argument(
+        '--output-root', default=None,
+        help='Directory the merges can be written to, the current directory by default'
+    )
+    args = arg_parser.parse_args(argv)
+
+    server = MergeServer((args.host, args.port), args.cache_size, args.verbose, args.output_root)
+    print(f'Listening on http://{args.host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
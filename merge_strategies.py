@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Merge Strategies.
+
+This module has the named policies used to merge the entries of a category. By default every
+category is merged as a union of ids where the values of the preferred profile win, a session
+can pick another strategy per category:
+
+    union               Ids of both profiles, the preferred profile wins.
+    intersection        Only the ids that both profiles have, the preferred profile wins.
+    prefer-a            Ids of both profiles, A wins.
+    prefer-b            Ids of both profiles, B wins.
+    most-permissive     Ids of both profiles, the toggles are OR'ed.
+    least-permissive    Ids of both profiles, the toggles are AND'ed. An entry that only one
+                        profile has gets its toggles off, the other profile doesn't grant them.
+    coalesce            Ids of both profiles, the preferred profile wins. The login IP ranges
+                        that overlap or are next to each other are merged into one range (see
+                        ip_ranges.py), other categories are merged as a union.
+
+The toggles are the ones of each model (ex: allowRead of objectPermissions, readable and editable
+of fieldPermissions) and the value of boolean single values (ex: custom). Other fields come from
+the preferred profile. Keep in mind that toggles like the default of recordTypeVisibilities
+are exclusive, OR'ing them can leave more than one default. The toggles that take access away
+(revoke* of objectPermissions before API 14) are combined the other way around, a permission is
+only revoked by the most permissive merge if both profiles revoke it.
+
+Attributes:
+    STRATEGY_UNION (str)
+    STRATEGY_INTERSECTION (str)
+    STRATEGY_PREFER_A (str)
+    STRATEGY_PREFER_B (str)
+    STRATEGY_MOST_PERMISSIVE (str)
+    STRATEGY_LEAST_PERMISSIVE (str)
+    STRATEGY_COALESCE (str)
+    DEFAULT_STRATEGY (str): Strategy of the categories without one.
+    NEGATIVE_TOGGLES (tuple): Toggles that take access away when they are on.
+    strategies_by_name (dict): MergeStrategy by name.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import copy
+
+import ip_ranges
+import models
+import utils
+
+STRATEGY_UNION = 'union'
+STRATEGY_INTERSECTION = 'intersection'
+STRATEGY_PREFER_A = 'prefer-a'
+STRATEGY_PREFER_B = 'prefer-b'
+STRATEGY_MOST_PERMISSIVE = 'most-permissive'
+STRATEGY_LEAST_PERMISSIVE = 'least-permissive'
+STRATEGY_COALESCE = 'coalesce'
+
+DEFAULT_STRATEGY = STRATEGY_UNION
+NEGATIVE_TOGGLES = ('revokeCreate', 'revokeDelete', 'revokeEdit')
+
+
+class MergeStrategy:
+    """Policy to merge the entries of a category.
+
+    Args:
+        name (str): Name of the strategy.
+        prefer (str): 'A' or 'B' if that profile always wins, None to use the preferred profile
+            of the session.
+        shared_only (bool): (default=False) Drop the entries that only one profile has.
+        combine (callable): (Optional) Combines the toggle values of both profiles, ex: any.
+            The values of NEGATIVE_TOGGLES are inverted before and after they are combined.
+        missing_value (bool): (Optional) Toggle value of the entries that only one profile has,
+            None keeps their values. NEGATIVE_TOGGLES get the opposite value.
+        compact (callable): (Optional) Rewrites the merged entries of a category, ex: joins
+            them. The entries of the category can't be merged one at a time.
+    """
+    def __init__(
+        self, name: str, prefer=None, shared_only=False, combine=None, missing_value=None,
+        compact=None
+    ):
+        self.name = name
+        self.prefer = prefer
+        self.shared_only = shared_only
+        self.combine = combine
+        self.missing_value = missing_value
+        self.compact = compact
+
+    def a_wins(self, merge_a_to_b: bool) -> bool:
+        return merge_a_to_b if self.prefer is None else self.prefer == 'A'
+
+    def merge_entry(self, model_a, model_b, merge_a_to_b: bool):
+        """Merges the entries of an id.
+
+        Args:
+            model_a (ProfileFieldType): Entry of A, None if A doesn't have it.
+            model_b (ProfileFieldType): Entry of B, None if B doesn't have it.
+            merge_a_to_b (bool): The session prefers A.
+
+        Returns:
+            ProfileFieldType: A new merged entry, None if the entry is left out.
+        """
+        if model_a is None or model_b is None:
+            if self.shared_only or (model_a is None and model_b is None):
+                return None
+            model = copy.copy(model_a if model_b is None else model_b)
+            if self.missing_value is not None:
+                for toggle_name in MergeStrategy.toggle_names(model):
+                    negative = toggle_name in NEGATIVE_TOGGLES
+                    setattr(model, toggle_name, self.missing_value != negative)
+            return model
+
+        if self.a_wins(merge_a_to_b):
+            winner, other = model_a, model_b
+        else:
+            winner, other = model_b, model_a
+        model = copy.copy(winner)
+
+        if self.combine is not None:
+            for toggle_name in MergeStrategy.toggle_names(winner):
+                # Combined as the access they grant
+                negative = toggle_name in NEGATIVE_TOGGLES
+                values = [
+                    utils.str_to_bool(value) != negative
+                    for value in [MergeStrategy.toggle_value(winner, toggle_name),
+                                  MergeStrategy.toggle_value(other, toggle_name)]
+                    if value is not None
+                ]
+                setattr(model, toggle_name, self.combine(values) != negative)
+        return model
+
+    def merge_category(self, entries_a: dict, entries_b: dict, merge_a_to_b: bool) -> dict:
+        """Merges the entries of a category in one pass.
+
+        Args:
+            entries_a (dict): Entries of the category in A, keyed by model_id.
+            entries_b (dict): Entries of the category in B, keyed by model_id.
+            merge_a_to_b (bool): The session prefers A.
+
+        Returns:
+            dict: Merged entries keyed by model_id.
+        """
+        merged = {}
+        for _id, model_a in entries_a.items():
+            model = self.merge_entry(model_a, entries_b.get(_id), merge_a_to_b)
+            if model is not None:
+                merged[_id] = model
+        if not self.shared_only:
+            for _id, model_b in entries_b.items():
+                if _id not in entries_a:
+                    merged[_id] = self.merge_entry(None, model_b, merge_a_to_b)
+        if self.compact is not None:
+            merged = self.compact(merged)
+        return merged
+
+    ##
+    # Static Methods
+    def toggle_names(model: models.ProfileFieldType) -> list:
+        """Returns the toggles of an entry that have a value.
+        """
+        if type(model) is models.ProfileSingleValue:
+            return ['value'] if type(model.value) is bool else []
+        return [name for name, value in model.toggles.items() if value is not None]
+
+    def toggle_value(model: models.ProfileFieldType, toggle_name: str):
+        if type(model) is models.ProfileSingleValue:
+            return model.value
+        return model.toggles.get(toggle_name)
+    ##
+
+    def __str__(self):
+        return f'<MergeStrategy: {self.name}>'
+
+
+strategies_by_name = {
+    STRATEGY_UNION: MergeStrategy(STRATEGY_UNION),
+    STRATEGY_INTERSECTION: MergeStrategy(STRATEGY_INTERSECTION, shared_only=True),
+    STRATEGY_PREFER_A: MergeStrategy(STRATEGY_PREFER_A, prefer='A'),
+    STRATEGY_PREFER_B: MergeStrategy(STRATEGY_PREFER_B, prefer='B'),
+    STRATEGY_MOST_PERMISSIVE: MergeStrategy(STRATEGY_MOST_PERMISSIVE, combine=any),
+    STRATEGY_LEAST_PERMISSIVE: MergeStrategy(
+        STRATEGY_LEAST_PERMISSIVE, combine=all, missing_value=False
+    ),
+    STRATEGY_COALESCE: MergeStrategy(STRATEGY_COALESCE, compact=ip_ranges.coalesce_entries),
+}
+
+
+def get_strategy(name: str) -> MergeStrategy:
+    """Returns a strategy by name.
+
+    Raises:
+        ValueError: If there is no strategy with that name.
+    """
+    strategy = strategies_by_name.get(name)
+    if strategy is None:
+        raise ValueError(
+            f'Unknown merge strategy "{name}", use one of: {", ".join(strategies_by_name)}'
+        )
+    return strategy
+
+
+def group_by_category(properties: dict) -> dict:
+    """Splits properties by category (model_name) in one pass.
+
+    Returns:
+        dict: model_name -> {model_id: model}
+    """
+    categories = {}
+    for _id, model in properties.items():
+        entries = categories.get(model.model_name)
+        if entries is None:
+            entries = categories[model.model_name] = {}
+        entries[_id] = model
+    return categories
+
+
+def merge_properties(
+    properties_a: dict, properties_b: dict, merge_a_to_b: bool, strategies: dict
+) -> dict:
+    """Merges two profiles with a strategy per category.
+
+    Args:
+        properties_a (dict): Properties of the profile A.
+        properties_b (dict): Properties of the profile B.
+        merge_a_to_b (bool): The session prefers A.
+        strategies (dict): model_name -> strategy name, DEFAULT_STRATEGY for the rest.
+
+    Returns:
+        dict: Merged properties keyed by model_id.
+    """
+    categories_a = group_by_category(properties_a)
+    categories_b = group_by_category(properties_b)
+
+    merged = {}
+    for category in categories_a.keys() | categories_b.keys():
+        strategy = get_strategy(strategies.get(category, DEFAULT_STRATEGY))
+        merged.update(strategy.merge_category(
+            categories_a.get(category, {}), categories_b.get(category, {}), merge_a_to_b
+        ))
+    return merged
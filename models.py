@@ -7,16 +7,24 @@ Checkout the docs:
 
 Attributes:
     DEFAULT_API_VERSION (int):  The API version to use when creating objects.
+    LEGACY_MODEL_NAMES (dict): Old name of a renamed category -> (current name, last API version
+        with the old name).
+    CATEGORY_VERSIONS (dict): model_name -> (first, last) API versions of the Profile categories
+        that the Metadata API doesn't have in every version, None is unbounded.
+    EMPTY_MAPPING (MappingProxyType): Read-only empty dict shared as the default model_fields
+        and model_toggles of every model, instead of two empty dicts per entry.
 
 Copyright: Patricio Labin Correa - 2019
 
 @F1r3f0x
 """
 
+from types import MappingProxyType
 from typing import List
 from utils import str_to_bool
 
 DEFAULT_API_VERSION = 54
+EMPTY_MAPPING = MappingProxyType({})
 
 class ProfileFieldType:
     """Base Metadata class
@@ -29,13 +37,13 @@ class ProfileFieldType:
         model_fields (dict): Dict with the field name and value.
         model_toggles (dict): Dict with toggable fields and values.
     """
+    model_fields = EMPTY_MAPPING
+    model_toggles = EMPTY_MAPPING
 
     def __init__(self, api_version=DEFAULT_API_VERSION):
         self.api_version = api_version
         self.model_id = ''
         self.model_name = ''
-        self.model_fields = {}
-        self.model_toggles = {}
         self.model_disabled = False
 
     def _set_fields(self, input_fields: dict):
@@ -387,6 +395,11 @@ class ProfileFieldLevelSecurity(ProfileFieldType):
         self.model_name = 'fieldLevelSecurities' if self.api_version <= 22 else 'fieldPermissions'
         self.__set_id__()
 
+    @property
+    def object_name(self) -> str:
+        """Object of the field, ex: 'Account' for 'Account.Name'."""
+        return self.field.split('.', 1)[0]
+
     @property
     def editable(self):
         return self.__editable
@@ -620,13 +633,38 @@ class ProfileObjectPermissions(ProfileFieldType):
     def viewAllRecords(self, value):
         self.__viewAllRecords = str_to_bool(value)
 
+    # Before API 14 the permissions were revoked instead of allowed
+    @property
+    def revokeCreate(self):
+        return not self.__allowCreate
+
+    @revokeCreate.setter
+    def revokeCreate(self, value):
+        self.__allowCreate = not str_to_bool(value)
+
+    @property
+    def revokeDelete(self):
+        return not self.__allowDelete
+
+    @revokeDelete.setter
+    def revokeDelete(self, value):
+        self.__allowDelete = not str_to_bool(value)
+
+    @property
+    def revokeEdit(self):
+        return not self.__allowEdit
+
+    @revokeEdit.setter
+    def revokeEdit(self, value):
+        self.__allowEdit = not str_to_bool(value)
+
     @property
     def toggles(self):
         if self.api_version < 14:
             return {
-                'revokeCreate': self.allowCreate,
-                'revokeDelete': self.allowDelete,
-                'revokeEdit': self.allowEdit
+                'revokeCreate': self.revokeCreate,
+                'revokeDelete': self.revokeDelete,
+                'revokeEdit': self.revokeEdit
             }
         elif self.api_version == 14:
             return {
@@ -649,9 +687,9 @@ class ProfileObjectPermissions(ProfileFieldType):
     def fields(self) -> dict:
         if self.api_version < 14:
             return {
-                'revokeCreate': self.allowCreate,
-                'revokeDelete': self.allowDelete,
-                'revokeEdit': self.allowEdit,
+                'revokeCreate': self.revokeCreate,
+                'revokeDelete': self.revokeDelete,
+                'revokeEdit': self.revokeEdit,
                 'object': self.object
             }
         elif self.api_version == 14:
@@ -861,7 +899,39 @@ class ProfileSingleValue(ProfileFieldType):
         self.model_id = f'{self.model_name}'
 
 
-# TODO: handle different api versions
+class ProfileRawElement(ProfileFieldType):
+    """Top level element without a model, ex: a category added in a newer API version.
+
+    The element is carried as its XML fragment and written back unchanged, only a key is read
+    from it so it can be merged by id.
+
+    Attributes:
+        key (str): Values that identify the element, see profile_parser.raw_key.
+        raw (str): XML of the element.
+    """
+    def __init__(self, model_name='', key='', raw='', api_version=DEFAULT_API_VERSION):
+        super().__init__(api_version)
+        self.model_name = model_name
+        self.key = key
+        self.raw = raw
+        self.__set_id__()
+
+    @property
+    def fields(self):
+        return {
+            'key': self.key,
+            'raw': self.raw,
+        }
+
+    @fields.setter
+    def fields(self, input_dict: dict):
+        self._set_fields(input_dict)
+        self.__set_id__()
+
+    def __set_id__(self):
+        self.model_id = f'{self.model_name}: {self.key}'
+
+
 classes_by_modelName = {
     ProfileActionOverride().model_name: ProfileActionOverride,
     ProfileApexClassAccess().model_name: ProfileApexClassAccess,
@@ -887,6 +957,86 @@ classes_by_modelName = {
     'userLicense': ProfileSingleValue
 }
 
+LEGACY_MODEL_NAMES = {
+    'fieldLevelSecurities': ('fieldPermissions', 22),
+}
+
+# From the Profile reference of the Metadata API, objectPermissions (revoke* before API 14) and
+# recordTypeVisibilities are in every version
+CATEGORY_VERSIONS = {
+    'fieldLevelSecurities': (None, 22),
+    'fieldPermissions': (23, None),
+    'userLicense': (17, None),
+    'loginHours': (25, None),
+    'externalDataSourceAccesses': (27, None),
+    'userPermissions': (29, None),
+    'custom': (30, None),
+    'description': (30, None),
+    'customPermissions': (31, None),
+    'applicationVisibilities': (17, None),
+    'categoryGroupVisibilities': (41, None),
+    'loginIpRanges': (17, None),
+    'profileActionOverrides': (37, None),
+    'flowAccesses': (47, None),
+    'customSettingAccesses': (47, None),
+    'customMetadataTypeAccesses': (47, None),
+}
+
+
+def model_class(model_name: str, api_version=DEFAULT_API_VERSION):
+    """Returns the model class of a category at an API version, None if it has no model.
+
+    Args:
+        model_name (str): Salesforce Metadata API name, ex: fieldLevelSecurities.
+        api_version (int): (default=DEFAULT_API_VERSION) Salesforce API Version
+    """
+    legacy = LEGACY_MODEL_NAMES.get(model_name)
+    if legacy is not None:
+        current_name, last_version = legacy
+        return classes_by_modelName[current_name] if api_version <= last_version else None
+    return classes_by_modelName.get(model_name)
+
+
+def category_in_version(model_name: str, api_version: int) -> bool:
+    """Returns if a Profile has a category at an API version, categories without a gate are in
+    every version.
+    """
+    first_version, last_version = CATEGORY_VERSIONS.get(model_name, (None, None))
+    if first_version is not None and api_version < first_version:
+        return False
+    return last_version is None or api_version <= last_version
+
+
+def model_state(model: ProfileFieldType) -> dict:
+    """Returns the plain values of a model, they can be used to rebuild it with model_from_state.
+
+    Args:
+        model (ProfileFieldType): Model to read.
+    """
+    if type(model) is ProfileSingleValue:
+        return {'value': model.value}
+    return dict(model.fields)
+
+
+def model_from_state(model_name: str, state: dict, api_version=DEFAULT_API_VERSION):
+    """Rebuilds a model from the values returned by model_state.
+
+    Args:
+        model_name (str): Salesforce Metadata API name, ex: fieldPermissions.
+        state (dict): Plain values of the model.
+        api_version (int): (default=DEFAULT_API_VERSION) Salesforce API Version
+    """
+    legacy = LEGACY_MODEL_NAMES.get(model_name)
+    model_class = classes_by_modelName.get(legacy[0] if legacy else model_name)
+    if model_class is None:
+        return ProfileRawElement(model_name, state['key'], state['raw'], api_version=api_version)
+    if model_class is ProfileSingleValue:
+        return ProfileSingleValue(model_name, state['value'], api_version=api_version)
+
+    model = model_class(api_version=api_version)
+    model.fields = state
+    return model
+
 
 class Profile:
     def __init__(
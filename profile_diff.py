@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Profile Diff.
+
+This module compares parsed profiles entry by entry.
+
+The diff records (see DIFF_FIELDS) can be streamed as JSON lines or CSV. stream_diff only keeps
+the first profile in memory, the second one is compared while it's parsed, so diffing many
+pairs of profiles in a pipeline uses the memory of one profile at a time.
+
+Attributes:
+    CHANGE_ADDED (str): The entry is only in the new profile.
+    CHANGE_REMOVED (str): The entry is only in the old profile.
+    CHANGE_CHANGED (str): A field of the entry changed.
+    DIFF_FIELDS (tuple): Fields of a diff record. 'field' is the toggle (or field) that changed,
+        'old' and 'new' are its values. Added and removed entries have no field and their
+        toggles (or all their fields if they have no toggles) as the value.
+    PAIR_FIELDS (tuple): Fields added before DIFF_FIELDS when several pairs are diffed.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import csv
+import json
+
+import models
+import profile_parser
+import utils
+
+CHANGE_ADDED = 'added'
+CHANGE_REMOVED = 'removed'
+CHANGE_CHANGED = 'changed'
+
+DIFF_FIELDS = ('category', 'model_id', 'change', 'field', 'old', 'new')
+PAIR_FIELDS = ('a', 'b')
+
+
+def diff_properties(old_properties: dict, new_properties: dict):
+    """Compares two properties dicts (keyed by model_id).
+
+    Args:
+        old_properties (dict): Properties before the change.
+        new_properties (dict): Properties after the change.
+
+    Returns:
+        tuple: (added, removed, changed) lists of model_ids.
+    """
+    added = []
+    changed = []
+    for model_id, new_model in new_properties.items():
+        old_model = old_properties.get(model_id)
+        if old_model is None:
+            added.append(model_id)
+        elif (old_model.model_name != new_model.model_name
+                or models.model_state(old_model) != models.model_state(new_model)):
+            changed.append(model_id)
+
+    removed = [model_id for model_id in old_properties if model_id not in new_properties]
+    return added, removed, changed
+
+
+def group_summary(model_ids: list, merged: dict, properties_a: dict, properties_b: dict) -> dict:
+    """Aggregates a group of entries, ex: the field permissions of an object.
+
+    Args:
+        model_ids (list): model_ids of the entries in the group.
+        merged (dict): Merged properties.
+        properties_a (dict): Properties of the profile A.
+        properties_b (dict): Properties of the profile B.
+
+    Returns:
+        dict: 'count' of entries, 'toggles' with the merged entries that have each toggle on
+            and 'differences' with the entries whose values differ between A and B.
+    """
+    toggles = {}
+    differences = 0
+    compare = bool(properties_a) and bool(properties_b)
+    for model_id in model_ids:
+        model = merged.get(model_id)
+        if model is not None and not model.model_disabled:
+            for toggle_name, toggle_value in model.toggles.items():
+                toggles.setdefault(toggle_name, 0)
+                if utils.str_to_bool(toggle_value):
+                    toggles[toggle_name] += 1
+
+        if not compare:
+            continue
+        model_a = properties_a.get(model_id)
+        model_b = properties_b.get(model_id)
+        if model_a is None or model_b is None:
+            differences += 1
+        elif models.model_state(model_a) != models.model_state(model_b):
+            differences += 1
+
+    return {
+        'count': len(model_ids),
+        'toggles': toggles,
+        'differences': differences,
+    }
+
+
+def entry_values(model: models.ProfileFieldType) -> dict:
+    """Returns the values shown for an added or removed entry, its toggles or all its fields
+    if it has no toggles.
+    """
+    if type(model) is not models.ProfileSingleValue and model.toggles:
+        return dict(model.toggles)
+    return models.model_state(model)
+
+
+def entry_records(model_id: str, old_model, new_model):
+    """Yields the diff records of an entry, nothing if it didn't change.
+
+    Args:
+        model_id (str): Id of the entry.
+        old_model (ProfileFieldType): Entry in the old profile, None if it was added.
+        new_model (ProfileFieldType): Entry in the new profile, None if it was removed.
+    """
+    if old_model is None:
+        yield {
+            'category': new_model.model_name, 'model_id': model_id, 'change': CHANGE_ADDED,
+            'field': None, 'old': None, 'new': entry_values(new_model),
+        }
+        return
+    if new_model is None:
+        yield {
+            'category': old_model.model_name, 'model_id': model_id, 'change': CHANGE_REMOVED,
+            'field': None, 'old': entry_values(old_model), 'new': None,
+        }
+        return
+
+    old_state = models.model_state(old_model)
+    new_state = models.model_state(new_model)
+    if old_state == new_state:
+        return
+    for field in list(old_state) + [field for field in new_state if field not in old_state]:
+        old_value = old_state.get(field)
+        new_value = new_state.get(field)
+        if old_value != new_value:
+            yield {
+                'category': new_model.model_name, 'model_id': model_id,
+                'change': CHANGE_CHANGED, 'field': field, 'old': old_value, 'new': new_value,
+            }
+
+
+def diff_records(old_properties: dict, new_properties: dict):
+    """Yields the diff records of two parsed profiles, by category and model_id.
+    """
+    model_ids = sorted(
+        old_properties.keys() | new_properties.keys(),
+        key=lambda _id: ((old_properties.get(_id) or new_properties.get(_id)).model_name, _id)
+    )
+    for model_id in model_ids:
+        yield from entry_records(
+            model_id, old_properties.get(model_id), new_properties.get(model_id)
+        )
+
+
+def stream_diff(old_filepath: str, new_filepath: str):
+    """Yields the diff records of two profile files. The old profile is parsed into memory and
+    the new one is compared while it's parsed, the records of changed and added entries come
+    in the order of the new file and the removed entries at the end.
+    """
+    _namespace, old_properties = profile_parser.parse_profile(old_filepath)
+    for new_model in profile_parser.iter_profile(new_filepath):
+        old_model = old_properties.pop(new_model.model_id, None)
+        yield from entry_records(new_model.model_id, old_model, new_model)
+
+    for model_id in sorted(old_properties, key=lambda _id: (old_properties[_id].model_name, _id)):
+        yield from entry_records(model_id, old_properties[model_id], None)
+
+
+def csv_value(value) -> str:
+    if value is None:
+        return ''
+    if type(value) is bool:
+        return 'true' if value else 'false'
+    if type(value) is dict:
+        return json.dumps(value)
+    return str(value)
+
+
+class DiffWriter:
+    """Writes diff records to a text file as they come, as JSON lines or CSV.
+
+    Args:
+        file_pointer (TextIO): Output, for CSV open it with newline=''.
+        output_format (str): (default='jsonl') 'jsonl' or 'csv'.
+        pairs (bool): (default=False) The records have the PAIR_FIELDS.
+
+    Attributes:
+        written (int): Records written.
+    """
+    FORMATS = ('jsonl', 'csv')
+
+    def __init__(self, file_pointer, output_format='jsonl', pairs=False):
+        if output_format not in DiffWriter.FORMATS:
+            raise ValueError(f'Unknown diff format "{output_format}", use jsonl or csv')
+        self.file_pointer = file_pointer
+        self.output_format = output_format
+        self.fields = (PAIR_FIELDS if pairs else ()) + DIFF_FIELDS
+        self.written = 0
+        self.__csv_writer = None
+
+        if output_format == 'csv':
+            self.__csv_writer = csv.writer(file_pointer)
+            self.__csv_writer.writerow(self.fields)
+
+    def write(self, record: dict):
+        if self.__csv_writer is not None:
+            self.__csv_writer.writerow([csv_value(record.get(field)) for field in self.fields])
+        else:
+            self.file_pointer.write(json.dumps(record) + '\n')
+        self.written += 1
+
+    def write_all(self, records) -> int:
+        """Writes every record of an iterable, returns how many were written.
+        """
+        written = self.written
+        for record in records:
+            self.write(record)
+        return self.written - written
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Profile Index.
+
+This module indexes a Salesforce Profile XML file by the byte ranges of its top level elements,
+so each category can be parsed on demand instead of materializing the whole profile.
+
+The indexing pass doesn't parse XML, it finds the start tag of each top level element and its
+matching end tag. Profile elements never nest an element with their own tag, so the first end
+tag found closes the element.
+
+Attributes:
+    tag_regex (Pattern): Regex for a start tag, the groups are the tag name and '/' if the
+        element is self-closing.
+    namespace_regex (Pattern): Regex for the default namespace of the root element.
+    LAZY_CATEGORY_MIN_BYTES (int): Categories bigger than this are left for on demand parsing.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import mmap
+import os
+import re
+import time
+from xml.etree import ElementTree
+
+import models
+import profile_parser
+
+tag_regex = re.compile(rb'<([A-Za-z_][\w.\-:]*)[^>]*?(/?)>')
+namespace_regex = re.compile(rb'xmlns="([^"]*)"')
+
+LAZY_CATEGORY_MIN_BYTES = 256 * 1024
+
+
+class StaleIndex(ValueError):
+    """Raised when a category is parsed from a file that changed since it was indexed."""
+    pass
+
+
+class ProfileIndex:
+    """Byte ranges of the top level elements of a profile file, by category (tag name).
+
+    Args:
+        profile_filepath (str): Path to the profile file, it's indexed right away.
+
+    Attributes:
+        profile_filepath (str): Path to the profile file.
+        namespace (str): Default namespace of the root element.
+        ranges (dict): Category -> list of (start, end) byte ranges, in file order.
+        body_range (tuple): (start, end) bytes between the root start tag and its end tag.
+        model_ranges (dict): model_id -> (start, end) of the elements parsed so far.
+        parsed (set): Categories already parsed.
+    """
+    def __init__(self, profile_filepath: str):
+        self.profile_filepath = profile_filepath
+        self.namespace = ''
+        self.ranges = {}
+        self.body_range = (0, 0)
+        self.model_ranges = {}
+        self.parsed = set()
+        self.__stat = None
+
+        self.build()
+
+    @property
+    def categories(self) -> list:
+        return list(self.ranges.keys())
+
+    @property
+    def pending(self) -> set:
+        """Categories not parsed yet.
+        """
+        return set(self.ranges.keys()) - self.parsed
+
+    def count(self, category: str) -> int:
+        return len(self.ranges.get(category, []))
+
+    def category_bytes(self, category: str) -> int:
+        return sum(end - start for start, end in self.ranges.get(category, []))
+
+    def small_categories(self, max_bytes=LAZY_CATEGORY_MIN_BYTES) -> list:
+        """Returns the categories whose elements take less than max_bytes.
+        """
+        return [
+            category for category in self.ranges
+            if self.category_bytes(category) < max_bytes
+        ]
+
+    @property
+    def stat(self) -> tuple:
+        """(size, mtime_ns) of the file when it was indexed.
+        """
+        return self.__stat
+
+    @property
+    def stale(self) -> bool:
+        """The file changed since it was indexed.
+        """
+        stat = os.stat(self.profile_filepath)
+        return (stat.st_size, stat.st_mtime_ns) != self.__stat
+
+    ##
+    # Indexing
+    def build(self):
+        """Indexes the file, the parsed categories are forgotten.
+        """
+        with open(self.profile_filepath, 'rb') as file_pointer:
+            stat = os.fstat(file_pointer.fileno())
+            if stat.st_size == 0:
+                raise ElementTree.ParseError(f'{self.profile_filepath} is empty')
+
+            with mmap.mmap(file_pointer.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                namespace, ranges, body_range = ProfileIndex.scan(data)
+
+        self.namespace = namespace
+        self.ranges = ranges
+        self.body_range = body_range
+        self.model_ranges = {}
+        self.parsed = set()
+        self.__stat = (stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def scan(data) -> tuple:
+        """Finds the top level elements of a profile.
+
+        Args:
+            data (bytes): Contents of the file, an mmap works too.
+
+        Returns:
+            tuple: (namespace, ranges by category, body range)
+        """
+        # Root start tag, after the xml declaration and comments
+        position = ProfileIndex.__skip_markup(data, 0)
+        root_match = tag_regex.match(data, position)
+        if root_match is None:
+            raise ElementTree.ParseError('The profile has no root element')
+        root_tag = root_match.group(1)
+
+        namespace = ''
+        namespace_match = namespace_regex.search(root_match.group(0))
+        if namespace_match:
+            namespace = namespace_match.group(1).decode('utf-8')
+
+        ranges = {}
+        body_start = position = root_match.end()
+        while True:
+            start = ProfileIndex.__skip_markup(data, position)
+            if data[start + 1:start + 2] == b'/':
+                break
+
+            match = tag_regex.match(data, start)
+            if match is None:
+                raise ElementTree.ParseError(f'Invalid start tag at byte {start}')
+            tag = match.group(1)
+
+            if match.group(2):
+                end = match.end()
+            else:
+                end_tag = b'</' + tag + b'>'
+                end = data.find(end_tag, match.end())
+                if end < 0:
+                    raise ElementTree.ParseError(f'Missing {end_tag.decode()} at byte {start}')
+                end += len(end_tag)
+
+            ranges.setdefault(tag.decode('utf-8'), []).append((start, end))
+            position = end
+
+        end_tag = b'</' + root_tag + b'>'
+        if data[start:start + len(end_tag)] != end_tag:
+            raise ElementTree.ParseError(f'Unexpected end tag at byte {start}')
+
+        return namespace, ranges, (body_start, start)
+
+    @staticmethod
+    def __skip_markup(data, position: int) -> int:
+        """Returns the position of the next tag that isn't a declaration or a comment.
+        """
+        while True:
+            start = data.find(b'<', position)
+            if start < 0:
+                raise ElementTree.ParseError('Unexpected end of file')
+
+            if data[start:start + 4] == b'<!--':
+                terminator = b'-->'
+            elif data[start:start + 2] == b'<?':
+                terminator = b'?>'
+            elif data[start:start + 2] == b'<!':
+                terminator = b'>'
+            else:
+                return start
+
+            end = data.find(terminator, start)
+            if end < 0:
+                raise ElementTree.ParseError(f'Unclosed markup at byte {start}')
+            position = end + len(terminator)
+    ##
+
+    ##
+    # Parsing
+    def parse_categories(self, categories, progress=None, is_cancelled=None) -> dict:
+        """Parses categories that weren't parsed yet.
+
+        Args:
+            categories (iterable): Categories (tag names) to parse.
+            progress (callable): (Optional) Called between categories, at most every
+                PROGRESS_INTERVAL seconds, with (bytes parsed, bytes to parse, entries parsed by
+                category). See profile_parser.parse_profile.
+            is_cancelled (callable): (Optional) Checked between categories and every
+                CHECK_EVERY elements, if it returns True ScanCancelled is raised.
+
+        Returns:
+            dict: Properties of the parsed categories keyed by model_id.
+
+        Raises:
+            StaleIndex: If the file changed since it was indexed, the categories parsed before
+                came from the old contents so the whole file has to be loaded again.
+        """
+        if self.stale:
+            raise StaleIndex(f'{self.profile_filepath} changed since it was loaded')
+
+        categories = [category for category in categories if category not in self.parsed]
+        total_bytes = sum(self.category_bytes(category) for category in categories)
+        bytes_parsed = 0
+        counts = {}
+        next_report = time.monotonic() + profile_parser.PROGRESS_INTERVAL
+
+        properties = {}
+        with open(self.profile_filepath, 'rb') as file_pointer:
+            with mmap.mmap(file_pointer.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for category in categories:
+                    if is_cancelled and is_cancelled():
+                        raise profile_parser.ScanCancelled(self.profile_filepath)
+                    element_ranges = self.ranges.get(category, [])
+                    self.__parse_ranges(data, element_ranges, properties, is_cancelled)
+                    self.parsed.add(category)
+
+                    bytes_parsed += self.category_bytes(category)
+                    counts[category] = len(element_ranges)
+                    if progress and time.monotonic() >= next_report:
+                        progress(bytes_parsed, total_bytes, dict(counts))
+                        next_report = time.monotonic() + profile_parser.PROGRESS_INTERVAL
+
+        if progress:
+            progress(total_bytes, total_bytes, dict(counts))
+        return properties
+
+    def parse_pending(self) -> dict:
+        return self.parse_categories(self.pending)
+
+    def read_range(self, element_range: tuple) -> bytes:
+        """Returns the raw bytes of a range of the file.
+        """
+        start, end = element_range
+        with open(self.profile_filepath, 'rb') as file_pointer:
+            file_pointer.seek(start)
+            return file_pointer.read(end - start)
+
+    def __parse_ranges(self, data, element_ranges: list, properties: dict, is_cancelled=None):
+        if not element_ranges:
+            return
+
+        # The elements of a category are parsed together under a placeholder root
+        chunks = [b'<index>']
+        chunks.extend(data[start:end] for start, end in element_ranges)
+        chunks.append(b'</index>')
+        root = ElementTree.fromstring(b''.join(chunks))
+
+        for parsed, (element, element_range) in enumerate(zip(root, element_ranges), 1):
+            if parsed % profile_parser.CHECK_EVERY == 0 and is_cancelled and is_cancelled():
+                raise profile_parser.ScanCancelled(self.profile_filepath)
+            profile_field = profile_parser.model_from_element(element)
+            if type(profile_field) is models.ProfileRawElement:
+                # Keep the bytes of the file instead of the serialized element
+                start, end = element_range
+                profile_field.raw = data[start:end].decode('utf-8')
+            if profile_field:
+                properties[profile_field.model_id] = profile_field
+                self.model_ranges[profile_field.model_id] = element_range
+    ##
+
+    def __str__(self):
+        return f'<ProfileIndex: {self.profile_filepath} {len(self.ranges)} categories>'
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Profile Parser.
+
+This module reads Salesforce Profile XML files and transfers them to the Metadata models.
+
+Attributes:
+    namespace_regex (Pattern): Regex for removing the namespace prefix of a tag.
+    CHECK_EVERY (int): Elements parsed between cancellation and progress checks.
+    PROGRESS_INTERVAL (float): Minimum seconds between progress reports.
+    RAW_KEY_FIELDS (tuple): Child tags that identify an element without a model, in order.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import copy
+import io
+import os
+import re
+import sys
+import time
+from xml.etree import ElementTree
+
+import models
+
+# This regex is for removing the namespace prefix of the tag
+namespace_regex = re.compile('^{.*}')
+
+CHECK_EVERY = 64
+PROGRESS_INTERVAL = 0.1
+
+RAW_KEY_FIELDS = (
+    'name', 'fullName', 'object', 'field', 'apexClass', 'apexPage', 'application', 'tab',
+    'flow', 'layout', 'recordType', 'externalDataSource', 'dataCategoryGroup', 'actionName',
+    'pageOrSobjectType', 'formFactor', 'type', 'startAddress', 'endAddress'
+)
+
+
+class ScanCancelled(Exception):
+    """Raised when a profile scan is cancelled."""
+    pass
+
+
+def get_namespace(element: ElementTree.Element) -> str:
+    """Returns the namespace prefix of an element tag, ex: '{http://soap.sforce.com/...}'
+
+    Args:
+        element (Element): XML element.
+    """
+    match = namespace_regex.match(element.tag)
+    if match:
+        return match.group()
+    return ''
+
+
+def intern_text(text):
+    """Returns the shared copy of a string, the same object names, field names and ids repeat
+    thousands of times in a profile and across the loaded profiles.
+    """
+    if type(text) is str:
+        return sys.intern(text)
+    return text
+
+
+def intern_model(model: models.ProfileFieldType):
+    """Interns the string attributes of a model, ex: after it was unpickled from a child process.
+    """
+    attributes = model.__dict__
+    for name, value in attributes.items():
+        if type(value) is str:
+            attributes[name] = sys.intern(value)
+    return model
+
+
+def raw_key(element: ElementTree.Element, namespace='') -> str:
+    """Returns the key of an element without a model, made of the values of its children in
+    RAW_KEY_FIELDS. If it has none of them its values that aren't booleans are used, and its text
+    if it has no children.
+    """
+    values = {}
+    for child in element:
+        values.setdefault(child.tag.replace(namespace, ''), (child.text or '').strip())
+    if not values:
+        return (element.text or '').strip()
+
+    key_values = [values[field] for field in RAW_KEY_FIELDS if field in values]
+    if not key_values:
+        # Toggles don't identify an element
+        key_values = [value for value in values.values() if value not in ('true', 'false')]
+    return ': '.join(key_values or values.values())
+
+
+def raw_fragment(element: ElementTree.Element, namespace='') -> str:
+    """Returns the XML of an element without the namespace prefix of its tags.
+    """
+    fragment = copy.deepcopy(element)
+    fragment.tail = None
+    if namespace:
+        for child in fragment.iter():
+            child.tag = child.tag.replace(namespace, '')
+    return ElementTree.tostring(fragment, encoding='unicode')
+
+
+def model_from_element(
+    element: ElementTree.Element, namespace='', api_version=models.DEFAULT_API_VERSION
+):
+    """Creates the metadata model for a Profile field element.
+
+    Args:
+        element (Element): Top level element of the profile (ex: <fieldPermissions>)
+        namespace (str): Namespace prefix of the tags.
+        api_version (int): (default=DEFAULT_API_VERSION) API version the profile was written in.
+
+    Returns:
+        models.ProfileFieldType: The model, elements without a model are carried as a
+            models.ProfileRawElement.
+    """
+    field_type_name = intern_text(element.tag.replace(namespace, ''))
+
+    model_class = models.model_class(field_type_name, api_version)
+    if not model_class:
+        return models.ProfileRawElement(
+            field_type_name, intern_text(raw_key(element, namespace)),
+            raw_fragment(element, namespace), api_version=api_version
+        )
+
+    if model_class is models.ProfileSingleValue:
+        if field_type_name == 'custom':
+            return model_class(
+                field_type_name, element.text, is_boolean=True, api_version=api_version
+            )
+        return model_class(field_type_name, intern_text(element.text), api_version=api_version)
+
+    # Read metadata from xml
+    fields = {}
+    for field_child in element:
+        tag = intern_text(field_child.tag.replace(namespace, ''))
+        fields[tag] = intern_text(field_child.text)
+
+    # transfer to model
+    profile_field = model_class(api_version=api_version)
+    profile_field.fields = fields
+    profile_field.model_id = sys.intern(profile_field.model_id)
+    return profile_field
+
+
+def parse_profile(profile_filepath: str, progress=None, is_cancelled=None):
+    """Parses a profile file, streaming its top level elements.
+
+    Args:
+        profile_filepath (str): Path to the profile file.
+        progress (callable): (Optional) Called at most every PROGRESS_INTERVAL seconds with
+            (bytes consumed, total bytes, entries parsed by category).
+        is_cancelled (callable): (Optional) Checked between elements, if it returns True the
+            scan stops and ScanCancelled is raised.
+
+    Returns:
+        tuple: (namespace (str), properties (dict)) the properties are keyed by model_id.
+    """
+    with open(profile_filepath, 'rb') as file_pointer:
+        total_bytes = os.fstat(file_pointer.fileno()).st_size
+        return parse_stream(file_pointer, total_bytes, progress, is_cancelled)
+
+
+def parse_profile_bytes(data: bytes):
+    """Parses a profile already read into memory, see parse_profile.
+    """
+    return parse_stream(io.BytesIO(data), len(data))
+
+
+def parse_stream(file_pointer, total_bytes: int, progress=None, is_cancelled=None):
+    """Parses a profile from a binary file object, streaming its top level elements.
+
+    Args:
+        file_pointer (BinaryIO): Profile contents.
+        total_bytes (int): Size of the contents, for the progress reports.
+        progress (callable): (Optional) See parse_profile.
+        is_cancelled (callable): (Optional) See parse_profile.
+
+    Returns:
+        tuple: (namespace (str), properties (dict)) the properties are keyed by model_id.
+    """
+    properties = {}
+    counts = {}
+    namespace = ''
+    next_report = time.monotonic() + PROGRESS_INTERVAL
+
+    depth = 0
+    tree_root = None
+    parsed = 0
+    for event, element in ElementTree.iterparse(file_pointer, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if tree_root is None:
+                tree_root = element
+                namespace = get_namespace(tree_root)
+            continue
+
+        depth -= 1
+        if depth != 1:
+            continue
+
+        # A top level element is complete
+        profile_field = model_from_element(element, namespace)
+        if profile_field:
+            properties[profile_field.model_id] = profile_field
+            counts[profile_field.model_name] = counts.get(profile_field.model_name, 0) + 1
+        tree_root.clear()
+
+        parsed += 1
+        if parsed % CHECK_EVERY == 0:
+            if is_cancelled and is_cancelled():
+                raise ScanCancelled(getattr(file_pointer, 'name', ''))
+            if progress and time.monotonic() >= next_report:
+                progress(file_pointer.tell(), total_bytes, dict(counts))
+                next_report = time.monotonic() + PROGRESS_INTERVAL
+
+    if progress:
+        progress(total_bytes, total_bytes, dict(counts))
+
+    namespace_value = namespace.replace('{', '').replace('}', '')
+    return namespace_value, properties
+
+
+def iter_profile(profile_filepath: str, api_version=models.DEFAULT_API_VERSION):
+    """Yields the models of a profile file as its top level elements are parsed, only one
+    element is held in memory at a time.
+
+    Args:
+        profile_filepath (str): Path to the profile file.
+        api_version (int): (default=DEFAULT_API_VERSION) API version the profile was written in.
+
+    Yields:
+        models.ProfileFieldType: Model of each top level element, in file order.
+    """
+    depth = 0
+    tree_root = None
+    namespace = ''
+    with open(profile_filepath, 'rb') as file_pointer:
+        for event, element in ElementTree.iterparse(file_pointer, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if tree_root is None:
+                    tree_root = element
+                    namespace = get_namespace(tree_root)
+                continue
+
+            depth -= 1
+            if depth != 1:
+                continue
+
+            profile_field = model_from_element(element, namespace, api_version)
+            tree_root.clear()
+            if profile_field:
+                yield profile_field
+
+
+def scan_process(profile_filepath: str, connection, cancel_event=None):
+    """Entry point of a child process that parses a profile and sends the result through a
+    multiprocessing connection, so big profiles can be parsed in parallel.
+
+    Messages:
+        ('progress', bytes consumed, total bytes, counts) while parsing, then one of
+        ('done', namespace, properties), ('cancelled',) or ('error', message)
+
+    Args:
+        profile_filepath (str): Path to the profile file.
+        connection (Connection): Child end of a multiprocessing Pipe.
+        cancel_event (Event): (Optional) Set by the parent to cancel the scan.
+    """
+    def send_progress(bytes_read, total_bytes, counts):
+        connection.send(('progress', bytes_read, total_bytes, counts))
+
+    is_cancelled = cancel_event.is_set if cancel_event is not None else None
+    try:
+        namespace, properties = parse_profile(profile_filepath, send_progress, is_cancelled)
+        connection.send(('done', namespace, properties))
+    except ScanCancelled:
+        connection.send(('cancelled',))
+    except (ElementTree.ParseError, OSError) as error:
+        connection.send(('error', str(error)))
+    finally:
+        connection.close()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Profile Writer.
+
+This module writes the Metadata models back to Salesforce Profile XML files.
+
+Profiles can be written from scratch (write_profile) or as a patch of the file they were loaded
+from (patch_profile), where only the elements that changed are written and everything else is
+copied byte for byte, keeping the review diffs down to the real changes.
+
+Attributes:
+    METADATA_NAMESPACE (str): Default namespace of the Profile root element.
+    INDENT (str): Indentation of the elements written by patch_profile.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import mmap
+from xml.etree import ElementTree
+from xml.dom import minidom
+from xml.sax.saxutils import escape
+
+import models
+import profile_diff
+import profile_index
+
+METADATA_NAMESPACE = 'http://soap.sforce.com/2006/04/metadata'
+INDENT = '    '
+
+
+def value_to_text(value):
+    """Returns the XML text of a field value, or None if the value must not be written.
+    """
+    if value is None or value == '':
+        return None
+    if type(value) is bool:
+        return str(value).lower()
+    return value
+
+
+def raw_to_element(raw: str) -> ElementTree.Element:
+    """Parses the fragment of a models.ProfileRawElement, whitespace between its tags is
+    dropped so it's pretty printed like the rest of the profile.
+    """
+    element = ElementTree.fromstring(raw)
+    for child in element.iter():
+        if child.text is not None and not child.text.strip() and len(child):
+            child.text = None
+        child.tail = None
+    return element
+
+
+def profile_to_xml(properties: dict, namespace=METADATA_NAMESPACE) -> str:
+    """Builds the pretty printed XML of a profile.
+
+    Args:
+        properties (dict): Profile properties keyed by model_id.
+        namespace (str): (default=METADATA_NAMESPACE) Namespace of the Profile element.
+    """
+    xml_root = ElementTree.Element('Profile', attrib={'xmlns': namespace or METADATA_NAMESPACE})
+
+    # Goes through the profile and fills the xml
+    for model_field in sorted(properties.values(), key=lambda x: x.model_name + x.model_id):
+        if model_field.model_disabled:
+            continue
+
+        if type(model_field) is models.ProfileRawElement:
+            xml_root.append(raw_to_element(model_field.raw))
+        elif type(model_field) is not models.ProfileSingleValue:
+            c = ElementTree.SubElement(xml_root, model_field.model_name)
+            if model_field.fields:
+                for field, value in model_field.fields.items():
+                    value = value_to_text(value)
+                    if value is not None:
+                        ElementTree.SubElement(c, field).text = value
+        else:
+            value = value_to_text(model_field.value)
+            if value is not None:
+                c = ElementTree.SubElement(xml_root, model_field.model_name)
+                c.text = value
+
+    # Get the xml as a String and then prettyfies it
+    xml_str = ElementTree.tostring(xml_root, 'utf-8')
+    reparsed = minidom.parseString(xml_str)
+    return reparsed.toprettyxml(indent="    ", encoding='UTF-8').decode('utf-8').rstrip()
+
+
+def write_profile(properties: dict, file_path: str, namespace=METADATA_NAMESPACE):
+    """Writes a profile file.
+
+    Args:
+        properties (dict): Profile properties keyed by model_id.
+        file_path (str): Output path.
+        namespace (str): (default=METADATA_NAMESPACE) Namespace of the Profile element.
+    """
+    xml_str = profile_to_xml(properties, namespace)
+    with open(file_path, 'w', encoding='utf-8') as file_pointer:
+        file_pointer.write(xml_str)
+
+
+
+def element_to_xml(model_field: models.ProfileFieldType, level=1) -> str:
+    """Builds the XML of a single profile element, formatted like the Metadata API does.
+
+    Args:
+        model_field (ProfileFieldType): Model to write.
+        level (int): (default=1) Indentation level of the element, used for its children and
+            its end tag. The start tag is not indented.
+
+    Returns:
+        str: The XML or None if the element has nothing to write.
+    """
+    tag = model_field.model_name
+    if type(model_field) is models.ProfileRawElement:
+        return model_field.raw
+    if type(model_field) is models.ProfileSingleValue:
+        value = value_to_text(model_field.value)
+        if value is None:
+            return None
+        return f'<{tag}>{escape(value)}</{tag}>'
+
+    lines = [f'<{tag}>']
+    for field, value in (model_field.fields or {}).items():
+        value = value_to_text(value)
+        if value is not None:
+            lines.append(f'{INDENT * (level + 1)}<{field}>{escape(value)}</{field}>')
+    lines.append(f'{INDENT * level}</{tag}>')
+    return '\n'.join(lines)
+
+
+def patch_profile(
+    properties: dict, base_properties: dict, base_index: profile_index.ProfileIndex,
+    file_path: str
+):
+    """Writes a profile as a patch of a base file, the bytes of the unchanged elements are
+    copied as they are and only the changed, added and removed elements are written.
+
+    Args:
+        properties (dict): Profile properties to write, keyed by model_id.
+        base_properties (dict): Properties parsed from the base file, keyed by model_id.
+        base_index (ProfileIndex): Index of the base file.
+        file_path (str): Output path, it can be the base file.
+
+    Returns:
+        tuple: (added, removed, changed) lists of model_ids written as changes.
+
+    Raises:
+        ValueError: If the base file changed since base_properties were parsed.
+    """
+    if base_index.stale:
+        raise ValueError(f'{base_index.profile_filepath} changed since it was loaded')
+
+    output_properties = {
+        _id: model_field for _id, model_field in properties.items()
+        if not model_field.model_disabled and element_to_xml(model_field) is not None
+    }
+    added, removed, changed = profile_diff.diff_properties(base_properties, output_properties)
+
+    # Element ranges are only known for the parsed categories
+    categories = {base_properties[_id].model_name for _id in removed + changed}
+    categories.update(output_properties[_id].model_name for _id in added)
+    base_index.parse_categories(categories)
+
+    with open(base_index.profile_filepath, 'rb') as file_pointer:
+        with mmap.mmap(file_pointer.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            edits = _patch_edits(
+                data, base_index, output_properties, base_properties, added, removed, changed
+            )
+
+            # Edits are (start, end, bytes), insertions have start == end
+            edits.sort(key=lambda x: (x[0], x[1]))
+            chunks = []
+            position = 0
+            for start, end, text in edits:
+                chunks.append(data[position:start])
+                chunks.append(text)
+                position = max(position, end)
+            chunks.append(data[position:])
+
+    with open(file_path, 'wb') as file_pointer:
+        file_pointer.writelines(chunks)
+
+    return added, removed, changed
+
+
+def _patch_edits(
+    data, base_index: profile_index.ProfileIndex, output_properties: dict,
+    base_properties: dict, added: list, removed: list, changed: list
+) -> list:
+    """Returns the (start, end, bytes) edits that turn the base file into the output profile.
+    """
+    # Line break and indentation of the base elements
+    first_start = min(
+        (ranges[0][0] for ranges in base_index.ranges.values()), default=base_index.body_range[1]
+    )
+    line_start = data.rfind(b'\n', 0, first_start)
+    newline = b'\r\n' if line_start > 0 and data[line_start - 1:line_start] == b'\r' else b'\n'
+    indent = data[line_start + 1:first_start] if line_start >= 0 else b''
+    if indent.strip():
+        indent = INDENT.encode('utf-8')
+
+    def element_bytes(model_field):
+        text = element_to_xml(model_field).encode('utf-8')
+        return text.replace(b'\n', newline)
+
+    edits = []
+    for _id in changed:
+        start, end = base_index.model_ranges[_id]
+        edits.append((start, end, element_bytes(output_properties[_id])))
+
+    for _id in removed:
+        start, end = base_index.model_ranges[_id]
+        # The line of the element goes too
+        line_start = data.rfind(b'\n', 0, start)
+        if line_start >= 0 and not data[line_start + 1:start].strip():
+            start = line_start - 1 if newline == b'\r\n' else line_start
+        edits.append((start, end, b''))
+
+    # Added elements go in order (by model_id) among the elements of their category
+    ids_by_range = {element_range: _id for _id, element_range in base_index.model_ranges.items()}
+    removed_ids = set(removed)
+    for _id in sorted(added, key=lambda x: (output_properties[x].model_name, x)):
+        model_field = output_properties[_id]
+        category = model_field.model_name
+        category_ranges = base_index.ranges.get(category)
+
+        if category_ranges:
+            position = None
+            for element_range in category_ranges:
+                range_id = ids_by_range.get(element_range)
+                if (range_id is not None and range_id > _id and range_id in base_properties
+                        and range_id not in removed_ids):
+                    position = element_range[0]
+                    break
+            if position is not None:
+                edits.append((position, position, element_bytes(model_field) + newline + indent))
+                continue
+            position = category_ranges[-1][1]
+        else:
+            # New category, before the first category that sorts after it
+            following = [
+                ranges[0][0] for name, ranges in base_index.ranges.items() if name > category
+            ]
+            if following:
+                position = min(following)
+                edits.append((position, position, element_bytes(model_field) + newline + indent))
+                continue
+            position = max(
+                (ranges[-1][1] for ranges in base_index.ranges.values()),
+                default=base_index.body_range[0]
+            )
+        edits.append((position, position, newline + indent + element_bytes(model_field)))
+
+    return edits
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Recorded Resolutions.
+
+This module records the manual resolutions of a merge and replays them when the same conflict
+shows up again ("reuse recorded resolution", like git rerere).
+
+A decision is keyed by (category, model_id, toggle_name) and keeps the values of A and B it was
+made against, it's only replayed while both values are still the same. Toggle names are the
+toggles of the models, VALUE_TOGGLE for the value of single value entries and DISABLED_TOGGLE
+(None) for entries left out of the merge; the A and B values of a disabled decision are digests
+of the entries.
+
+The log is a JSON lines file, one decision per line and the last decision of a key wins:
+
+    {"c": "userPermissions", "i": "ViewAllData", "t": "enabled", "a": true, "b": false, "v": false}
+
+Usage:
+    python rerere.py list <log_file> [--category CATEGORY]
+    python rerere.py compact <log_file>
+
+Attributes:
+    VALUE_TOGGLE (str): Toggle name of the value of a ProfileSingleValue.
+    DISABLED_TOGGLE (None): Toggle name of the disabled state of an entry.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+
+import models
+import utils
+
+VALUE_TOGGLE = 'value'
+DISABLED_TOGGLE = None
+
+
+class Decision:
+    """A recorded resolution.
+
+    Attributes:
+        category (str): model_name of the entry.
+        model_id (str): Id of the entry.
+        toggle_name (str): Toggle resolved, VALUE_TOGGLE or DISABLED_TOGGLE.
+        value_a: Value in A when the decision was made, None if A didn't have the entry.
+        value_b: Value in B when the decision was made, None if B didn't have the entry.
+        value: Resolved value, the disabled state for DISABLED_TOGGLE.
+    """
+    __slots__ = ['category', 'model_id', 'toggle_name', 'value_a', 'value_b', 'value']
+
+    def __init__(self, category: str, model_id: str, toggle_name, value_a, value_b, value):
+        self.category = category
+        self.model_id = model_id
+        self.toggle_name = toggle_name
+        self.value_a = value_a
+        self.value_b = value_b
+        self.value = value
+
+    @property
+    def key(self) -> tuple:
+        return self.category, self.model_id, self.toggle_name
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'c': self.category, 'i': self.model_id, 't': self.toggle_name,
+            'a': self.value_a, 'b': self.value_b, 'v': self.value,
+        })
+
+    ##
+    # Static Methods
+    def from_json(line: str):
+        state = json.loads(line)
+        return Decision(state['c'], state['i'], state['t'], state['a'], state['b'], state['v'])
+    ##
+
+    def __str__(self):
+        return (
+            f'<Decision: {self.category} {self.model_id} {self.toggle_name} '
+            f'A={self.value_a} B={self.value_b} -> {self.value}>'
+        )
+
+
+def entry_value(model: models.ProfileFieldType, toggle_name):
+    """Returns the value of an entry that a decision is compared against.
+
+    Args:
+        model (ProfileFieldType): Entry of A or B, can be None.
+        toggle_name (str): Toggle name, VALUE_TOGGLE or DISABLED_TOGGLE.
+    """
+    if model is None:
+        return None
+    if toggle_name == DISABLED_TOGGLE:
+        state = json.dumps(models.model_state(model), sort_keys=True)
+        return hashlib.sha1(state.encode('utf-8')).hexdigest()[:16]
+    if toggle_name == VALUE_TOGGLE and type(model) is models.ProfileSingleValue:
+        return model.value
+    return utils.str_to_bool(model.toggles.get(toggle_name))
+
+
+class DecisionLog:
+    """Recorded resolutions of a log file, indexed by entry.
+
+    Args:
+        log_filepath (str): Path of the log, it's read if it exists.
+
+    Attributes:
+        log_filepath (str): Path of the log.
+        decisions (dict): (category, model_id) -> {toggle_name: Decision}, the last of each key.
+        recorded (int): Lines in the log, compact drops the superseded ones.
+    """
+    def __init__(self, log_filepath: str):
+        self.log_filepath = log_filepath
+        self.decisions = {}
+        self.recorded = 0
+
+        if os.path.exists(log_filepath):
+            with open(log_filepath, 'r', encoding='utf-8') as file_pointer:
+                for line in file_pointer:
+                    if line.strip():
+                        self.__index(Decision.from_json(line))
+
+    @property
+    def categories(self) -> set:
+        return {category for category, _id in self.decisions}
+
+    def __len__(self):
+        return sum(len(toggles) for toggles in self.decisions.values())
+
+    def __index(self, decision: Decision):
+        self.decisions.setdefault((decision.category, decision.model_id), {})[
+            decision.toggle_name
+        ] = decision
+        self.recorded += 1
+
+    def lookup(self, category: str, model_id: str, toggle_name, value_a, value_b):
+        """Returns the decision for a conflict, None if it wasn't resolved before with the same
+        values of A and B.
+        """
+        decision = self.decisions.get((category, model_id), {}).get(toggle_name)
+        if decision is None or decision.value_a != value_a or decision.value_b != value_b:
+            return None
+        return decision
+
+    ##
+    # Recording
+    def decide(
+        self, model_id: str, toggle_name, value, merged: dict, properties_a: dict,
+        properties_b: dict
+    ) -> Decision:
+        """Builds the decision for a resolution made on the current merge.
+
+        Args:
+            model_id (str): Id of the entry.
+            toggle_name (str): Toggle resolved, VALUE_TOGGLE or DISABLED_TOGGLE.
+            value: Resolved value, the disabled state for DISABLED_TOGGLE.
+            merged (dict): Merged properties.
+            properties_a (dict): Properties of the profile A.
+            properties_b (dict): Properties of the profile B.
+        """
+        model_a = properties_a.get(model_id)
+        model_b = properties_b.get(model_id)
+        model = merged.get(model_id) or model_a or model_b
+        return Decision(
+            model.model_name, model_id, toggle_name,
+            entry_value(model_a, toggle_name), entry_value(model_b, toggle_name), value
+        )
+
+    def record(self, decisions: list):
+        """Appends decisions to the log and the index.
+        """
+        if not decisions:
+            return
+        with open(self.log_filepath, 'a', encoding='utf-8') as file_pointer:
+            for decision in decisions:
+                file_pointer.write(decision.to_json() + '\n')
+                self.__index(decision)
+
+    def compact(self):
+        """Rewrites the log with only the current decision of each key.
+        """
+        decisions = [
+            decision for toggles in self.decisions.values() for decision in toggles.values()
+        ]
+        temp_path = f'{self.log_filepath}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file_pointer:
+            for decision in decisions:
+                file_pointer.write(decision.to_json() + '\n')
+        os.replace(temp_path, self.log_filepath)
+        self.recorded = len(decisions)
+    ##
+
+    ##
+    # Replay
+    def resolve(self, merged: dict, properties_a: dict, properties_b: dict) -> tuple:
+        """Replays the matching decisions on the merged entries, the given dicts aren't modified.
+        Only the entries with decisions are visited.
+
+        Returns:
+            tuple: (new merged dict, model_ids of the entries that changed, decisions replayed)
+        """
+        new_merged = dict(merged)
+        changed_ids = []
+        replayed = 0
+
+        for (category, model_id), toggles in self.decisions.items():
+            model = merged.get(model_id)
+            if model is None or model.model_name != category:
+                continue
+            model_a = properties_a.get(model_id)
+            model_b = properties_b.get(model_id)
+
+            new_model = model
+            for toggle_name, decision in toggles.items():
+                if (decision.value_a != entry_value(model_a, toggle_name)
+                        or decision.value_b != entry_value(model_b, toggle_name)):
+                    continue
+                replayed += 1
+
+                if toggle_name == DISABLED_TOGGLE:
+                    current = new_model.model_disabled
+                elif toggle_name == VALUE_TOGGLE and type(model) is models.ProfileSingleValue:
+                    current = new_model.value
+                elif toggle_name in new_model.toggles:
+                    current = utils.str_to_bool(new_model.toggles[toggle_name])
+                else:
+                    continue
+                if current == decision.value:
+                    continue
+
+                if new_model is model:
+                    new_model = copy.copy(model)
+                if toggle_name == DISABLED_TOGGLE:
+                    new_model.model_disabled = decision.value
+                else:
+                    setattr(new_model, toggle_name, decision.value)
+
+            if new_model is not model:
+                new_merged[model_id] = new_model
+                changed_ids.append(model_id)
+
+        return new_merged, changed_ids, replayed
+
+    def unresolved(self, merged: dict, properties_a: dict, properties_b: dict) -> list:
+        """Returns the conflicts without a matching decision, the toggles of entries that both
+        profiles have with different values.
+
+        Returns:
+            list: (category, model_id, toggle_name) keys.
+        """
+        conflicts = []
+        for model_id, model in merged.items():
+            model_a = properties_a.get(model_id)
+            model_b = properties_b.get(model_id)
+            if model_a is None or model_b is None:
+                continue
+
+            if type(model) is models.ProfileSingleValue:
+                toggle_names = [VALUE_TOGGLE]
+            else:
+                toggle_names = list(model.toggles.keys())
+            for toggle_name in toggle_names:
+                value_a = entry_value(model_a, toggle_name)
+                value_b = entry_value(model_b, toggle_name)
+                if value_a == value_b:
+                    continue
+                if self.lookup(model.model_name, model_id, toggle_name, value_a, value_b) is None:
+                    conflicts.append((model.model_name, model_id, toggle_name))
+        return conflicts
+    ##
+
+    def __str__(self):
+        return f'<DecisionLog: {self.log_filepath} {len(self)} decisions>'
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='SF Profile Merger - Recorded Resolutions')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    cmd_list = commands.add_parser('list', help='Print the current decisions of a log')
+    cmd_list.add_argument('log_file')
+    cmd_list.add_argument('--category', default=None)
+
+    cmd_compact = commands.add_parser('compact', help='Drop the superseded decisions of a log')
+    cmd_compact.add_argument('log_file')
+
+    args = arg_parser.parse_args(argv)
+
+    decision_log = DecisionLog(args.log_file)
+    if args.command == 'list':
+        for (category, _id), toggles in sorted(decision_log.decisions.items()):
+            if args.category is None or category == args.category:
+                for decision in toggles.values():
+                    print(decision)
+    elif args.command == 'compact':
+        recorded = decision_log.recorded
+        decision_log.compact()
+        print(f'{recorded} -> {decision_log.recorded} decisions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Merge Session.
+
+This module has the state of a merge between two profiles. A process can hold as many sessions
+as it needs (CLI batch, server, tabbed GUI); loader threads hand their results to a session under
+its lock and readers always get a consistent merged dict.
+
+Attributes:
+    FROM_A (str): Is from A
+    FROM_B (str): Is from B
+    FROM_MERGED (str): Is from merged
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import copy
+import os
+import threading
+
+import merge_strategies
+import profile_diff
+import profile_index
+import profile_parser
+import profile_writer
+import undo as undo_history
+
+FROM_A = 'A'
+FROM_B = 'B'
+FROM_MERGED = 'AB'
+
+
+def source_stat(file_path: str):
+    """Returns (size, mtime_ns) of a source file, None if it's missing.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ProfileInput:
+    """A profile loaded into a merge session.
+
+    Args:
+        from_profile (str): FROM_A or FROM_B.
+
+    Attributes:
+        file_path (str): Path of the loaded file, empty if nothing is loaded.
+        namespace (str): Namespace of the profile root element.
+        properties (dict): Models of the profile keyed by model_id.
+        index (ProfileIndex): Byte index of the file if some categories are parsed on demand,
+            None if the properties are complete.
+        stat (tuple): (size, mtime_ns) of the file when it was parsed, see source_stat.
+    """
+    def __init__(self, from_profile: str):
+        self.from_profile = from_profile
+        self.file_path = ''
+        self.namespace = None
+        self.properties = {}
+        self.index = None
+        self.stat = None
+
+    @property
+    def loaded(self) -> bool:
+        return len(self.properties) > 0 or self.index is not None
+
+    @property
+    def pending_categories(self) -> set:
+        """Categories of the file that weren't parsed yet.
+        """
+        return self.index.pending if self.index is not None else set()
+
+    def __str__(self):
+        return f'<ProfileInput: {self.from_profile} {self.file_path}>'
+
+
+class MergeSession:
+    """Merge of two profiles.
+
+    The merged dict holds copies of the input models, so overrides made on the merged state never
+    leak into the inputs. Bulk changes build the new dict aside and swap it under the lock, the
+    incremental ones (categories parsed on demand, reloads) change the dict in place under the
+    lock so they cost what changed. Readers in other threads hold the lock.
+
+    Args:
+        merge_a_to_b (bool): (default=False) Values from A take preference while merging.
+
+    Attributes:
+        a (ProfileInput): Profile A.
+        b (ProfileInput): Profile B.
+        merged (dict): Merged models keyed by model_id.
+        merge_a_to_b (bool): Values from A take preference while merging.
+        strategies (dict): model_name -> name of the merge_strategies strategy of the category,
+            the categories without one are a union where the preferred input wins.
+        lock (RLock): Guards the hand-off of inputs and merged state between threads.
+    """
+    def __init__(self, merge_a_to_b=False):
+        self.a = ProfileInput(FROM_A)
+        self.b = ProfileInput(FROM_B)
+        self.merged = {}
+        self.merge_a_to_b = merge_a_to_b
+        self.strategies = {}
+        self.lock = threading.RLock()
+
+    def input(self, from_profile: str) -> ProfileInput:
+        return self.a if from_profile == FROM_A else self.b
+
+    def other_input(self, from_profile: str) -> ProfileInput:
+        return self.b if from_profile == FROM_A else self.a
+
+    @property
+    def preferred_input(self) -> ProfileInput:
+        """Input whose values win when both profiles have an entry.
+        """
+        return self.a if self.merge_a_to_b else self.b
+
+    def strategy(self, category: str) -> merge_strategies.MergeStrategy:
+        return merge_strategies.get_strategy(
+            self.strategies.get(category, merge_strategies.DEFAULT_STRATEGY)
+        )
+
+    @property
+    def namespace(self) -> str:
+        return self.b.namespace or self.a.namespace or profile_writer.METADATA_NAMESPACE
+
+    ##
+    # Inputs
+    def load_file(self, from_profile: str, file_path: str):
+        """Parses a profile file in the calling thread and sets it as an input.
+        """
+        stat = source_stat(file_path)
+        namespace, properties = profile_parser.parse_profile(file_path)
+        self.set_input(from_profile, file_path, namespace, properties, stat=stat)
+
+    def set_input(
+        self, from_profile: str, file_path: str, namespace: str, properties: dict, index=None,
+        stat=None
+    ):
+        """Hands a parsed profile to the session, it's safe to call from a loader thread.
+        The merged state is not rebuilt, call rebuild_merged when all inputs are ready. The
+        categories parsed on demand are added to the given properties dict.
+
+        Args:
+            index (ProfileIndex): (Optional) Index of the file when the properties only have
+                some of its categories, the rest are parsed with load_categories.
+            stat (tuple): (Optional) source_stat of the file taken before it was parsed, by
+                default the one of the index or of the file as it is now.
+        """
+        if stat is None and file_path:
+            stat = index.stat if index is not None else source_stat(file_path)
+        with self.lock:
+            profile_input = self.input(from_profile)
+            profile_input.file_path = file_path
+            profile_input.namespace = namespace
+            profile_input.properties = properties
+            profile_input.index = index
+            profile_input.stat = stat
+
+    @property
+    def pending_categories(self) -> set:
+        """Categories that an input left to parse on demand.
+        """
+        return self.a.pending_categories | self.b.pending_categories
+
+    def load_categories(self, categories) -> list:
+        """Parses the pending categories of the inputs and merges their entries.
+
+        Args:
+            categories (iterable): Categories (model_name) to load.
+
+        Returns:
+            list: Sorted model_ids of the merged entries of the categories.
+
+        Raises:
+            StaleIndex: If the file of an input changed since it was indexed, nothing is parsed.
+                The input has to be loaded again (see apply_changes).
+        """
+        categories = set(categories)
+        with self.lock:
+            profile_inputs = [
+                profile_input for profile_input in [self.a, self.b]
+                if categories & profile_input.pending_categories
+            ]
+            # Neither input is parsed if one can't be, or the merge would miss its half
+            for profile_input in profile_inputs:
+                if profile_input.index.stale:
+                    raise profile_index.StaleIndex(
+                        f'{profile_input.file_path} changed since it was loaded'
+                    )
+
+            new_ids = set()
+            for profile_input in profile_inputs:
+                new_properties = profile_input.index.parse_categories(categories)
+                profile_input.properties.update(new_properties)
+                new_ids.update(new_properties.keys())
+
+            # Merged once both inputs have the categories
+            self.merge_entries(self.merged, new_ids, categories)
+
+            return sorted(
+                _id for _id, profile_field in self.merged.items()
+                if profile_field.model_name in categories
+            )
+
+    def load_all(self):
+        """Parses every pending category, ex: before the merged profile is written.
+        """
+        if self.pending_categories:
+            self.load_categories(self.pending_categories)
+
+    def close(self, from_profile: str):
+        """Removes an input and rebuilds the merged state with the other one.
+        """
+        with self.lock:
+            if from_profile == FROM_A:
+                self.a = ProfileInput(FROM_A)
+            else:
+                self.b = ProfileInput(FROM_B)
+            self.rebuild_merged()
+    ##
+
+    ##
+    # Merge
+    def rebuild_merged(self):
+        """Rebuilds the merged state from the inputs, the preferred input wins unless the
+        category has a merge strategy.
+        """
+        with self.lock:
+            if self.strategies:
+                self.merged = merge_strategies.merge_properties(
+                    self.a.properties, self.b.properties, self.merge_a_to_b, self.strategies
+                )
+                return
+
+            preferred = self.preferred_input
+            merged = {
+                _id: copy.copy(profile_field)
+                for properties in [self.other_input(preferred.from_profile).properties,
+                                   preferred.properties]
+                for _id, profile_field in properties.items()
+            }
+            self.merged = merged
+
+    def merge_entries(self, merged: dict, model_ids, categories=()):
+        """Merges again entries of the inputs into a merged dict, with the strategies of their
+        categories. An entry is removed if no input has it or the strategy leaves it out.
+
+        The entries of a category whose strategy compacts them depend on each other, the
+        category is merged again whole, once per call.
+
+        Args:
+            merged (dict): Merged dict, it's updated in place.
+            model_ids (iterable): Ids of the entries that changed.
+            categories (iterable): (Optional) Categories of the entries, the entries removed
+                from both inputs that aren't in the merged dict can't be looked up, ex: a login
+                IP range that another one absorbed.
+        """
+        compact_categories = {
+            category for category in categories if self.strategy(category).compact is not None
+        }
+        for model_id in model_ids:
+            model_a = self.a.properties.get(model_id)
+            model_b = self.b.properties.get(model_id)
+            current = model_a or model_b or merged.get(model_id)
+            if current is None:
+                continue
+
+            strategy = self.strategy(current.model_name)
+            if strategy.compact is not None:
+                compact_categories.add(current.model_name)
+            elif model_a is None and model_b is None:
+                del merged[model_id]
+            else:
+                model = strategy.merge_entry(model_a, model_b, self.merge_a_to_b)
+                if model is None:
+                    merged.pop(model_id, None)
+                else:
+                    merged[model_id] = model
+
+        for category in compact_categories:
+            self.merge_category(merged, category)
+
+    def merge_category(self, merged: dict, category: str):
+        """Merges again all the entries of a category into a merged dict, in place.
+        """
+        for _id in [_id for _id, model in merged.items() if model.model_name == category]:
+            del merged[_id]
+        merged.update(self.strategy(category).merge_category(
+            {_id: model for _id, model in self.a.properties.items()
+             if model.model_name == category},
+            {_id: model for _id, model in self.b.properties.items()
+             if model.model_name == category},
+            self.merge_a_to_b
+        ))
+
+    def set_strategy(self, category: str, strategy_name=None):
+        """Sets the merge strategy of a category, None goes back to the default. The merged
+        state is not rebuilt, call rebuild_merged.
+
+        Raises:
+            ValueError: If there is no strategy with that name.
+        """
+        with self.lock:
+            if strategy_name is None or strategy_name == merge_strategies.DEFAULT_STRATEGY:
+                self.strategies.pop(category, None)
+            else:
+                merge_strategies.get_strategy(strategy_name)
+                self.strategies[category] = strategy_name
+
+    def set_merge_direction(self, merge_a_to_b: bool):
+        with self.lock:
+            self.merge_a_to_b = merge_a_to_b
+
+    def apply_all(self, from_profile: str):
+        """Overwrites the merged state with all the values of an input.
+        """
+        with self.lock:
+            self.load_all()
+            merged = dict(self.merged)
+            for _id, profile_field in self.input(from_profile).properties.items():
+                merged[_id] = copy.copy(profile_field)
+            self.merged = merged
+
+    def apply_changes(self, from_profile: str, new_properties: dict, stat=None):
+        """Replaces an input with a new parse of the same file, only the entries that changed
+        are re-merged.
+
+        Args:
+            from_profile (str): What profile changed.
+            new_properties (dict): Properties of the new parse.
+            stat (tuple): (Optional) source_stat of the file taken before the new parse, by
+                default the one of the file as it is now.
+
+        Returns:
+            tuple: (added, removed, changed) lists of model_ids.
+        """
+        with self.lock:
+            profile_input = self.input(from_profile)
+            old_properties = profile_input.properties
+
+            added, removed, changed = profile_diff.diff_properties(old_properties, new_properties)
+            profile_input.properties = new_properties
+            profile_input.index = None
+            profile_input.stat = stat or source_stat(profile_input.file_path)
+
+            model_ids = added + removed + changed
+            categories = {
+                (new_properties.get(_id) or old_properties[_id]).model_name for _id in model_ids
+            }
+            self.merge_entries(self.merged, model_ids, categories)
+
+        return added, removed, changed
+
+    def apply_rules(self, rule_set) -> tuple:
+        """Resolves the merged entries with the rules of a merge_rules.RuleSet, the pending
+        categories are loaded first so every entry goes through the rules.
+
+        Returns:
+            tuple: (model_ids of the entries that changed, counts by action)
+        """
+        with self.lock:
+            self.load_all()
+            merged, changed_ids, counts = rule_set.resolve(
+                self.merged, self.a.properties, self.b.properties
+            )
+            self.merged = merged
+        return changed_ids, counts
+
+    def prune_dangling(self, component_index) -> tuple:
+        """Disables the merged entries that reference components missing from a
+        component_index.ComponentIndex, the pending categories are loaded first.
+
+        Returns:
+            tuple: (model_ids of the entries that changed, dangling entries)
+        """
+        with self.lock:
+            self.load_all()
+            merged, changed_ids, dangling = component_index.prune(self.merged)
+            self.merged = merged
+        return changed_ids, dangling
+
+    def apply_decisions(self, decision_log) -> tuple:
+        """Replays the recorded resolutions of a rerere.DecisionLog that match the current
+        conflicts. Only the pending categories that have decisions are loaded.
+
+        Returns:
+            tuple: (model_ids of the entries that changed, decisions replayed)
+        """
+        with self.lock:
+            categories = decision_log.categories & self.pending_categories
+            if categories:
+                self.load_categories(categories)
+            merged, changed_ids, replayed = decision_log.resolve(
+                self.merged, self.a.properties, self.b.properties
+            )
+            self.merged = merged
+        return changed_ids, replayed
+    ##
+
+    def apply_operations(self, operations: list, undo=True):
+        """Undoes or redoes the operations of an undo.UndoStep on the merged state.
+        """
+        with self.lock:
+            self.merged = undo_history.apply_operations(self.merged, operations, undo)
+
+    def save(self, file_path: str):
+        """Writes the merged profile.
+        """
+        with self.lock:
+            self.load_all()
+            merged = self.merged
+        profile_writer.write_profile(merged, file_path, self.namespace)
+
+    def save_patch(self, file_path: str, base_from=FROM_B) -> tuple:
+        """Writes the merged profile as a patch of the file of an input, the entries that are
+        the same as in that file are copied from it byte for byte.
+
+        Args:
+            file_path (str): Output path.
+            base_from (str): (default=FROM_B) Input whose file is patched.
+
+        Returns:
+            tuple: (added, removed, changed) lists of model_ids that differ from the base file.
+
+        Raises:
+            ValueError: If the base input isn't loaded or its file changed since it was loaded.
+        """
+        with self.lock:
+            self.load_all()
+            base = self.input(base_from)
+            if not base.file_path:
+                raise ValueError(f'Profile {base_from} is not loaded')
+            if base.index is None:
+                base_index = profile_index.ProfileIndex(base.file_path)
+                # The properties were parsed from the file as it was when it was loaded
+                if base_index.stat != base.stat:
+                    raise ValueError(f'{base.file_path} changed since it was loaded')
+                base.index = base_index
+            merged = self.merged
+            base_properties = base.properties
+            base_index = base.index
+        return profile_writer.patch_profile(merged, base_properties, base_index, file_path)
+
+    def __str__(self):
+        return f'<MergeSession: {self.a.file_path} + {self.b.file_path}>'
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Test fixtures.
+
+The modules live at the top of the repository, it's added to the path so the tests can be run
+with `python -m pytest` or `pytest` from any directory.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+PROFILE_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Profile xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+)
+PROFILE_FOOTER = '</Profile>\n'
+
+
+@pytest.fixture
+def profile_a() -> str:
+    return os.path.join(REPO_DIR, 'test_a.profile')
+
+
+@pytest.fixture
+def profile_b() -> str:
+    return os.path.join(REPO_DIR, 'test_b.profile')
+
+
+@pytest.fixture
+def write_profile(tmp_path):
+    """Returns a function that writes a profile file with the given elements and returns its
+    path.
+    """
+    def write(name: str, *elements: str) -> str:
+        file_path = tmp_path / name
+        file_path.write_text(
+            PROFILE_HEADER + ''.join(f'    {element}\n' for element in elements)
+            + PROFILE_FOOTER,
+            encoding='utf-8'
+        )
+        return str(file_path)
+    return write
+
+
+def ip_range(description: str, start: str, end: str) -> str:
+    return (
+        f'<loginIpRanges><description>{description}</description>'
+        f'<endAddress>{end}</endAddress><startAddress>{start}</startAddress></loginIpRanges>'
+    )
+
+
+def object_permissions(name: str, allow: bool) -> str:
+    value = 'true' if allow else 'false'
+    return (
+        f'<objectPermissions><allowCreate>{value}</allowCreate>'
+        f'<allowDelete>{value}</allowDelete><allowEdit>{value}</allowEdit>'
+        f'<allowRead>true</allowRead><modifyAllRecords>false</modifyAllRecords>'
+        f'<object>{name}</object><viewAllRecords>false</viewAllRecords></objectPermissions>'
+    )
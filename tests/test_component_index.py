@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import component_index
+import models
+
+
+def source_tree(tmp_path) -> str:
+    source_dir = tmp_path / 'force-app'
+    for relative_path in [
+        'classes/Existing.cls-meta.xml', 'objects/Foo__c/fields/Bar__c.field-meta.xml',
+        'objects/Account/fields/Score__c.field-meta.xml',
+    ]:
+        file_path = source_dir / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text('<x/>', encoding='utf-8')
+    return str(source_dir)
+
+
+def test_dangling_entries_are_found_and_pruned(tmp_path):
+    index = component_index.load_components(source_tree(tmp_path))
+    existing = models.ProfileApexClassAccess(apexClass='Existing', enabled=True)
+    deleted = models.ProfileApexClassAccess(apexClass='Deleted', enabled=True)
+    kept_field = models.ProfileFieldLevelSecurity(field='Foo__c.Bar__c', readable=True)
+    lost_field = models.ProfileFieldLevelSecurity(field='Account.Lost__c', readable=True)
+    standard_field = models.ProfileFieldLevelSecurity(field='Account.Name', readable=True)
+    properties = {
+        model.model_id: model
+        for model in [existing, deleted, kept_field, lost_field, standard_field]
+    }
+
+    dangling = index.dangling(properties)
+    assert [(model.model_id, *reference) for model, *reference in dangling] == [
+        ('Deleted', 'ApexClass', 'Deleted'),
+        ('Account.Lost__c', 'CustomField', 'Account.Lost__c'),
+    ]
+
+    new_properties, changed_ids, _dangling = index.prune(properties)
+    assert changed_ids == ['Deleted', 'Account.Lost__c']
+    assert new_properties['Deleted'].model_disabled is True
+    assert deleted.model_disabled is False
+
+
+def test_types_the_index_does_not_have_are_not_checked(tmp_path):
+    index = component_index.load_components(source_tree(tmp_path))
+    page = models.ProfileApexPageAccess(apexPage='Anything', enabled=True)
+
+    assert index.dangling({page.model_id: page}) == []
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from conftest import object_permissions
+
+import field_permissions
+import profile_parser
+
+FIELDS = {
+    'Plain__c': '<CustomField><type>Text</type></CustomField>',
+    'Formula__c': '<CustomField><formula>1</formula><type>Number</type></CustomField>',
+    'Required__c': '<CustomField><required>true</required><type>Text</type></CustomField>',
+    'Parent__c': '<CustomField><type>MasterDetail</type></CustomField>',
+}
+
+
+@pytest.fixture
+def source_dir(tmp_path) -> str:
+    for object_name in ['Foo__c', 'Bar__c', 'Settings__mdt']:
+        fields_dir = tmp_path / 'objects' / object_name / 'fields'
+        fields_dir.mkdir(parents=True)
+        for field_name, content in FIELDS.items():
+            (fields_dir / f'{field_name}.field-meta.xml').write_text(content, encoding='utf-8')
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_scan_fields_sniffs_the_field_files(source_dir, jobs):
+    fields, skipped = field_permissions.scan_fields(source_dir, jobs)
+
+    assert fields == {
+        f'{object_name}.{field_name}': read_only
+        for object_name in ['Foo__c', 'Bar__c']
+        for field_name, read_only in [('Plain__c', False), ('Formula__c', True)]
+    }
+    assert skipped == 4
+
+
+def test_packages_are_walked_in_parallel(tmp_path):
+    for package in ['core', 'sales', 'service']:
+        for object_name in [f'{package.title()}__c', 'Account']:
+            fields_dir = tmp_path / package / 'main' / 'objects' / object_name / 'fields'
+            fields_dir.mkdir(parents=True)
+            (fields_dir / f'{package}__c.field-meta.xml').write_text(
+                FIELDS['Plain__c'], encoding='utf-8'
+            )
+    (tmp_path / 'node_modules' / 'objects' / 'Hidden__c' / 'fields').mkdir(parents=True)
+
+    subtrees = field_permissions.split_source_tree(str(tmp_path), 3)
+    assert sorted(map(os.path.basename, subtrees)) == ['core', 'sales', 'service']
+
+    fields, skipped = field_permissions.scan_fields(str(tmp_path), 3)
+    assert (fields, skipped) == field_permissions.scan_fields(str(tmp_path), 1)
+    assert sorted(fields) == [
+        'Account.core__c', 'Account.sales__c', 'Account.service__c', 'Core__c.core__c',
+        'Sales__c.sales__c', 'Service__c.service__c',
+    ]
+
+
+def test_add_field_permissions_patches_only_the_missing_fields(source_dir, write_profile):
+    profile_path = write_profile(
+        'admin.profile', object_permissions('Foo__c', True),
+        '<fieldPermissions><editable>false</editable><field>Foo__c.Plain__c</field>'
+        '<readable>false</readable></fieldPermissions>'
+    )
+    fields, _skipped = field_permissions.scan_fields(source_dir, 1)
+
+    added = field_permissions.add_field_permissions(profile_path, fields, editable=True)
+
+    assert added == ['Bar__c.Formula__c', 'Bar__c.Plain__c', 'Foo__c.Formula__c']
+    _namespace, properties = profile_parser.parse_profile(profile_path)
+    assert properties['Foo__c.Plain__c'].readable is False
+    assert (properties['Bar__c.Plain__c'].readable, properties['Bar__c.Plain__c'].editable) == (
+        True, True
+    )
+    assert properties['Bar__c.Formula__c'].editable is False
+    assert 'Foo__c' in properties
+    assert field_permissions.add_field_permissions(profile_path, fields) == []
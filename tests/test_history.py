@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import copy
+import os
+
+import pytest
+
+import history
+import models
+import profile_parser
+
+
+def toggled(properties: dict, model_ids) -> dict:
+    """Returns a copy of properties with the toggles of some entries flipped.
+    """
+    properties = dict(properties)
+    for model_id in model_ids:
+        model = copy.copy(properties[model_id])
+        model.fields = {name: not value for name, value in model.toggles.items()}
+        properties[model_id] = model
+    return properties
+
+
+def states(properties: dict) -> dict:
+    return history.ProfileHistory.states_from_properties(properties)
+
+
+@pytest.fixture
+def versions(profile_a) -> list:
+    """Properties of five versions of a profile, each one flips a class access.
+    """
+    _namespace, properties = profile_parser.parse_profile(profile_a)
+    class_ids = sorted(
+        _id for _id, model in properties.items() if model.model_name == 'classAccesses'
+    )
+    result = [properties]
+    for index in range(4):
+        result.append(toggled(result[-1], [class_ids[index % len(class_ids)]]))
+    return result
+
+
+def test_reconstruct_returns_every_recorded_version(tmp_path, versions):
+    profile_history = history.ProfileHistory(str(tmp_path), compact_every=3)
+    for properties in versions:
+        profile_history.record(properties)
+
+    reopened = history.ProfileHistory(str(tmp_path), compact_every=3)
+    assert [v.is_base for v in reopened.versions] == [True, False, False, True, False]
+    for version, properties in enumerate(versions, 1):
+        assert states(reopened.reconstruct(version)) == states(properties)
+    assert states(reopened.reconstruct(-1)) == states(versions[-1])
+
+
+def test_entry_history_and_toggle_history(tmp_path, versions):
+    profile_history = history.ProfileHistory(str(tmp_path))
+    for properties in versions:
+        profile_history.record(properties)
+
+    flips = profile_history.toggle_history(
+        'classAccesses', 'AwesomeCustomClass1', 'enabled'
+    )
+    assert flips == [(2, True, False), (4, False, True)]
+    assert [op for _v, op, _c in profile_history.entry_history(
+        'classAccesses', 'AwesomeCustomClass1'
+    )] == [history.OP_ADD, history.OP_CHANGE, history.OP_CHANGE]
+
+
+def test_record_appends_to_the_manifest(tmp_path, versions):
+    profile_history = history.ProfileHistory(str(tmp_path))
+    profile_history.record(versions[0])
+    manifest_path = profile_history.manifest_path
+    with open(manifest_path, 'rb') as file_pointer:
+        first_record = file_pointer.read()
+
+    profile_history.record(versions[1])
+
+    with open(manifest_path, 'rb') as file_pointer:
+        manifest = file_pointer.read()
+    assert manifest.startswith(first_record)
+    assert len(manifest) > len(first_record)
+
+
+def test_a_cut_manifest_record_is_overwritten(tmp_path, versions):
+    profile_history = history.ProfileHistory(str(tmp_path))
+    profile_history.record(versions[0])
+    with open(profile_history.manifest_path, 'ab') as file_pointer:
+        file_pointer.write(b'\x80\x05garbage')
+
+    reopened = history.ProfileHistory(str(tmp_path))
+    assert len(reopened.versions) == 1
+    reopened.record(versions[1])
+
+    assert len(history.ProfileHistory(str(tmp_path)).versions) == 2
+
+
+def test_big_changes_write_a_base(tmp_path, versions):
+    properties = versions[0]
+    profile_history = history.ProfileHistory(str(tmp_path), compact_every=100)
+    profile_history.record(properties)
+    profile_history.record(toggled(properties, [
+        _id for _id, model in properties.items() if model.toggles
+    ][:len(properties) // 2]))
+
+    assert [v.is_base for v in profile_history.versions] == [True, True]
+
+
+def test_compact_makes_the_latest_version_a_base(tmp_path, versions):
+    profile_history = history.ProfileHistory(str(tmp_path))
+    for properties in versions[:3]:
+        profile_history.record(properties)
+
+    profile_history.compact()
+
+    reopened = history.ProfileHistory(str(tmp_path))
+    assert reopened.versions[-1].is_base
+    assert states(reopened.reconstruct(3)) == states(versions[2])
+
+
+def test_unknown_versions_raise_key_error(tmp_path, versions):
+    profile_history = history.ProfileHistory(str(tmp_path))
+    profile_history.record(versions[0])
+
+    for version in [0, 2, -3]:
+        with pytest.raises(KeyError):
+            profile_history.reconstruct(version)
+
+
+def test_cli_reports_unknown_versions_and_entries(tmp_path, profile_a, capsys):
+    store_path = str(tmp_path / 'store')
+    history.main(['record', store_path, profile_a])
+
+    for argv in [['show', store_path, '0'], ['log', store_path, 'classAccesses', 'Nope']]:
+        with pytest.raises(SystemExit) as error:
+            history.main(argv)
+        assert error.value.code == 2
+        assert 'not found' in capsys.readouterr().err
+
+
+def test_old_stores_are_refused(tmp_path):
+    with open(os.path.join(tmp_path, 'manifest.pickle'), 'wb'):
+        pass
+    with pytest.raises(ValueError):
+        history.ProfileHistory(str(tmp_path))
+
+
+def test_reconstruct_builds_legacy_categories(tmp_path):
+    field = models.ProfileFieldLevelSecurity(field='Account.Name', readable=True, api_version=20)
+    profile_history = history.ProfileHistory(str(tmp_path))
+    profile_history.record({field.model_id: field})
+    profile_history.record({field.model_id: toggled({0: field}, [0])[0]})
+
+    model = profile_history.reconstruct(2, api_version=20)[field.model_id]
+    assert type(model) is models.ProfileFieldLevelSecurity
+    assert model.model_name == 'fieldLevelSecurities'
+    assert model.readable is False
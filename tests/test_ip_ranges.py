@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import ip_ranges
+import models
+
+
+def login_range(description: str, start: str, end: str) -> models.ProfileLoginIpRanges:
+    return models.ProfileLoginIpRanges(
+        description=description, startAddress=start, endAddress=end
+    )
+
+
+def test_coalesce_merges_overlapping_and_adjacent_ranges():
+    office = login_range('Office', '10.0.0.0', '10.0.0.255')
+    inner = login_range('Inner', '10.0.0.100', '10.0.0.200')
+    vpn = login_range('VPN', '10.0.1.0', '10.0.1.255')
+    other = login_range('Other', '192.168.0.1', '192.168.0.10')
+
+    coalesced, invalid = ip_ranges.coalesce([vpn, other, inner, office])
+
+    assert invalid == []
+    assert [(r.start_address, r.end_address) for r in coalesced] == [
+        ('10.0.0.0', '10.0.1.255'), ('192.168.0.1', '192.168.0.10')
+    ]
+    assert coalesced[0].sources == [office, inner, vpn]
+    assert coalesced[1].sources == [other]
+
+
+def test_coalesce_keeps_ip_versions_apart_and_reports_invalid_ranges():
+    v4 = login_range('v4', '0.0.0.0', '0.0.0.10')
+    v6 = login_range('v6', '::', '::a')
+    reversed_range = login_range('Reversed', '10.0.0.9', '10.0.0.1')
+    mixed = login_range('Mixed', '10.0.0.1', '::1')
+    unreadable = login_range('Bad', '1.1.1.1', 'nope')
+
+    coalesced, invalid = ip_ranges.coalesce([v4, v6, reversed_range, mixed, unreadable])
+
+    assert [(r.version, r.start_address, r.end_address) for r in coalesced] == [
+        (4, '0.0.0.0', '0.0.0.10'), (6, '::', '::a')
+    ]
+    assert invalid == [reversed_range, mixed, unreadable]
+
+
+def test_coalesce_entries_builds_one_entry_per_range():
+    office = login_range('Office', '10.0.0.0', '10.0.0.255')
+    vpn = login_range('', '10.0.1.0', '10.0.1.255')
+    entries = {model.model_id: model for model in [office, vpn]}
+
+    merged = ip_ranges.coalesce_entries(entries)
+
+    assert list(merged) == ['Office: 10.0.0.0 - 10.0.1.255']
+    assert entries == {office.model_id: office, vpn.model_id: vpn}
+
+
+def test_coalesce_entries_leaves_other_categories_alone():
+    entries = {'custom': models.ProfileSingleValue('custom', True)}
+    assert ip_ranges.coalesce_entries(entries) is entries
+
+
+@pytest.mark.parametrize('address, expected', [
+    ('10.0.0.0', ('10.0.0.0', '10.0.1.255')),
+    ('10.0.1.255', ('10.0.0.0', '10.0.1.255')),
+    ('10.0.2.0', None),
+    ('9.255.255.255', None),
+    ('192.168.0.5', ('192.168.0.1', '192.168.0.10')),
+    ('2001:db8::1', ('2001:db8::', '2001:db8::ffff')),
+    ('::1', None),
+])
+def test_range_set_finds_the_range_of_an_address(address, expected):
+    range_set = ip_ranges.RangeSet([
+        login_range('Office', '10.0.0.0', '10.0.0.255'),
+        login_range('VPN', '10.0.1.0', '10.0.1.255'),
+        login_range('Other', '192.168.0.1', '192.168.0.10'),
+        login_range('v6', '2001:db8::', '2001:db8::ffff'),
+    ])
+
+    ip_range = range_set.find(address)
+
+    if expected is None:
+        assert ip_range is None
+        assert address not in range_set
+    else:
+        assert (ip_range.start_address, ip_range.end_address) == expected
+        assert address in range_set
+
+
+def test_range_set_rejects_unreadable_addresses():
+    with pytest.raises(ValueError):
+        ip_ranges.RangeSet([]).find('not an address')
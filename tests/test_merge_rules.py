@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import merge_rules
+import models
+
+RULES = r"""
+# category          pattern                 action
+classAccesses       TestDataFactory         keep
+classAccesses       Test*                   drop
+objectPermissions   Case                    force allowDelete=false
+*                   '/.*__c$/'              prefer A
+userPermissions     *                       force true
+"""
+
+
+def test_first_matching_rule_wins():
+    rule_set = merge_rules.parse_rules(RULES)
+
+    assert rule_set.match('classAccesses', 'TestDataFactory').action == 'keep'
+    assert rule_set.match('classAccesses', 'TestUtils').action == 'drop'
+    assert rule_set.match('classAccesses', 'Foo__c').action == 'prefer'
+    assert rule_set.match('classAccesses', 'Foo') is None
+    assert rule_set.match('userPermissions', 'ViewAllData').action == 'force'
+
+
+def test_resolve_applies_the_actions_without_modifying_the_inputs():
+    test_class = models.ProfileApexClassAccess(apexClass='TestUtils', enabled=True)
+    case = models.ProfileObjectPermissions(allowRead=True, allowDelete=True, f_object='Case')
+    custom_a = models.ProfileObjectPermissions(allowRead=True, f_object='Foo__c')
+    custom_b = models.ProfileObjectPermissions(f_object='Foo__c')
+    merged = {'TestUtils': test_class, 'Case': case, 'Foo__c': custom_b}
+
+    new_merged, changed_ids, counts = merge_rules.parse_rules(RULES).resolve(
+        merged, {'Foo__c': custom_a}, {'Foo__c': custom_b}
+    )
+
+    assert sorted(changed_ids) == ['Case', 'Foo__c', 'TestUtils']
+    assert new_merged['TestUtils'].model_disabled is True
+    assert (new_merged['Case'].allowDelete, new_merged['Case'].allowRead) == (False, True)
+    assert new_merged['Foo__c'].allowRead is True
+    assert counts == {'prefer': 1, 'force': 1, 'drop': 1, 'keep': 0}
+    assert test_class.model_disabled is False and case.allowDelete is True
+
+
+@pytest.mark.parametrize('text', ['classAccesses Foo', 'classAccesses Foo jump', '* Foo prefer C'])
+def test_invalid_rules_raise_value_error(text):
+    with pytest.raises(ValueError):
+        merge_rules.parse_rules(text)
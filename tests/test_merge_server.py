@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import http.client
+import json
+import shutil
+import threading
+
+import pytest
+
+import merge_server
+
+
+@pytest.fixture
+def server(tmp_path, profile_a, profile_b):
+    """Merge server on a free port, its output root is tmp_path/out.
+    """
+    shutil.copy(profile_a, tmp_path / 'a.profile')
+    shutil.copy(profile_b, tmp_path / 'b.profile')
+    (tmp_path / 'out').mkdir()
+
+    merge_server_ = merge_server.MergeServer(
+        ('127.0.0.1', 0), output_root=str(tmp_path / 'out')
+    )
+    thread = threading.Thread(target=merge_server_.serve_forever, daemon=True)
+    thread.start()
+    yield merge_server_
+    merge_server_.shutdown()
+    merge_server_.server_close()
+
+
+def post(server, path: str, body, headers=None) -> tuple:
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=10)
+    if headers is None:
+        headers = {'Content-Type': 'application/json'}
+    data = body if type(body) is bytes else json.dumps(body).encode('utf-8')
+    connection.request('POST', path, data, headers)
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+def test_merge_writes_inside_the_output_root(server, tmp_path):
+    status, response = post(server, '/merge', {
+        'a': str(tmp_path / 'a.profile'), 'b': str(tmp_path / 'b.profile'),
+        'output': 'merged.profile',
+    })
+
+    assert status == 200
+    assert response['entries'] > 0
+    assert (tmp_path / 'out' / 'merged.profile').exists()
+
+
+@pytest.mark.parametrize('output', ['../escaped.profile', '/tmp/escaped.profile'])
+def test_merge_refuses_outputs_outside_the_root(server, tmp_path, output):
+    status, response = post(server, '/merge', {
+        'a': str(tmp_path / 'a.profile'), 'b': str(tmp_path / 'b.profile'), 'output': output,
+    })
+
+    assert status == 400
+    assert 'outside' in response['error']
+    assert not (tmp_path / 'escaped.profile').exists()
+
+
+@pytest.mark.parametrize('body', [
+    [], 'text', 3, {'a': 1}, {'strategies': []}, {'strategies': {'custom': 1}},
+    {'merge_a_to_b': 'yes'}, {'output': ['x']},
+])
+def test_malformed_merge_requests_get_400(server, body):
+    status, response = post(server, '/merge', body)
+    assert status == 400
+    assert 'error' in response
+
+
+@pytest.mark.parametrize('body', [{'path': 5}, {'category': 'custom'}, {'model_id': []}])
+def test_malformed_query_requests_get_400(server, tmp_path, body):
+    if 'path' not in body:
+        body = dict(body, path=str(tmp_path / 'a.profile'))
+    status, _response = post(server, '/query', body)
+    assert status == (200 if body.get('category') else 400)
+
+
+def test_requests_from_web_pages_are_refused(server):
+    status, _response = post(server, '/merge', {}, {
+        'Content-Type': 'application/json', 'Origin': 'https://example.com'
+    })
+    assert status == 403
+
+    status, _response = post(server, '/merge', b'{}', {
+        'Content-Type': 'application/x-www-form-urlencoded'
+    })
+    assert status == 415
+
+
+def test_diff_and_status(server, tmp_path):
+    status, response = post(server, '/diff', {
+        'a': str(tmp_path / 'a.profile'), 'b': str(tmp_path / 'b.profile'),
+    })
+    assert status == 200
+    assert response['added'] or response['removed'] or response['changed']
+
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=10)
+    connection.request('GET', '/status')
+    stats = json.loads(connection.getresponse().read())
+    connection.close()
+    assert stats['misses'] == 2
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import merge_strategies
+import models
+
+
+def object_permissions(api_version=models.DEFAULT_API_VERSION, **toggles):
+    model = models.ProfileObjectPermissions(f_object='Case', api_version=api_version)
+    model.fields = toggles
+    return model
+
+
+def test_most_and_least_permissive_combine_the_toggles():
+    model_a = object_permissions(allowRead=True, allowEdit=True)
+    model_b = object_permissions(allowRead=True, allowCreate=True)
+
+    most = merge_strategies.get_strategy('most-permissive').merge_entry(model_a, model_b, False)
+    least = merge_strategies.get_strategy('least-permissive').merge_entry(
+        model_a, model_b, False
+    )
+
+    assert (most.allowRead, most.allowEdit, most.allowCreate) == (True, True, True)
+    assert (least.allowRead, least.allowEdit, least.allowCreate) == (True, False, False)
+    assert model_a.allowCreate is False
+
+
+def test_revoke_toggles_are_combined_as_the_access_they_take_away():
+    model_a = object_permissions(13, revokeCreate=True, revokeDelete=False, revokeEdit=True)
+    model_b = object_permissions(13, revokeCreate=False, revokeDelete=False, revokeEdit=True)
+
+    most = merge_strategies.get_strategy('most-permissive').merge_entry(model_a, model_b, False)
+    least = merge_strategies.get_strategy('least-permissive').merge_entry(
+        model_a, model_b, False
+    )
+
+    assert most.toggles == {'revokeCreate': False, 'revokeDelete': False, 'revokeEdit': True}
+    assert least.toggles == {'revokeCreate': True, 'revokeDelete': False, 'revokeEdit': True}
+
+
+def test_least_permissive_gives_no_access_to_entries_of_one_profile():
+    strategy = merge_strategies.get_strategy('least-permissive')
+
+    current = strategy.merge_entry(object_permissions(allowRead=True), None, False)
+    legacy = strategy.merge_entry(None, object_permissions(13, revokeEdit=False), False)
+
+    assert not any(current.toggles.values())
+    assert all(legacy.toggles.values())
+
+
+def test_intersection_and_prefer_strategies():
+    model_a = models.ProfileSingleValue('custom', True)
+    model_b = models.ProfileSingleValue('custom', False)
+
+    assert merge_strategies.get_strategy('intersection').merge_entry(model_a, None, False) is None
+    assert merge_strategies.get_strategy('prefer-a').merge_entry(model_a, model_b, False).value
+    assert not merge_strategies.get_strategy('prefer-b').merge_entry(model_a, model_b, True).value
+
+
+def test_merge_properties_coalesces_login_ip_ranges():
+    office = models.ProfileLoginIpRanges(
+        description='Office', startAddress='10.0.0.0', endAddress='10.0.0.255'
+    )
+    vpn = models.ProfileLoginIpRanges(
+        description='VPN', startAddress='10.0.1.0', endAddress='10.0.1.255'
+    )
+    custom = models.ProfileSingleValue('custom', True)
+
+    merged = merge_strategies.merge_properties(
+        {office.model_id: office, custom.model_id: custom}, {vpn.model_id: vpn}, False,
+        {'loginIpRanges': 'coalesce'}
+    )
+
+    assert sorted(merged) == ['Office: 10.0.0.0 - 10.0.1.255', 'custom']
+
+
+def test_unknown_strategies_raise_value_error():
+    with pytest.raises(ValueError):
+        merge_strategies.get_strategy('nope')
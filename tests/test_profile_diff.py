@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import json
+
+import profile_diff
+import profile_parser
+
+
+def test_stream_diff_matches_the_diff_of_the_parsed_profiles(profile_a, profile_b):
+    _namespace, properties_a = profile_parser.parse_profile(profile_a)
+    _namespace, properties_b = profile_parser.parse_profile(profile_b)
+    added, removed, changed = profile_diff.diff_properties(properties_a, properties_b)
+
+    records = list(profile_diff.stream_diff(profile_a, profile_b))
+
+    by_change = {}
+    for record in records:
+        by_change.setdefault(record['change'], set()).add(record['model_id'])
+    assert by_change.get('added', set()) == set(added)
+    assert by_change.get('removed', set()) == set(removed)
+    assert by_change.get('changed', set()) == set(changed)
+    assert sorted(map(json.dumps, records)) == sorted(
+        map(json.dumps, profile_diff.diff_records(properties_a, properties_b))
+    )
+
+
+def test_identical_profiles_have_no_records(profile_a):
+    assert list(profile_diff.stream_diff(profile_a, profile_a)) == []
+
+
+def test_diff_writer_formats(profile_a, profile_b):
+    records = list(profile_diff.stream_diff(profile_a, profile_b))
+
+    jsonl = io.StringIO()
+    assert profile_diff.DiffWriter(jsonl).write_all(records) == len(records)
+    assert [json.loads(line) for line in jsonl.getvalue().splitlines()] == records
+
+    csv_output = io.StringIO(newline='')
+    profile_diff.DiffWriter(csv_output, 'csv').write_all(records)
+    rows = list(csv.reader(io.StringIO(csv_output.getvalue())))
+    assert rows[0] == list(profile_diff.DIFF_FIELDS)
+    assert len(rows) == len(records) + 1
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from conftest import ip_range, object_permissions
+
+import profile_index
+import profile_parser
+
+
+@pytest.fixture
+def indexed_profile(write_profile) -> profile_index.ProfileIndex:
+    elements = [object_permissions(f'Obj{i}__c', i % 2 == 0) for i in range(200)]
+    elements += [ip_range(f'Office {i}', f'10.0.{i}.0', f'10.0.{i}.255') for i in range(10)]
+    elements.append('<custom>false</custom>')
+    return profile_index.ProfileIndex(write_profile('big.profile', *elements))
+
+
+def test_parse_categories_reports_its_progress(indexed_profile, monkeypatch):
+    monkeypatch.setattr(profile_parser, 'PROGRESS_INTERVAL', 0)
+    reports = []
+
+    properties = indexed_profile.parse_categories(
+        indexed_profile.categories, lambda *report: reports.append(report)
+    )
+
+    assert len(properties) == 211
+    total_bytes = sum(indexed_profile.category_bytes(c) for c in indexed_profile.categories)
+    assert [bytes_parsed for bytes_parsed, _total, _counts in reports] == sorted(
+        bytes_parsed for bytes_parsed, _total, _counts in reports
+    )
+    assert reports[-1] == (
+        total_bytes, total_bytes, {'objectPermissions': 200, 'loginIpRanges': 10, 'custom': 1}
+    )
+
+
+@pytest.mark.parametrize('checks_before_cancel', [0, 2])
+def test_parse_categories_can_be_cancelled(indexed_profile, checks_before_cancel):
+    checks = []
+
+    def is_cancelled() -> bool:
+        checks.append(True)
+        return len(checks) > checks_before_cancel
+
+    with pytest.raises(profile_parser.ScanCancelled):
+        indexed_profile.parse_categories(indexed_profile.categories, is_cancelled=is_cancelled)
+    assert 'objectPermissions' not in indexed_profile.parsed
+
+
+def test_a_changed_file_is_not_parsed(indexed_profile, write_profile):
+    write_profile('big.profile', '<custom>true</custom>')
+
+    with pytest.raises(profile_index.StaleIndex):
+        indexed_profile.parse_categories(['custom'])
+    assert indexed_profile.parsed == set()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import copy
+
+from conftest import object_permissions
+
+import models
+import profile_index
+import profile_parser
+import profile_writer
+
+
+def parse(file_path: str) -> dict:
+    _namespace, properties = profile_parser.parse_profile(file_path)
+    return {_id: models.model_state(model) for _id, model in properties.items()}
+
+
+def test_write_profile_round_trips(tmp_path, profile_a):
+    namespace, properties = profile_parser.parse_profile(profile_a)
+    output_path = str(tmp_path / 'out.profile')
+
+    profile_writer.write_profile(properties, output_path, namespace)
+
+    assert parse(output_path) == parse(profile_a)
+
+
+def test_patch_profile_only_rewrites_the_changes(tmp_path, write_profile):
+    base_path = write_profile(
+        'base.profile', object_permissions('Case', True), object_permissions('Lead', False),
+        '<custom>false</custom>'
+    )
+    base_index = profile_index.ProfileIndex(base_path)
+    base_properties = base_index.parse_categories(['objectPermissions', 'custom'])
+
+    properties = dict(base_properties)
+    lead = properties['Lead'] = copy.copy(base_properties['Lead'])
+    lead.allowEdit = True
+    del properties['Case']
+    account = models.ProfileObjectPermissions(allowRead=True, f_object='Account')
+    properties[account.model_id] = account
+    output_path = str(tmp_path / 'patched.profile')
+
+    added, removed, changed = profile_writer.patch_profile(
+        properties, base_properties, base_index, output_path
+    )
+
+    assert (added, removed, changed) == (['Account'], ['Case'], ['Lead'])
+    assert parse(output_path) == {
+        _id: models.model_state(model) for _id, model in properties.items()
+    }
+    with open(base_path, encoding='utf-8') as file_pointer:
+        custom_line = [line for line in file_pointer if '<custom>' in line]
+    with open(output_path, encoding='utf-8') as file_pointer:
+        assert custom_line[0] in file_pointer.read()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import models
+import rerere
+
+
+def conflict() -> tuple:
+    case_a = models.ProfileObjectPermissions(allowRead=True, allowEdit=True, f_object='Case')
+    case_b = models.ProfileObjectPermissions(allowRead=True, f_object='Case')
+    return {'Case': case_a}, {'Case': case_b}
+
+
+def test_recorded_resolutions_are_replayed(tmp_path):
+    properties_a, properties_b = conflict()
+    merged = {'Case': properties_b['Case']}
+    log_filepath = str(tmp_path / 'resolutions.jsonl')
+
+    decision_log = rerere.DecisionLog(log_filepath)
+    assert decision_log.unresolved(merged, properties_a, properties_b) == [
+        ('objectPermissions', 'Case', 'allowEdit')
+    ]
+    decision_log.record([
+        decision_log.decide('Case', 'allowEdit', True, merged, properties_a, properties_b)
+    ])
+
+    reloaded = rerere.DecisionLog(log_filepath)
+    new_merged, changed_ids, replayed = reloaded.resolve(merged, properties_a, properties_b)
+
+    assert (changed_ids, replayed) == (['Case'], 1)
+    assert new_merged['Case'].allowEdit is True
+    assert merged['Case'].allowEdit is False
+    assert reloaded.unresolved(new_merged, properties_a, properties_b) == []
+
+
+def test_resolutions_of_other_values_are_not_replayed(tmp_path):
+    properties_a, properties_b = conflict()
+    decision_log = rerere.DecisionLog(str(tmp_path / 'resolutions.jsonl'))
+    decision_log.record([rerere.Decision(
+        'objectPermissions', 'Case', 'allowEdit', False, True, True
+    )])
+
+    _merged, changed_ids, replayed = decision_log.resolve(
+        {'Case': properties_b['Case']}, properties_a, properties_b
+    )
+
+    assert (changed_ids, replayed) == ([], 0)
+
+
+def test_compact_keeps_the_last_decision_of_each_key(tmp_path):
+    log_filepath = str(tmp_path / 'resolutions.jsonl')
+    decision_log = rerere.DecisionLog(log_filepath)
+    for value in [True, False, True]:
+        decision_log.record([rerere.Decision('custom', 'custom', 'value', True, False, value)])
+    assert decision_log.recorded == 3
+
+    decision_log.compact()
+
+    with open(log_filepath, encoding='utf-8') as file_pointer:
+        assert len(file_pointer.readlines()) == 1
+    assert len(rerere.DecisionLog(log_filepath)) == 1
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import shutil
+
+import pytest
+
+from conftest import ip_range, object_permissions
+
+import models
+import profile_index
+import profile_parser
+from session import MergeSession, FROM_A, FROM_B
+
+
+def login_range(description: str, start: str, end: str) -> models.ProfileLoginIpRanges:
+    return models.ProfileLoginIpRanges(
+        description=description, startAddress=start, endAddress=end
+    )
+
+
+def coalescing_session(properties_a: dict, properties_b: dict) -> MergeSession:
+    merge_session = MergeSession()
+    merge_session.set_strategy('loginIpRanges', 'coalesce')
+    merge_session.set_input(FROM_A, '', None, properties_a)
+    merge_session.set_input(FROM_B, '', None, properties_b)
+    merge_session.rebuild_merged()
+    return merge_session
+
+
+def test_rebuild_merged_prefers_the_preferred_input(profile_a, profile_b):
+    merge_session = MergeSession()
+    merge_session.load_file(FROM_A, profile_a)
+    merge_session.load_file(FROM_B, profile_b)
+    merge_session.rebuild_merged()
+
+    assert merge_session.merged.keys() == (
+        merge_session.a.properties.keys() | merge_session.b.properties.keys()
+    )
+    for model_id, model in merge_session.b.properties.items():
+        assert models.model_state(merge_session.merged[model_id]) == models.model_state(model)
+        assert merge_session.merged[model_id] is not model
+
+
+def test_removing_an_absorbed_range_merges_the_category_again():
+    range_a = login_range('a', '10.0.0.0', '10.0.0.255')
+    range_b = login_range('b', '10.0.1.0', '10.0.1.255')
+    merge_session = coalescing_session({range_a.model_id: range_a}, {range_b.model_id: range_b})
+    assert list(merge_session.merged) == ['a: 10.0.0.0 - 10.0.1.255']
+
+    merge_session.apply_changes(FROM_A, {})
+    assert list(merge_session.merged) == ['b: 10.0.1.0 - 10.0.1.255']
+
+    merge_session.apply_changes(FROM_A, {range_a.model_id: range_a})
+    merge_session.apply_changes(FROM_B, {})
+    assert list(merge_session.merged) == ['a: 10.0.0.0 - 10.0.0.255']
+
+
+def test_apply_changes_updates_the_merged_dict_in_place():
+    read_only = models.ProfileObjectPermissions(allowRead=True, f_object='Case')
+    editable = models.ProfileObjectPermissions(allowRead=True, allowEdit=True, f_object='Case')
+    merge_session = MergeSession()
+    merge_session.set_input(FROM_A, '', None, {read_only.model_id: read_only})
+    merge_session.rebuild_merged()
+    merged = merge_session.merged
+
+    added, removed, changed = merge_session.apply_changes(
+        FROM_A, {editable.model_id: editable}
+    )
+
+    assert (added, removed, changed) == ([], [], ['Case'])
+    assert merge_session.merged is merged
+    assert merged['Case'].allowEdit is True
+
+
+def test_load_categories_merges_the_pending_categories(write_profile):
+    elements = [object_permissions('Case', False), ip_range('Office', '1.1.1.1', '1.1.1.9')]
+    path_a = write_profile('a.profile', *elements)
+    path_b = write_profile('b.profile', object_permissions('Case', True))
+
+    merge_session = MergeSession(merge_a_to_b=True)
+    for from_profile, file_path in [(FROM_A, path_a), (FROM_B, path_b)]:
+        index = profile_index.ProfileIndex(file_path)
+        merge_session.set_input(from_profile, file_path, index.namespace, {}, index)
+    merge_session.rebuild_merged()
+    assert merge_session.merged == {}
+
+    keys = merge_session.load_categories(['objectPermissions'])
+
+    assert keys == ['Case']
+    assert merge_session.merged['Case'].allowCreate is False
+    assert merge_session.pending_categories == {'loginIpRanges'}
+
+
+def test_save_patch_refuses_a_base_file_changed_since_it_was_loaded(
+    tmp_path, profile_a, profile_b
+):
+    path_b = str(shutil.copy(profile_b, tmp_path / 'b.profile'))
+    merge_session = MergeSession()
+    merge_session.load_file(FROM_A, profile_a)
+    merge_session.load_file(FROM_B, path_b)
+    merge_session.rebuild_merged()
+    output_path = tmp_path / 'patched.profile'
+
+    with open(path_b, encoding='utf-8') as file_pointer:
+        text = file_pointer.read()
+    start = text.index('<classAccesses>\n        <apexClass>AwesomeCustomClass1')
+    end = text.index('</classAccesses>', start) + len('</classAccesses>')
+    with open(path_b, 'w', encoding='utf-8') as file_pointer:
+        file_pointer.write(text[:start] + text[end:])
+
+    assert 'AwesomeCustomClass1' in merge_session.merged
+    with pytest.raises(ValueError, match='changed since it was loaded'):
+        merge_session.save_patch(str(output_path))
+    assert not output_path.exists()
+
+    merge_session.load_file(FROM_B, path_b)
+    merge_session.rebuild_merged()
+    merge_session.save_patch(str(output_path))
+    assert output_path.exists()
+
+
+def test_load_categories_refuses_a_file_changed_since_it_was_indexed(write_profile):
+    path_a = write_profile('a.profile', object_permissions('Case', False))
+    path_b = write_profile('b.profile', object_permissions('Case', True))
+    merge_session = MergeSession()
+    for from_profile, file_path in [(FROM_A, path_a), (FROM_B, path_b)]:
+        index = profile_index.ProfileIndex(file_path)
+        merge_session.set_input(from_profile, file_path, index.namespace, {}, index)
+    merge_session.rebuild_merged()
+
+    path_b = write_profile('b.profile', object_permissions('Account', True))
+    with pytest.raises(profile_index.StaleIndex):
+        merge_session.load_categories(['objectPermissions'])
+    assert merge_session.a.properties == {}
+    assert merge_session.pending_categories == {'objectPermissions'}
+
+    # The watcher's reload path loads the whole file again
+    _namespace, properties = profile_parser.parse_profile(path_b)
+    merge_session.apply_changes(FROM_B, properties)
+    assert merge_session.load_categories(['objectPermissions']) == ['Account', 'Case']
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import collections
+import os
+
+import pytest
+
+import models
+import profile_parser
+import transcoder
+
+
+def categories(profile_filepath: str, api_version: int) -> collections.Counter:
+    return collections.Counter(
+        model.model_name for model in profile_parser.iter_profile(profile_filepath, api_version)
+    )
+
+
+@pytest.mark.parametrize('to_version', [54, 45, 44])
+def test_recent_versions_keep_every_category(tmp_path, profile_a, to_version):
+    target = str(tmp_path / 'out.profile')
+
+    dropped = transcoder.transcode_profile(profile_a, target, to_version, 54)
+
+    assert dropped == {}
+    assert categories(target, to_version) == categories(profile_a, 54)
+
+
+def test_round_trip_through_api_20_only_drops_what_it_lacks(tmp_path, profile_a):
+    legacy = str(tmp_path / 'v20.profile')
+    current = str(tmp_path / 'v54.profile')
+
+    dropped = transcoder.transcode_profile(profile_a, legacy, 20, 54)
+    assert dropped == {'custom': 1, 'profileActionOverrides': 1, 'userPermissions': 5}
+    assert 'fieldLevelSecurities' in categories(legacy, 20)
+
+    assert transcoder.transcode_profile(legacy, current, 54, 20) == {}
+    expected = categories(profile_a, 54)
+    del expected['custom'], expected['profileActionOverrides'], expected['userPermissions']
+    assert categories(current, 54) == expected
+
+
+def test_object_permissions_are_revoked_before_api_14(tmp_path, write_profile):
+    source = write_profile(
+        'a.profile',
+        '<objectPermissions><allowCreate>false</allowCreate><allowDelete>false</allowDelete>'
+        '<allowEdit>true</allowEdit><allowRead>true</allowRead>'
+        '<modifyAllRecords>false</modifyAllRecords><object>Case</object>'
+        '<viewAllRecords>false</viewAllRecords></objectPermissions>'
+    )
+    legacy = str(tmp_path / 'v13.profile')
+    current = str(tmp_path / 'v54.profile')
+
+    transcoder.transcode_profile(source, legacy, 13, 54)
+    with open(legacy, encoding='utf-8') as file_pointer:
+        xml_str = file_pointer.read()
+    assert '<revokeCreate>true</revokeCreate>' in xml_str
+    assert '<revokeEdit>false</revokeEdit>' in xml_str
+    assert 'allowEdit' not in xml_str
+
+    transcoder.transcode_profile(legacy, current, 54, 13)
+    model = next(profile_parser.iter_profile(current))
+    assert (model.allowCreate, model.allowEdit, model.allowRead) == (False, True, True)
+
+
+def test_hidden_fields_lose_their_access_after_api_22():
+    hidden = models.ProfileFieldLevelSecurity(
+        field='Account.Name', editable=True, readable=True, hidden=True, api_version=20
+    )
+
+    model = transcoder.transcode_model(hidden, 20, 54)
+
+    assert model.model_name == 'fieldPermissions'
+    assert (model.readable, model.editable) == (False, False)
+
+
+def test_model_from_state_builds_legacy_field_permissions():
+    model = models.model_from_state(
+        'fieldLevelSecurities',
+        {'field': 'Account.Name', 'editable': False, 'readable': True, 'hidden': False}, 20
+    )
+
+    assert type(model) is models.ProfileFieldLevelSecurity
+    assert model.model_id == 'Account.Name'
+
+
+def test_transcode_directory_keeps_the_layout(tmp_path, profile_a):
+    source_dir = tmp_path / 'src' / 'profiles'
+    source_dir.mkdir(parents=True)
+    (source_dir / 'Admin.profile-meta.xml').write_bytes(open(profile_a, 'rb').read())
+    (source_dir / 'notes.txt').write_text('not a profile')
+
+    results = transcoder.transcode_directory(
+        str(tmp_path / 'src'), str(tmp_path / 'out'), 40, 54, jobs=1
+    )
+
+    assert [os.path.basename(path) for path, _dropped in results] == ['Admin.profile-meta.xml']
+    assert (tmp_path / 'out' / 'profiles' / 'Admin.profile-meta.xml').exists()
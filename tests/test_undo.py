@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import copy
+
+import models
+import undo
+
+
+def test_diff_and_apply_operations_round_trip():
+    case = models.ProfileObjectPermissions(allowRead=True, f_object='Case')
+    custom = models.ProfileSingleValue('custom', False)
+    old_merged = {case.model_id: case, custom.model_id: custom}
+
+    new_case = copy.copy(case)
+    new_case.allowEdit = True
+    new_case.model_disabled = True
+    added = models.ProfileApexClassAccess(apexClass='Foo', enabled=True)
+    new_merged = {case.model_id: new_case, added.model_id: added}
+    model_ids = old_merged.keys() | new_merged.keys()
+    old_states = {_id: models.model_state(m) for _id, m in old_merged.items()}
+
+    operations = undo.diff_operations(old_merged, new_merged, model_ids)
+    assert sorted((op.model_id, str(op.toggle_name)) for op in operations) == [
+        ('Case', 'None'), ('Case', 'allowEdit'), ('Foo', '*'), ('custom', '*'),
+    ]
+
+    undone = undo.apply_operations(new_merged, operations, undo=True)
+    assert {_id: models.model_state(m) for _id, m in undone.items()} == old_states
+    assert undone['Case'].model_disabled is False
+
+    redone = undo.apply_operations(undone, operations, undo=False)
+    assert redone.keys() == {'Case', 'Foo'}
+    assert redone['Case'].allowEdit is True
+
+
+def test_undo_stack_skips_empty_steps_and_clears_redo():
+    stack = undo.UndoStack(max_steps=2)
+    assert stack.push('Nothing', [undo.Operation('a', 'x', True, True)]) is None
+
+    for label in ['one', 'two', 'three']:
+        stack.push(label, [undo.Operation('a', 'x', False, True)])
+    assert [step.label for step in stack.done] == ['two', 'three']
+
+    assert stack.undo().label == 'three'
+    assert stack.can_redo
+    stack.push('four', [undo.Operation('a', 'x', False, True)])
+    assert not stack.can_redo
+    assert stack.redo() is None
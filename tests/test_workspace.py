@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+
+import pytest
+
+import models
+import rerere
+import undo
+import workspace
+from session import MergeSession, FROM_A, FROM_B
+
+
+def merge_session_of(file_path_a: str, file_path_b: str) -> MergeSession:
+    merge_session = MergeSession()
+    merge_session.load_file(FROM_A, file_path_a)
+    merge_session.load_file(FROM_B, file_path_b)
+    merge_session.set_strategy('objectPermissions', 'union')
+    merge_session.rebuild_merged()
+    return merge_session
+
+
+def test_workspace_round_trip(tmp_path, profile_a, profile_b):
+    file_path_a = shutil.copy(profile_a, tmp_path / 'a.profile')
+    file_path_b = shutil.copy(profile_b, tmp_path / 'b.profile')
+    merge_session = merge_session_of(str(file_path_a), str(file_path_b))
+    workspace_filepath = str(tmp_path / 'merge.sfpm')
+
+    # Overrides made after the merge, like the clicks on the merged tree
+    disabled_id, edited_id = sorted(
+        _id for _id, model in merge_session.merged.items()
+        if model.model_name == 'objectPermissions'
+    )[:2]
+    allow_edit = merge_session.merged[edited_id].allowEdit
+    merge_session.apply_operations([
+        undo.Operation(disabled_id, rerere.DISABLED_TOGGLE, False, True),
+        undo.Operation(edited_id, 'allowEdit', allow_edit, not allow_edit),
+    ], undo=False)
+
+    workspace.save_workspace(merge_session, workspace_filepath)
+    restored = MergeSession()
+    assert workspace.load_workspace(restored, workspace_filepath) == []
+
+    assert restored.strategies == merge_session.strategies
+    assert {_id: models.model_state(m) for _id, m in restored.merged.items()} == {
+        _id: models.model_state(m) for _id, m in merge_session.merged.items()
+    }
+    assert {_id for _id, m in restored.merged.items() if m.model_disabled} == {disabled_id}
+    assert restored.merged[edited_id].allowEdit is (not allow_edit)
+    # The overrides stay on the merged state, the inputs are what the files have
+    for from_profile in [FROM_A, FROM_B]:
+        properties = restored.input(from_profile).properties
+        assert not any(model.model_disabled for model in properties.values())
+        assert {_id: models.model_state(m) for _id, m in properties.items()} == {
+            _id: models.model_state(m)
+            for _id, m in merge_session.input(from_profile).properties.items()
+        }
+
+    with open(file_path_b, 'a', encoding='utf-8') as file_pointer:
+        file_pointer.write('\n')
+    assert workspace.load_workspace(MergeSession(), workspace_filepath) == [FROM_B]
+
+    os.remove(file_path_a)
+    assert workspace.load_workspace(MergeSession(), workspace_filepath) == [FROM_A, FROM_B]
+
+
+def test_other_files_are_refused(tmp_path, profile_a):
+    with pytest.raises(ValueError):
+        workspace.load_workspace(MergeSession(), profile_a)
+
+    workspace_filepath = tmp_path / 'old.sfpm'
+    workspace_filepath.write_bytes(workspace.WORKSPACE_MAGIC + bytes([0]))
+    with pytest.raises(ValueError):
+        workspace.load_workspace(MergeSession(), str(workspace_filepath))
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Transcoder.
+
+This module converts profiles between Salesforce API versions, ex: to deploy a profile retrieved
+with a new API version to a project pinned to an older one.
+
+A profile is read with the models of the version it was written in and written with the models
+of the target version, one element at a time:
+    - Categories that the source version has and the target version doesn't are dropped, see
+      models.CATEGORY_VERSIONS.
+    - Renamed categories take the name of the target version, ex: fieldLevelSecurities up to
+      API 22 and fieldPermissions after it.
+    - The fields follow the target version, ex: hidden of field permissions up to API 22 or
+      revoke* of object permissions before API 14.
+
+The elements are written in the order of the source file. A directory is converted with a
+process per profile, keeping its layout.
+
+Attributes:
+    PROFILE_SUFFIXES (tuple): Endings of the profile file names found in a directory.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import copy
+import multiprocessing
+import os
+from xml.etree import ElementTree
+
+import models
+import profile_parser
+import profile_writer
+from utils import str_to_bool
+
+PROFILE_SUFFIXES = ('.profile', '.profile-meta.xml')
+
+
+def in_version(model_name: str, from_version: int, to_version: int) -> bool:
+    """Returns if a category is kept when converting between API versions. Only the categories
+    that the source version has and the target version doesn't are dropped, a profile that has a
+    category out of its version keeps it.
+    """
+    return (
+        models.category_in_version(model_name, to_version)
+        or not models.category_in_version(model_name, from_version)
+    )
+
+
+def transcode_model(model: models.ProfileFieldType, from_version: int, to_version: int):
+    """Returns the model of an entry at another API version.
+
+    Args:
+        model (ProfileFieldType): Entry read at from_version.
+        from_version (int): API version of the entry.
+        to_version (int): API version to convert to.
+
+    Returns:
+        ProfileFieldType: A new model, None if the target version doesn't have the category.
+    """
+    model_class = type(model)
+    if model_class is models.ProfileSingleValue or model_class is models.ProfileRawElement:
+        if not in_version(model.model_name, from_version, to_version):
+            return None
+        new_model = copy.copy(model)
+        new_model.api_version = to_version
+        return new_model
+
+    new_model = model_class(api_version=to_version)
+    if not in_version(new_model.model_name, from_version, to_version):
+        return None
+
+    state = dict(model.fields)
+    if model_class is models.ProfileFieldLevelSecurity:
+        hidden = state.pop('hidden', None)
+        if from_version <= 22 < to_version and str_to_bool(hidden):
+            # A hidden field had no access
+            state['editable'] = state['readable'] = False
+        elif to_version <= 22 < from_version:
+            state['hidden'] = not str_to_bool(state['readable'])
+    elif model_class is models.ProfileObjectPermissions and from_version < 14 <= to_version:
+        # Read access couldn't be revoked
+        state['allowRead'] = True
+
+    new_model.fields = state
+    return new_model
+
+
+def read_namespace(profile_filepath: str) -> str:
+    """Returns the namespace of the root element of a profile, only its start is read.
+    """
+    with open(profile_filepath, 'rb') as file_pointer:
+        for _event, element in ElementTree.iterparse(file_pointer, events=('start',)):
+            return profile_parser.get_namespace(element).strip('{}')
+    return ''
+
+
+def transcode_profile(
+    source_filepath: str, target_filepath: str, to_version: int,
+    from_version=models.DEFAULT_API_VERSION
+) -> dict:
+    """Converts a profile file to another API version, streaming its elements.
+
+    Args:
+        source_filepath (str): Profile to convert.
+        target_filepath (str): Output path, it's replaced atomically and can be the source.
+        to_version (int): API version to convert to.
+        from_version (int): (default=DEFAULT_API_VERSION) API version of the source.
+
+    Returns:
+        dict: Entries dropped by category.
+    """
+    namespace = read_namespace(source_filepath) or profile_writer.METADATA_NAMESPACE
+    dropped = {}
+
+    temp_path = f'{target_filepath}.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file_pointer:
+            file_pointer.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            file_pointer.write(f'<Profile xmlns="{namespace}">\n')
+            for model in profile_parser.iter_profile(source_filepath, from_version):
+                new_model = transcode_model(model, from_version, to_version)
+                if new_model is None:
+                    dropped[model.model_name] = dropped.get(model.model_name, 0) + 1
+                    continue
+                xml_str = profile_writer.element_to_xml(new_model)
+                if xml_str is not None:
+                    file_pointer.write(f'{profile_writer.INDENT}{xml_str}\n')
+            file_pointer.write('</Profile>\n')
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, target_filepath)
+    return dropped
+
+
+def find_profiles(directory: str) -> list:
+    """Returns the paths of the profiles in a directory and its subdirectories, relative to it.
+    """
+    profiles = []
+    for dir_path, _dir_names, file_names in os.walk(directory):
+        for file_name in file_names:
+            if file_name.endswith(PROFILE_SUFFIXES):
+                profiles.append(os.path.relpath(os.path.join(dir_path, file_name), directory))
+    return sorted(profiles)
+
+
+def transcode_task(task: tuple) -> tuple:
+    """Runs transcode_profile in a pool process.
+
+    Args:
+        task (tuple): (source_filepath, target_filepath, to_version, from_version)
+
+    Returns:
+        tuple: (source_filepath, entries dropped by category)
+    """
+    source_filepath, target_filepath, to_version, from_version = task
+    return source_filepath, transcode_profile(
+        source_filepath, target_filepath, to_version, from_version
+    )
+
+
+def transcode_directory(
+    source_dir: str, target_dir: str, to_version: int, from_version=models.DEFAULT_API_VERSION,
+    jobs=None
+) -> list:
+    """Converts the profiles of a directory to another API version, the subdirectories are
+    created in the target directory as needed.
+
+    Args:
+        source_dir (str): Directory with the profiles, see PROFILE_SUFFIXES.
+        target_dir (str): Output directory, it can be the source directory.
+        to_version (int): API version to convert to.
+        from_version (int): (default=DEFAULT_API_VERSION) API version of the profiles.
+        jobs (int): (Optional) Processes to use, one per CPU by default.
+
+    Returns:
+        list: (source_filepath, entries dropped by category) of each profile.
+    """
+    tasks = []
+    for relative_path in find_profiles(source_dir):
+        target_filepath = os.path.join(target_dir, relative_path)
+        os.makedirs(os.path.dirname(target_filepath) or '.', exist_ok=True)
+        tasks.append(
+            (os.path.join(source_dir, relative_path), target_filepath, to_version, from_version)
+        )
+
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+    if jobs <= 1:
+        return [transcode_task(task) for task in tasks]
+    with multiprocessing.Pool(jobs) as pool:
+        return pool.map(transcode_task, tasks, chunksize=1)
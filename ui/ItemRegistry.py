@@ -0,0 +1,67 @@
+import weakref
+
+
+class ItemRegistry:
+    """Registry of the UiProfileItems shown in the QTrees, keyed by session and tree.
+
+    Items are owned by their QTree, the registry only holds weak references to them, so items
+    dropped by a tree.clear() are not kept alive. Rebuilding a tree resets its entries in place
+    and a session that is garbage collected takes its entries with it.
+
+    Attributes:
+        sessions (WeakKeyDictionary): session -> tree name -> model_id -> list of weakrefs.
+    """
+    def __init__(self):
+        self.sessions = weakref.WeakKeyDictionary()
+
+    def __tree(self, session, tree_name: str) -> dict:
+        return self.sessions.setdefault(session, {}).setdefault(tree_name, {})
+
+    def reset(self, session, tree_name: str):
+        """Forgets all the items of a tree, call it before the tree is rebuilt.
+        """
+        self.__tree(session, tree_name).clear()
+
+    def add(self, session, tree_name: str, item):
+        """Registers an item under its id (model_id).
+        """
+        self.__tree(session, tree_name).setdefault(item.id, []).append(weakref.ref(item))
+
+    def items(self, session, tree_name: str, model_id: str) -> list:
+        """Returns the live items of an entry, dead references are pruned on the way.
+        """
+        tree = self.__tree(session, tree_name)
+        refs = tree.get(model_id)
+        if not refs:
+            return []
+
+        items = [item for item in (ref() for ref in refs) if item is not None]
+        if len(items) != len(refs):
+            if items:
+                tree[model_id] = [weakref.ref(item) for item in items]
+            else:
+                del tree[model_id]
+        return items
+
+    def model_ids(self, session, tree_name: str) -> list:
+        return list(self.__tree(session, tree_name).keys())
+
+    def prune(self):
+        """Drops the dead references of every tree.
+        """
+        for trees in self.sessions.values():
+            for tree in trees.values():
+                for model_id in list(tree.keys()):
+                    refs = [ref for ref in tree[model_id] if ref() is not None]
+                    if refs:
+                        tree[model_id] = refs
+                    else:
+                        del tree[model_id]
+
+    def __len__(self):
+        return sum(
+            len(refs)
+            for trees in self.sessions.values()
+            for tree in trees.values()
+            for refs in tree.values()
+        )
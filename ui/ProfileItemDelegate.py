@@ -0,0 +1,61 @@
+from PySide2 import QtGui, QtCore
+from PySide2.QtWidgets import QStyledItemDelegate, QStyleOptionViewItem, QTreeWidget
+from ui.UiProfileItem import UiProfileItem
+
+# Brushes
+brush_f_normal = QtGui.QBrush(QtGui.QColor(255, 255, 255))
+brush_f_normal.setStyle(QtCore.Qt.SolidPattern)
+brush_b_normal = QtGui.QBrush(QtGui.QColor(0, 0, 0))
+brush_b_normal.setStyle(QtCore.Qt.NoBrush)
+
+brush_b_enabled = QtGui.QBrush(QtGui.QColor(0, 69, 0))
+brush_b_enabled.setStyle(QtCore.Qt.SolidPattern)
+
+brush_b_disabled = QtGui.QBrush(QtGui.QColor(69, 0, 0))
+brush_b_disabled.setStyle(QtCore.Qt.SolidPattern)
+
+brush_b_removed = QtGui.QBrush(QtGui.QColor(71, 71, 71))
+brush_b_removed.setStyle(QtCore.Qt.BDiagPattern)
+brush_f_removed = QtGui.QBrush(QtGui.QColor(170, 170, 170))
+brush_f_removed.setStyle(QtCore.Qt.SolidPattern)
+
+
+class ProfileItemDelegate(QStyledItemDelegate):
+    """Paints the UiProfileItems of a QTreeWidget.
+
+    The colors are derived from the model of the item when it's painted, so the items don't
+    store any brushes of their own. The label comes from the data of the item.
+
+    Args:
+        tree_widget (QTreeWidget): Tree that uses the delegate, also its parent.
+    """
+    def __init__(self, tree_widget: QTreeWidget):
+        super().__init__(tree_widget)
+        self.tree_widget = tree_widget
+
+    def initStyleOption(self, option: QStyleOptionViewItem, index: QtCore.QModelIndex):
+        super().initStyleOption(option, index)
+
+        item = self.tree_widget.itemFromIndex(index)
+        if type(item) is not UiProfileItem:
+            return
+
+        option.backgroundBrush, foreground = ProfileItemDelegate.item_brushes(item)
+        option.palette.setBrush(QtGui.QPalette.Text, foreground)
+
+    ##
+    # Static Methods
+    def item_brushes(item: UiProfileItem) -> tuple:
+        """Returns the (background, foreground) brushes for the state of an item.
+
+        Args:
+            item (UiProfileItem): Item to paint.
+        """
+        if item.item_disabled:
+            return brush_b_removed, brush_f_removed
+        if item.toggle_value is None:
+            return brush_b_normal, brush_f_normal
+        if item.toggle_value:
+            return brush_b_enabled, brush_f_normal
+        return brush_b_disabled, brush_f_normal
+    ##
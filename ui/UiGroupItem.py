@@ -0,0 +1,57 @@
+from PySide2.QtCore import Qt
+from PySide2.QtWidgets import QTreeWidgetItem
+
+
+class UiGroupItem(QTreeWidgetItem):
+    """Group of entries inside a category, ex: the field permissions of an object.
+
+    The children are only created when the group is expanded for the first time and the summary
+    is computed on demand, both are handled by the main window.
+
+    Args:
+        group_name (str): Name shown for the group, ex: the object name.
+        model_ids (list): model_ids of the entries in the group.
+
+    Attributes:
+        group_name (str): Name shown for the group.
+        model_ids (list): model_ids of the entries in the group.
+        materialized (bool): The children were created.
+        summary (dict): Cached result of profile_diff.group_summary, None if it's outdated.
+    """
+    def __init__(self, group_name: str, model_ids: list, *args):
+        super().__init__(*args)
+        self.group_name = group_name
+        self.model_ids = model_ids
+        self.materialized = False
+        self.summary = None
+
+        self.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+
+    @property
+    def item_label(self) -> str:
+        if self.summary is None:
+            return f'{self.group_name} ({len(self.model_ids)})'
+
+        toggles = ', '.join(
+            f'{toggle_name}: {count}' for toggle_name, count in self.summary['toggles'].items()
+        )
+        return (
+            f'{self.group_name} ({self.summary["count"]}) -- {toggles} -- '
+            f'A/B differences: {self.summary["differences"]}'
+        )
+
+    def data(self, column: int, role: int):
+        """
+            Overloaded, the label is the display text, the views search and sort by it.
+        """
+        if role == Qt.DisplayRole and column == 0:
+            return self.item_label
+        return super().data(column, role)
+
+    def set_summary(self, summary: dict):
+        self.summary = summary
+        if self.treeWidget() is not None:
+            self.emitDataChanged()
+
+    def __str__(self):
+        return f'<UiGroupItem: {self.item_label}>'
@@ -1,29 +1,13 @@
-from PySide2 import QtGui, QtCore
+from PySide2.QtCore import Qt
 from PySide2.QtWidgets import QTreeWidgetItem
 import models
 
-# Brushes
-brush_f_normal = QtGui.QBrush(QtGui.QColor(255, 255, 255))
-brush_f_normal.setStyle(QtCore.Qt.SolidPattern)
-brush_b_normal = QtGui.QBrush(QtGui.QColor(0, 0, 0))
-brush_b_normal.setStyle(QtCore.Qt.NoBrush)
-
-brush_b_enabled = QtGui.QBrush(QtGui.QColor(0, 69, 0))
-brush_b_enabled.setStyle(QtCore.Qt.SolidPattern)
-
-brush_b_disabled = QtGui.QBrush(QtGui.QColor(69, 0, 0))
-brush_b_disabled.setStyle(QtCore.Qt.SolidPattern)
-
-brush_b_removed = QtGui.QBrush(QtGui.QColor(71, 71, 71))
-brush_b_removed.setStyle(QtCore.Qt.BDiagPattern)
-brush_f_removed = QtGui.QBrush(QtGui.QColor(170, 170, 170))
-brush_f_removed.setStyle(QtCore.Qt.SolidPattern)
-
 
 class UiProfileItem(QTreeWidgetItem):
     """Profile Field as a QTreeWidgetItem.
 
-    It contains styling to signal its status and a reference to the field type object
+    It contains a reference to the field type object, its label and colors are derived from it
+    when they are asked for (the label by data, the colors by ProfileItemDelegate).
 
     Args:
         model_ref (models.ProfileFieldType): Reference to the field type.
@@ -53,11 +37,21 @@ class UiProfileItem(QTreeWidgetItem):
         if toggle_name is not None:
             self.model_ref.toggles[toggle_name] = toggle_value
 
-        self.__refresh_view()
-
     @property
-    def item_label(self):
-        return self.__item_label
+    def item_label(self) -> str:
+        if self.toggle_name is not None:
+            return f'{self.id} -- {self.toggle_name}: {self.toggle_value}'
+        elif type(self.model_ref) is models.ProfileSingleValue:
+            return f'{self.id} -- {self.model_ref.value}'
+        return self.id
+
+    def data(self, column: int, role: int):
+        """
+            Overloaded, the label is the display text, the views search and sort by it.
+        """
+        if role == Qt.DisplayRole and column == 0:
+            return self.item_label
+        return super().data(column, role)
 
     @property
     def toggle_value(self):
@@ -65,12 +59,7 @@ class UiProfileItem(QTreeWidgetItem):
 
     @toggle_value.setter
     def toggle_value(self, value: bool):
-        if self.toggle_name is not None:
-            setattr(self.model_ref, self.toggle_name, value)
-        elif type(self.model_ref) is models.ProfileSingleValue:
-            self.model_ref.value = value
-
-        self.__toggle_value = value
+        self.__set_toggle_value(value)
         self.__refresh_view()
 
     @property
@@ -83,32 +72,36 @@ class UiProfileItem(QTreeWidgetItem):
 
         self.__refresh_view()
 
-    def __refresh_view(self):
-        """
-            Refreshes the styling and the label for the item.
+    def set_state(self, toggle_value=None, disabled=False, refresh=True):
+        """Sets the toggle value and the disabled state at once.
+
+        Args:
+            toggle_value (bool): (Optional) New toggle value, None keeps the current one.
+            disabled (bool): (default=False) Ignore the object at merge.
+            refresh (bool): (default=True) Repaint the item, bulk changes pass False and update
+                the view once when they finish.
         """
+        if toggle_value is not None:
+            self.__set_toggle_value(toggle_value)
+        self.model_ref.model_disabled = disabled
+
+        if refresh:
+            self.__refresh_view()
+
+    def __set_toggle_value(self, value: bool):
         if self.toggle_name is not None:
-            self.__item_label = f'{self.id} -- {self.toggle_name}: {self.toggle_value}'
+            setattr(self.model_ref, self.toggle_name, value)
         elif type(self.model_ref) is models.ProfileSingleValue:
-            self.__item_label = f'{self.id} -- {self.model_ref.value}'
-        else:
-            self.__item_label = self.id
-
-        self.setText(0, self.__item_label)
-
-        if self.toggle_value is not None:
-            if self.toggle_value:
-                self.setBackground(0, brush_b_enabled)
-            else:
-                self.setBackground(0, brush_b_disabled)
-
-        if self.item_disabled:
-            self.setBackground(0, brush_b_removed)
-            self.setForeground(0, brush_f_removed)
-        else:
-            self.setForeground(0, brush_f_normal)
-            if self.toggle_value is None:
-                self.setBackground(0, brush_b_normal)
+            self.model_ref.value = value
+
+        self.__toggle_value = value
+
+    def __refresh_view(self):
+        """
+            Tells the view to paint the item again.
+        """
+        if self.treeWidget() is not None:
+            self.emitDataChanged()
 
     def __str__(self):
-        return f'<UiProfileItem: {self.text()}>'
+        return f'<UiProfileItem: {self.item_label}>'
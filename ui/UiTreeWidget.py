@@ -1,12 +1,16 @@
-from PySide2.QtWidgets import QTreeWidget
+from PySide2.QtWidgets import QTreeWidget, QTreeWidgetItem
 from PySide2.QtGui import QMouseEvent
-from PySide2.QtCore import Qt
+from PySide2.QtCore import Qt, Signal
 from pprint import pprint
 
 
 class UiTreeWidget(QTreeWidget):
     """Custom QTreeWidget to handle custom events.
+
+    Signals:
+        itemToggled (QTreeWidgetItem): An item value was toggled with the right button.
     """
+    itemToggled = Signal(QTreeWidgetItem)
 
     def __init__(self, *args):
         return super().__init__(*args)
@@ -21,6 +25,7 @@ class UiTreeWidget(QTreeWidget):
             clickedItem = self.itemAt(event.pos())
             if clickedItem:
                 clickedItem.setSelected(False)
-                if clickedItem.toggle_value is not None:
+                # Categories and groups don't have a value
+                if getattr(clickedItem, 'toggle_value', None) is not None:
                     clickedItem.toggle_value = not clickedItem.toggle_value
-
+                    self.itemToggled.emit(clickedItem)
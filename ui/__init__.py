@@ -1,3 +1,6 @@
 from ui.UiProfileItem import UiProfileItem
+from ui.UiGroupItem import UiGroupItem
 from ui.UiTreeWidget import UiTreeWidget
+from ui.ProfileItemDelegate import ProfileItemDelegate
+from ui.ItemRegistry import ItemRegistry
 from ui.MainWindow import Ui_MainWindow
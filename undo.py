@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Undo.
+
+This module has the undo/redo history of the changes made to a merged state.
+
+The history doesn't keep snapshots of the merged dict, every step is a list of operations with
+the key of what changed (model_id and toggle) and its old and new values, so a step takes memory
+in proportion to what it changed. Bulk changes (apply all, rules, strategies) are one step.
+
+Toggle names follow rerere: the toggles of the models, VALUE_TOGGLE for single values and
+DISABLED_TOGGLE for the disabled state. ENTRY_TOGGLE is used when a whole entry was added or
+removed from the merged dict, its values are the models.
+
+Attributes:
+    ENTRY_TOGGLE (str): Toggle name of the presence of an entry.
+    MAX_UNDO_STEPS (int): Steps kept, the oldest are dropped.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import collections
+
+import models
+import utils
+from rerere import VALUE_TOGGLE, DISABLED_TOGGLE
+
+ENTRY_TOGGLE = '*'
+MAX_UNDO_STEPS = 200
+
+
+class Operation:
+    """Change of one value of a merged entry.
+
+    Attributes:
+        model_id (str): Id of the entry.
+        toggle_name (str): Toggle changed, VALUE_TOGGLE, DISABLED_TOGGLE or ENTRY_TOGGLE.
+        old_value: Value before the change.
+        new_value: Value after the change.
+    """
+    __slots__ = ['model_id', 'toggle_name', 'old_value', 'new_value']
+
+    def __init__(self, model_id: str, toggle_name, old_value, new_value):
+        self.model_id = model_id
+        self.toggle_name = toggle_name
+        self.old_value = old_value
+        self.new_value = new_value
+
+    def __str__(self):
+        return (
+            f'<Operation: {self.model_id} {self.toggle_name} '
+            f'{self.old_value} -> {self.new_value}>'
+        )
+
+
+class UndoStep:
+    """Operations undone and redone together.
+
+    Attributes:
+        label (str): What was done, ex: 'Apply Selected'.
+        operations (list): Operations in the order they were done.
+    """
+    __slots__ = ['label', 'operations']
+
+    def __init__(self, label: str, operations: list):
+        self.label = label
+        self.operations = operations
+
+    def __str__(self):
+        return f'<UndoStep: {self.label} {len(self.operations)} operations>'
+
+
+class UndoStack:
+    """Undo/redo history.
+
+    Args:
+        max_steps (int): (default=MAX_UNDO_STEPS) Steps kept.
+
+    Attributes:
+        done (deque): Steps that can be undone, the last one first.
+        undone (list): Steps that can be redone, cleared when a new step is pushed.
+    """
+    def __init__(self, max_steps=MAX_UNDO_STEPS):
+        self.done = collections.deque(maxlen=max(1, max_steps))
+        self.undone = []
+
+    @property
+    def can_undo(self) -> bool:
+        return len(self.done) > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return len(self.undone) > 0
+
+    def push(self, label: str, operations: list):
+        """Adds a step, the operations that didn't change anything are left out.
+
+        Returns:
+            UndoStep: The step added, None if nothing changed.
+        """
+        operations = [
+            operation for operation in operations if operation.old_value != operation.new_value
+        ]
+        if not operations:
+            return None
+        step = UndoStep(label, operations)
+        self.done.append(step)
+        self.undone.clear()
+        return step
+
+    def undo(self):
+        """Returns the step to undo, None if there isn't one.
+        """
+        if not self.done:
+            return None
+        step = self.done.pop()
+        self.undone.append(step)
+        return step
+
+    def redo(self):
+        """Returns the step to redo, None if there isn't one.
+        """
+        if not self.undone:
+            return None
+        step = self.undone.pop()
+        self.done.append(step)
+        return step
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+
+
+def entry_value(model: models.ProfileFieldType, toggle_name):
+    """Returns the current value of a toggle of a merged entry.
+    """
+    if toggle_name == ENTRY_TOGGLE:
+        return model
+    if model is None:
+        return None
+    if toggle_name == DISABLED_TOGGLE:
+        return model.model_disabled
+    if toggle_name == VALUE_TOGGLE and type(model) is models.ProfileSingleValue:
+        return model.value
+    return utils.str_to_bool(model.toggles.get(toggle_name))
+
+
+def diff_operations(old_merged: dict, new_merged: dict, model_ids) -> list:
+    """Returns the operations that turn entries of a merged dict into the ones of another, ex:
+    before and after applying all the values of a profile.
+
+    Args:
+        old_merged (dict): Merged properties before the change.
+        new_merged (dict): Merged properties after the change.
+        model_ids (iterable): Entries that may have changed.
+    """
+    operations = []
+    for model_id in model_ids:
+        old_model = old_merged.get(model_id)
+        new_model = new_merged.get(model_id)
+        if old_model is new_model:
+            continue
+        if old_model is None or new_model is None or old_model.model_name != new_model.model_name:
+            operations.append(Operation(model_id, ENTRY_TOGGLE, old_model, new_model))
+            continue
+
+        if type(new_model) is models.ProfileSingleValue:
+            toggle_names = [VALUE_TOGGLE]
+        else:
+            toggle_names = list(new_model.toggles.keys())
+        for toggle_name in toggle_names + [DISABLED_TOGGLE]:
+            old_value = entry_value(old_model, toggle_name)
+            new_value = entry_value(new_model, toggle_name)
+            if old_value != new_value:
+                operations.append(Operation(model_id, toggle_name, old_value, new_value))
+    return operations
+
+
+def apply_operations(merged: dict, operations: list, undo=True) -> dict:
+    """Sets the old (undo) or new (redo) values of operations on a merged dict. The models are
+    changed in place, a new dict is only built if entries have to be added or removed.
+
+    Returns:
+        dict: The merged dict to use from now on.
+    """
+    operations = list(reversed(operations)) if undo else list(operations)
+    if any(operation.toggle_name == ENTRY_TOGGLE for operation in operations):
+        merged = dict(merged)
+
+    for operation in operations:
+        value = operation.old_value if undo else operation.new_value
+        if operation.toggle_name == ENTRY_TOGGLE:
+            if value is None:
+                merged.pop(operation.model_id, None)
+            else:
+                merged[operation.model_id] = value
+            continue
+
+        model = merged.get(operation.model_id)
+        if model is None:
+            continue
+        if operation.toggle_name == DISABLED_TOGGLE:
+            model.model_disabled = value
+        else:
+            setattr(model, operation.toggle_name, value)
+    return merged
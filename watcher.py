@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Profile Watcher.
+
+This module watches the loaded profile files and signals when they change on disk.
+
+Attributes:
+    DEFAULT_DEBOUNCE_MS (int): Quiet time after the last write before signaling a change.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import os
+
+from PySide2.QtCore import QObject, QFileSystemWatcher, QTimer, Signal
+
+DEFAULT_DEBOUNCE_MS = 500
+
+
+class ProfileWatcher(QObject):
+    """Watches profile files, coalescing bursts of writes into a single signal.
+
+    Args:
+        debounce_ms (int): (default=DEFAULT_DEBOUNCE_MS) Quiet time before signaling.
+
+    [QT] Signals:
+        profileChanged (str, str): from_profile and file path of a changed profile.
+    """
+    profileChanged = Signal(str, str)
+
+    def __init__(self, *args, debounce_ms=DEFAULT_DEBOUNCE_MS):
+        super().__init__(*args)
+        self.debounce_ms = debounce_ms
+        self.paths = {}
+        self.timers = {}
+        self.fs_watcher = QFileSystemWatcher(self)
+        self.fs_watcher.fileChanged.connect(self.file_changed)
+
+    def watch(self, from_profile: str, file_path: str):
+        """Starts watching the file of a profile, replacing its previous file.
+        """
+        self.unwatch(from_profile)
+        if not file_path:
+            return
+
+        self.paths[from_profile] = file_path
+        self.fs_watcher.addPath(file_path)
+
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.setInterval(self.debounce_ms)
+        timer.timeout.connect(lambda: self.emit_change(from_profile))
+        self.timers[from_profile] = timer
+
+    def unwatch(self, from_profile: str):
+        """Stops watching the file of a profile.
+        """
+        file_path = self.paths.pop(from_profile, None)
+        if file_path and file_path not in self.paths.values():
+            self.fs_watcher.removePath(file_path)
+
+        timer = self.timers.pop(from_profile, None)
+        if timer:
+            timer.stop()
+            timer.deleteLater()
+
+    def unwatch_all(self):
+        for from_profile in list(self.paths.keys()):
+            self.unwatch(from_profile)
+
+    def file_changed(self, file_path: str):
+        """Restarts the quiet timer of every profile using the file.
+        """
+        # Editors that save by replacing the file drop it from the watcher
+        if file_path not in self.fs_watcher.files() and os.path.exists(file_path):
+            self.fs_watcher.addPath(file_path)
+
+        for from_profile, path in self.paths.items():
+            if path == file_path:
+                self.timers[from_profile].start()
+
+    def emit_change(self, from_profile: str):
+        file_path = self.paths.get(from_profile)
+        if file_path and os.path.exists(file_path):
+            if file_path not in self.fs_watcher.files():
+                self.fs_watcher.addPath(file_path)
+            self.profileChanged.emit(from_profile, file_path)
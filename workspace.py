@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+""" SF Profile Merger - Workspace.
+
+This module saves an in-progress merge session to a binary file and restores it, so a merge can
+be closed and continued later without parsing the XML files again or redoing the clicks.
+
+A workspace has the inputs (paths, namespaces and parsed models of A and B), the merged models
+with every override made on them (toggle values and disabled entries), the merge direction and
+the merge strategies. The models are pickled together, the strings they share (ids, field names)
+are stored once. Workspaces are pickles, only open the ones you saved.
+
+File layout:
+    WORKSPACE_MAGIC, the format version as one byte and the pickled state.
+
+Attributes:
+    WORKSPACE_MAGIC (bytes): First bytes of a workspace file.
+    WORKSPACE_VERSION (int): Version of the format, files of other versions are refused.
+
+Copyright: Patricio Labin Correa - 2019
+
+@F1r3f0x
+"""
+
+import gc
+import os
+import pickle
+import time
+
+from session import MergeSession, source_stat
+
+WORKSPACE_MAGIC = b'SFPMWS'
+WORKSPACE_VERSION = 1
+
+
+def save_workspace(merge_session: MergeSession, workspace_filepath: str):
+    """Writes a merge session to a workspace file, the pending categories are loaded first.
+
+    Args:
+        merge_session (MergeSession): Session to save.
+        workspace_filepath (str): Output path, it's replaced atomically.
+    """
+    with merge_session.lock:
+        merge_session.load_all()
+        state = {
+            'saved': time.time(),
+            'inputs': [
+                (profile_input.from_profile, profile_input.file_path, profile_input.namespace,
+                 profile_input.properties, source_stat(profile_input.file_path))
+                for profile_input in [merge_session.a, merge_session.b]
+            ],
+            'merged': merge_session.merged,
+            'merge_a_to_b': merge_session.merge_a_to_b,
+            'strategies': dict(merge_session.strategies),
+        }
+        data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    temp_path = f'{workspace_filepath}.tmp'
+    with open(temp_path, 'wb') as file_pointer:
+        file_pointer.write(WORKSPACE_MAGIC)
+        file_pointer.write(bytes([WORKSPACE_VERSION]))
+        file_pointer.write(data)
+    os.replace(temp_path, workspace_filepath)
+
+
+def load_workspace(merge_session: MergeSession, workspace_filepath: str) -> list:
+    """Restores a workspace file into a merge session, replacing its state.
+
+    Args:
+        merge_session (MergeSession): Session to restore into.
+        workspace_filepath (str): Path of the workspace file.
+
+    Returns:
+        list: from_profile of the inputs whose source file changed or is missing since the
+            workspace was saved.
+
+    Raises:
+        ValueError: If the file is not a workspace or was saved with another format version.
+    """
+    with open(workspace_filepath, 'rb') as file_pointer:
+        header = file_pointer.read(len(WORKSPACE_MAGIC) + 1)
+        if header[:len(WORKSPACE_MAGIC)] != WORKSPACE_MAGIC:
+            raise ValueError(f'{workspace_filepath} is not a workspace file')
+        if header[len(WORKSPACE_MAGIC):] != bytes([WORKSPACE_VERSION]):
+            raise ValueError(f'{workspace_filepath} was saved with another workspace version')
+
+        # Unpickling creates many objects at once, collecting in between only slows it down
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            state = pickle.load(file_pointer)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    stale_inputs = []
+    with merge_session.lock:
+        for from_profile, file_path, namespace, properties, stat in state['inputs']:
+            merge_session.set_input(from_profile, file_path, namespace, properties, stat=stat)
+            if file_path and source_stat(file_path) != stat:
+                stale_inputs.append(from_profile)
+        merge_session.merged = state['merged']
+        merge_session.merge_a_to_b = state['merge_a_to_b']
+        merge_session.strategies = state['strategies']
+    return stale_inputs